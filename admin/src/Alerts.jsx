@@ -1,27 +1,13 @@
 // admin/src/Alerts.jsx
-import { useState, useEffect } from 'react';
-
-function Alerts() {
-  const [alerts, setAlerts] = useState([]);
-
-  const fetchAlerts = () => {
-    fetch('http://127.0.0.1:8000/api/alerts/unread')
-      .then(res => res.json())
-      .then(data => setAlerts(Array.isArray(data) ? data : []));
-  };
-
-  useEffect(() => {
-    fetchAlerts();
-    const interval = setInterval(fetchAlerts, 30000); // Revisa cada 30 segundos
-    return () => clearInterval(interval);
-  }, []);
 
+// Las alertas no leídas llegan en el payload de /api/dashboard (ver Dashboard.jsx)
+function Alerts({ alerts, onChange }) {
   const handleMarkAsRead = async (alertId) => {
     await fetch(`http://127.0.0.1:8000/api/alerts/${alertId}/read`, { method: 'PUT' });
-    fetchAlerts(); // Recarga las alertas
+    onChange(); // Recarga el panel
   };
 
-  if (alerts.length === 0) return null; // No muestra nada si no hay alertas
+  if (!Array.isArray(alerts) || alerts.length === 0) return null; // No muestra nada si no hay alertas
 
   return (
     <div className="alerts-container">
@@ -34,4 +20,4 @@ function Alerts() {
     </div>
   );
 }
-export default Alerts;
\ No newline at end of file
+export default Alerts;
@@ -3,8 +3,26 @@ import { useState, useEffect } from 'react';
 
 function CustomerDetail({ customer, onBack }) {
   const [history, setHistory] = useState([]);
+  const [nextPage, setNextPage] = useState(null); // cursor de la siguiente página del historial
+  const [stats, setStats] = useState(null);
   const [tags, setTags] = useState([]); // estado para etiquetas
 
+  // El historial llega por páginas, de la visita más reciente hacia atrás
+  const fetchHistory = (page = null) => {
+    const params = new URLSearchParams({ limit: 20 });
+    if (page) {
+      params.set('before_created_at', page.before_created_at);
+      params.set('before_order_id', page.before_order_id);
+    }
+    fetch(`http://127.0.0.1:8000/api/customers/${customer.customer_id}/history?${params}`)
+      .then(res => res.json())
+      .then(data => {
+        const orders = Array.isArray(data.orders) ? data.orders : [];
+        setHistory(prev => (page ? [...prev, ...orders] : orders));
+        setNextPage(data.next || null);
+      });
+  };
+
   const fetchTags = () => {
     fetch(`http://127.0.0.1:8000/api/customers/${customer.customer_id}/tags`)
       .then(res => res.json())
@@ -12,10 +30,11 @@ function CustomerDetail({ customer, onBack }) {
   };
 
   useEffect(() => {
-    // Cargar historial y etiquetas
-    fetch(`http://127.0.0.1:8000/api/customers/${customer.customer_id}/history`)
+    // Cargar métricas, historial y etiquetas
+    fetch(`http://127.0.0.1:8000/api/customers/${customer.customer_id}/stats`)
       .then(res => res.json())
-      .then(data => setHistory(Array.isArray(data) ? data : []));
+      .then(data => setStats(data && data.customer_id ? data : null));
+    fetchHistory();
     fetchTags();
   }, [customer.customer_id]);
 
@@ -41,6 +60,18 @@ function CustomerDetail({ customer, onBack }) {
       <p><strong>Teléfono:</strong> {customer.phone}</p>
       <p><strong>Email:</strong> {customer.email}</p>
 
+      {/* --- Métricas de por vida --- */}
+      {stats && stats.visits > 0 && (
+        <div className="customer-stats" style={{ marginTop: '1rem' }}>
+          <p><strong>Visitas:</strong> {stats.visits} (desde {new Date(stats.first_visit).toLocaleDateString("es-MX")})</p>
+          <p><strong>Última visita:</strong> {new Date(stats.last_visit).toLocaleDateString("es-MX")}</p>
+          <p><strong>Gasto total:</strong> ${Number(stats.total_spent).toFixed(2)} · <strong>Ticket promedio:</strong> ${Number(stats.average_ticket).toFixed(2)}</p>
+          {stats.favourite_products.length > 0 && (
+            <p><strong>Favoritos:</strong> {stats.favourite_products.map(p => p.name).join(', ')}</p>
+          )}
+        </div>
+      )}
+
       {/* --- Módulo de Etiquetas --- */}
       <div className="tags-section" style={{ marginTop: '1rem' }}>
         <h3>Etiquetas</h3>
@@ -83,6 +114,9 @@ function CustomerDetail({ customer, onBack }) {
       ) : (
         <p>No hay historial disponible</p>
       )}
+      {nextPage && (
+        <button onClick={() => fetchHistory(nextPage)} style={{ marginTop: '0.5rem' }}>Ver más</button>
+      )}
     </div>
   );
 }
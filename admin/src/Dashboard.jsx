@@ -38,6 +38,7 @@ function Dashboard({ user, onLogout, isTraining, onToggleTraining }) {
   const [activeOrder, setActiveOrder] = useState(null);
   const [selectedPoId, setSelectedPoId] = useState(null);
   const [openOrders, setOpenOrders] = useState([]);
+  const [dashboardData, setDashboardData] = useState({ widgets: {}, stale: [], errors: {} });
 
   // Función para recargar órdenes activas
   const fetchOpenOrders = () => {
@@ -47,8 +48,19 @@ function Dashboard({ user, onLogout, isTraining, onToggleTraining }) {
       .catch(err => console.error("Error cargando órdenes:", err));
   };
 
+  // KPIs, alertas y ocupación llegan juntos en una sola petición
+  const fetchDashboard = () => {
+    fetch('http://127.0.0.1:8000/api/dashboard')
+      .then(res => res.json())
+      .then(data => { if (data && data.widgets) setDashboardData(data); })
+      .catch(err => console.error("Error cargando el panel:", err));
+  };
+
   useEffect(() => {
     fetchOpenOrders();
+    fetchDashboard();
+    const interval = setInterval(fetchDashboard, 30000); // Refresca cada 30 segundos
+    return () => clearInterval(interval);
   }, []);
 
   // Vista de detalle de orden
@@ -86,7 +98,7 @@ function Dashboard({ user, onLogout, isTraining, onToggleTraining }) {
       </div>
 
       {/* KPIs y reloj */}
-      <DashboardKPIs />
+      <DashboardKPIs widgets={dashboardData.widgets} />
       <Clock />
 
       {/* Operaciones */}
@@ -107,7 +119,7 @@ function Dashboard({ user, onLogout, isTraining, onToggleTraining }) {
       <UserManager />
       <AttendanceReport />
       <RecipeManager />
-      <Alerts />
+      <Alerts alerts={dashboardData.widgets.alerts} onChange={fetchDashboard} />
       <MenuManager user={user} />
       <AuditLogViewer />
       <Reports />
@@ -1,38 +1,17 @@
-import { useState, useEffect } from 'react';
-
-function DashboardKPIs() {
-  const [kpis, setKpis] = useState({
-    total_sales: 0,
-    order_count: 0,
-    average_ticket: 0,
-  });
-
-  // Nuevos estados para KPIs adicionales
-  const [reservationsKpi, setReservationsKpi] = useState({ percentage_change: 0 });
-  const [wasteKpi, setWasteKpi] = useState({ percentage_change: 0 });
-
-  useEffect(() => {
-    // KPI de ventas, órdenes y ticket promedio
-    fetch('http://127.0.0.1:8000/api/reports/daily-kpis')
-      .then(res => res.json())
-      .then(data => setKpis(data));
-
-    // KPI de reservaciones
-    fetch('http://127.0.0.1:8000/api/reports/reservations-kpi')
-      .then(res => res.json())
-      .then(data => setReservationsKpi(data));
-
-    // KPI de mermas
-    fetch('http://127.0.0.1:8000/api/reports/waste-kpi')
-      .then(res => res.json())
-      .then(data => setWasteKpi(data));
-  }, []);
+// Recibe los widgets de /api/dashboard desde Dashboard.jsx; un widget que no
+// llegó (null) se muestra con sus valores en cero.
+function DashboardKPIs({ widgets = {} }) {
+  const kpis = widgets['daily-kpis'] || { total_sales: 0, order_count: 0, average_ticket: 0 };
+  const reservationsKpi = widgets['reservations-kpi'] || { percentage_change: 0 };
+  const wasteKpi = widgets['waste-kpi'] || { percentage_change: 0 };
+  const occupancy = widgets.occupancy || { occupancy_percentage: 0, occupied_tables: 0, total_tables: 0 };
+  const topProduct = (widgets['top-products'] || [])[0];
 
   return (
     <div className="kpi-container">
       <div className="kpi-card">
         <h3>Ventas Totales del Día</h3>
-        <span>${kpis.total_sales.toFixed(2)}</span>
+        <span>${Number(kpis.total_sales).toFixed(2)}</span>
       </div>
       <div className="kpi-card">
         <h3>Nº de Órdenes</h3>
@@ -40,7 +19,7 @@ function DashboardKPIs() {
       </div>
       <div className="kpi-card">
         <h3>Ticket Promedio</h3>
-        <span>${kpis.average_ticket.toFixed(2)}</span>
+        <span>${Number(kpis.average_ticket).toFixed(2)}</span>
       </div>
 
       {/* KPI de Reservaciones */}
@@ -58,6 +37,18 @@ function DashboardKPIs() {
           {wasteKpi.percentage_change.toFixed(1)}%
         </span>
       </div>
+
+      {/* Ocupación actual */}
+      <div className="kpi-card">
+        <h3>Ocupación</h3>
+        <span>{occupancy.occupancy_percentage}% ({occupancy.occupied_tables}/{occupancy.total_tables})</span>
+      </div>
+
+      {/* Producto más vendido */}
+      <div className="kpi-card">
+        <h3>Más Vendido</h3>
+        <span>{topProduct ? topProduct.name : '—'}</span>
+      </div>
     </div>
   );
 }
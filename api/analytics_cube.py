@@ -0,0 +1,472 @@
+# api/analytics_cube.py
+"""
+Motor analítico columnar en memoria.
+
+Las líneas de órdenes pagadas se cargan una vez en arreglos de NumPy (una
+columna por campo, con los textos codificados como enteros) y después solo se
+agregan las órdenes que se cierran. Cada pregunta (ventas por hora × producto,
+por mesero, por mesa, por promoción, por método de pago...) se resuelve en
+GET /api/analytics/cube con filtros por máscara y agrupaciones con
+np.unique/np.bincount, sin escribir SQL nuevo ni recorrer filas en Python.
+
+Frescura:
+  * Cada ANALYTICS_REFRESH_SECONDS (y a lo más así de seguido desde las
+    peticiones) se agregan las órdenes cerradas desde la última carga; se
+    relee una ventana de REFRESH_OVERLAP_SECONDS para no perder órdenes que se
+    confirmaron tarde con la misma hora de cierre, y se descartan las que ya
+    estaban cargadas.
+  * Cancelar una línea de una orden ya pagada (de cualquier día) llama a
+    note_correction(), que anota su detail_id en `analytics_corrections` en la
+    misma transacción. En cada actualización, cada worker lee las
+    correcciones nuevas y desactiva esas líneas en sus columnas, sin recargar
+    nada; las correcciones se depuran después de CORRECTIONS_RETENTION_HOURS.
+  * La reconstrucción de los resúmenes de ventas (después de corregir órdenes
+    a mano) llama a note_reload(), que incrementa la versión 'analytics:sales'
+    de cache_versions; al verla cambiar, el cubo se recarga completo.
+"""
+import os
+import time
+import datetime
+import threading
+
+import numpy as np
+
+import cache_versions
+from query_metrics import get_registry
+
+ANALYTICS_REFRESH_SECONDS = float(os.getenv("ANALYTICS_REFRESH_SECONDS", "60"))
+ANALYTICS_LOAD_BATCH = int(os.getenv("ANALYTICS_LOAD_BATCH", "50000"))
+REFRESH_OVERLAP_SECONDS = 120
+CORRECTIONS_RETENTION_HOURS = int(os.getenv("ANALYTICS_CORRECTIONS_RETENTION_HOURS", "24"))
+RELOAD_VERSION = "analytics:sales"
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS analytics_corrections (
+        correction_id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        detail_id INT NOT NULL,
+        created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        KEY idx_analytics_corrections_created (created_at)
+    )
+"""
+
+CORRECTIONS_QUERY = """
+    SELECT correction_id, detail_id FROM analytics_corrections
+    WHERE correction_id > %s ORDER BY correction_id
+"""
+
+LINES_QUERY = """
+    SELECT od.order_id, od.detail_id, o.closed_at, od.product_id, o.user_id, o.table_id, o.customer_id,
+           (SELECT MIN(p.payment_method) FROM payments p WHERE p.order_id = o.order_id) AS payment_method,
+           od.quantity, od.quantity * od.price_at_time_of_order AS revenue
+    FROM orders o
+    JOIN order_details od ON od.order_id = o.order_id
+    WHERE o.status = 'Pagada' AND o.closed_at >= %s
+    ORDER BY o.closed_at
+"""
+
+PROMOTIONS_QUERY = """
+    SELECT ap.order_id, MIN(ap.promotion_id)
+    FROM applied_promotions ap
+    JOIN orders o ON o.order_id = ap.order_id
+    WHERE o.status = 'Pagada' AND o.closed_at >= %s
+    GROUP BY ap.order_id
+"""
+
+LOOKUP_QUERIES = {
+    "products": "SELECT product_id, name, category_id, station FROM products",
+    "categories": "SELECT category_id, name FROM menu_categories",
+    "users": "SELECT user_id, full_name FROM users",
+    "tables": "SELECT table_id, table_name FROM restaurant_tables",
+    "customers": "SELECT customer_id, full_name FROM customers",
+    "promotions": "SELECT promotion_id, name FROM promotions",
+}
+
+COLUMNS = {
+    "order_id": np.int64,
+    "detail_id": np.int64,
+    "active": np.bool_,     # False = línea cancelada después de cargarse
+    "day": np.int32,        # días desde 1970-01-01 (fecha de cierre)
+    "hour": np.int8,
+    "product": np.int32,
+    "waiter": np.int32,     # -1 = sin dato
+    "table": np.int32,
+    "customer": np.int32,
+    "promotion": np.int32,
+    "payment_method": np.int16,
+    "units": np.float64,
+    "revenue": np.float64,
+}
+
+# Dimensión -> tabla de nombres (None = la etiqueta es el valor mismo)
+DIMENSIONS = {
+    "date": None, "month": None, "hour": None, "weekday": None,
+    "product": "products", "category": "categories", "station": None,
+    "waiter": "users", "table": "tables", "customer": "customers",
+    "promotion": "promotions", "payment_method": None,
+}
+MEASURES = ("units", "revenue", "lines", "orders", "avg_ticket")
+WEEKDAYS = ("Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo")
+_EPOCH = datetime.date(1970, 1, 1)
+
+
+class CubeQueryError(ValueError):
+    """ Dimensión, medida o filtro inválido en una consulta del cubo. """
+
+
+def _day_number(value):
+    if isinstance(value, str):
+        value = datetime.date.fromisoformat(value)
+    return (value - _EPOCH).days
+
+
+def _lookup(table, product_ids):
+    """ table[product_id] por posición; -1 para productos que ya no existen. """
+    out = np.full(len(product_ids), -1, dtype=table.dtype)
+    valid = product_ids < len(table)
+    out[valid] = table[product_ids[valid]]
+    return out
+
+
+class _Columns:
+    """ Columnas que crecen al doble cuando se llenan; las vistas viejas siguen siendo válidas. """
+
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.data = {name: np.empty(capacity, dtype) for name, dtype in COLUMNS.items()}
+
+    def append(self, chunk):
+        n = len(chunk["order_id"])
+        capacity = len(self.data["order_id"])
+        if self.size + n > capacity:
+            capacity = max(capacity * 2, self.size + n)
+            for name, column in self.data.items():
+                grown = np.empty(capacity, column.dtype)
+                grown[:self.size] = column[:self.size]
+                self.data[name] = grown
+        for name, values in chunk.items():
+            self.data[name][self.size:self.size + n] = values
+        self.size += n
+
+    def view(self):
+        return {name: column[:self.size] for name, column in self.data.items()}
+
+    def nbytes(self):
+        return sum(column.nbytes for column in self.data.values())
+
+
+class AnalyticsCube:
+
+    def __init__(self, refresh_seconds=ANALYTICS_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._columns = _Columns()
+        self._labels = {name: {} for name in LOOKUP_QUERIES}
+        self._product_category = np.full(1, -1, np.int32)
+        self._product_station = np.full(1, -1, np.int16)
+        self._codes = {"payment_method": [], "station": []}
+        self._watermark = None       # closed_at más reciente cargado
+        self._recent_orders = {}     # order_id -> closed_at dentro de la ventana de traslape
+        self._version = None
+        self._correction_id = 0      # última corrección de analytics_corrections aplicada
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self.full_loads = 0
+        self.incremental_loads = 0
+        self.corrections = 0
+
+    # --- Carga ---
+    def _code(self, kind, value):
+        if value is None:
+            return -1
+        codes = self._codes[kind]
+        if value not in codes:
+            codes.append(value)
+        return codes.index(value)
+
+    def _load_lookups(self, cursor):
+        for name, query in LOOKUP_QUERIES.items():
+            cursor.execute(query)
+            rows = cursor.fetchall()
+            if name == "products":
+                size = max((row[0] for row in rows), default=0) + 1
+                category = np.full(size, -1, np.int32)
+                station = np.full(size, -1, np.int16)
+                for product_id, _, category_id, station_name in rows:
+                    category[product_id] = category_id if category_id is not None else -1
+                    station[product_id] = self._code("station", station_name)
+                self._product_category, self._product_station = category, station
+            self._labels[name] = {row[0]: row[1] for row in rows}
+
+    def _load_promotions(self, cursor, since):
+        try:
+            cursor.execute(PROMOTIONS_QUERY, (since,))
+            return dict(cursor.fetchall())
+        except Exception as e:
+            print(f"Cubo analítico sin promociones: {e}")
+            return {}
+
+    def _load_lines(self, cursor, columns, since, skip):
+        """ Agrega a `columns` las líneas cerradas desde `since`, omitiendo las órdenes en `skip`. """
+        promotions = self._load_promotions(cursor, since)
+        cursor.execute(LINES_QUERY, (since,))
+        loaded = 0
+        while True:
+            rows = cursor.fetchmany(ANALYTICS_LOAD_BATCH)
+            if not rows:
+                break
+            rows = [row for row in rows if row[0] not in skip]
+            if not rows:
+                continue
+            (order_ids, detail_ids, closed, products, waiters, tables, customers,
+             methods, quantities, revenues) = zip(*rows)
+            columns.append({
+                "order_id": order_ids,
+                "detail_id": detail_ids,
+                "active": True,
+                "day": [(c.date() - _EPOCH).days for c in closed],
+                "hour": [c.hour for c in closed],
+                "product": products,
+                "waiter": [-1 if v is None else v for v in waiters],
+                "table": [-1 if v is None else v for v in tables],
+                "customer": [-1 if v is None else v for v in customers],
+                "promotion": [promotions.get(order_id, -1) for order_id in order_ids],
+                "payment_method": [self._code("payment_method", m) for m in methods],
+                "units": [float(q) for q in quantities],
+                "revenue": [float(r or 0) for r in revenues],
+            })
+            for order_id, closed_at in zip(order_ids, closed):
+                self._recent_orders[order_id] = closed_at
+                if self._watermark is None or closed_at > self._watermark:
+                    self._watermark = closed_at
+            loaded += len(rows)
+        if self._watermark is not None:
+            horizon = self._watermark - datetime.timedelta(seconds=REFRESH_OVERLAP_SECONDS)
+            self._recent_orders = {o: c for o, c in self._recent_orders.items() if c >= horizon}
+        return loaded
+
+    def _apply_corrections(self, cursor):
+        """ Desactiva las líneas canceladas desde la última corrección aplicada. """
+        cursor.execute(CORRECTIONS_QUERY, (self._correction_id,))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        self._correction_id = rows[-1][0]
+        cols = self._columns.view()
+        # Una línea que ya no se cargó (se canceló antes) simplemente no aparece
+        hit = np.isin(cols["detail_id"], [detail_id for _, detail_id in rows])
+        cols["active"][hit] = False
+        self.corrections += int(hit.sum())
+
+    def refresh(self, cursor, force=False):
+        """
+        Pone el cubo al día (cursor síncrono de tuplas). Carga completa la
+        primera vez, si cambió la versión de recarga o si este worker lleva más
+        de la retención de correcciones sin actualizar; si no, solo lo nuevo y
+        las cancelaciones.
+        """
+        if not force and time.monotonic() - self._refreshed_at < self.refresh_seconds:
+            return False
+        with self._lock:
+            if not force and time.monotonic() - self._refreshed_at < self.refresh_seconds:
+                return False
+            cursor.execute(cache_versions.VERSION_QUERY, (RELOAD_VERSION,))
+            version = cache_versions.version_from_row(cursor.fetchone())
+            self._load_lookups(cursor)
+            missed_corrections = time.monotonic() - self._refreshed_at > CORRECTIONS_RETENTION_HOURS * 3600
+            if force or version != self._version or self._watermark is None or missed_corrections:
+                # Las correcciones anteriores a la carga ya no tienen sus líneas
+                cursor.execute("SELECT COALESCE(MAX(correction_id), 0) FROM analytics_corrections")
+                self._correction_id = cursor.fetchone()[0]
+                columns = _Columns()
+                self._watermark, self._recent_orders = None, {}
+                self._load_lines(cursor, columns, datetime.datetime(1970, 1, 2), set())
+                self._columns = columns
+                self._version = version
+                self.full_loads += 1
+            else:
+                since = self._watermark - datetime.timedelta(seconds=REFRESH_OVERLAP_SECONDS)
+                self._load_lines(cursor, self._columns, since, set(self._recent_orders))
+                self.incremental_loads += 1
+            self._apply_corrections(cursor)
+            self._refreshed_at = time.monotonic()
+            return True
+
+    # --- Consultas ---
+    def _dimension(self, name, cols):
+        if name == "date":
+            return cols["day"]
+        if name == "month":
+            return cols["day"].astype("datetime64[D]").astype("datetime64[M]").astype(np.int32)
+        if name == "weekday":
+            # 1970-01-01 fue jueves
+            return (cols["day"] + 3) % 7
+        if name == "category":
+            return _lookup(self._product_category, cols["product"])
+        if name == "station":
+            return _lookup(self._product_station, cols["product"])
+        return cols[name]
+
+    def _encode(self, name, values):
+        """ Valores de un filtro (texto) al código que guarda la columna. """
+        try:
+            if name == "date":
+                return [_day_number(v) for v in values]
+            if name == "month":
+                return [int(np.datetime64(v, "M").astype(np.int32)) for v in values]
+            if name == "weekday":
+                return [WEEKDAYS.index(v) if v in WEEKDAYS else int(v) for v in values]
+            if name in self._codes:
+                return [self._codes[name].index(v) for v in values if v in self._codes[name]]
+            return [int(v) for v in values]
+        except ValueError:
+            raise CubeQueryError(f"Valor inválido para el filtro '{name}': {values}")
+
+    def _label(self, name, code):
+        code = int(code)
+        if name == "date":
+            return str(np.datetime64(code, "D"))
+        if name == "month":
+            return str(np.datetime64(code, "M"))
+        if name == "weekday":
+            return WEEKDAYS[code]
+        if code < 0:
+            return None
+        if name in self._codes:
+            return self._codes[name][code]
+        if DIMENSIONS[name]:
+            return self._labels[DIMENSIONS[name]].get(code)
+        return code
+
+    def query(self, dimensions=(), measures=("revenue",), filters=None, start_date=None, end_date=None,
+              sort=None, limit=1000):
+        """
+        Agrupa las líneas por `dimensions` y calcula `measures`. `filters` es
+        {dimensión: [valores]}; las fechas limitan por día de cierre.
+        """
+        for name in dimensions:
+            if name not in DIMENSIONS:
+                raise CubeQueryError(f"Dimensión desconocida: {name}. Disponibles: {', '.join(DIMENSIONS)}.")
+        for name in measures:
+            if name not in MEASURES:
+                raise CubeQueryError(f"Medida desconocida: {name}. Disponibles: {', '.join(MEASURES)}.")
+        sort = sort or (f"-{measures[0]}" if measures else None)
+        if sort and sort.lstrip("-") not in list(measures) + list(dimensions):
+            raise CubeQueryError(f"Solo se puede ordenar por una dimensión o medida pedida: {sort}.")
+
+        cols = self._columns.view()
+        mask = cols["active"].copy()
+        if start_date:
+            mask &= cols["day"] >= _day_number(start_date)
+        if end_date:
+            mask &= cols["day"] <= _day_number(end_date)
+        for name, values in (filters or {}).items():
+            if name not in DIMENSIONS:
+                raise CubeQueryError(f"Dimensión desconocida en el filtro: {name}.")
+            mask &= np.isin(self._dimension(name, cols), self._encode(name, values))
+
+        # Llave de grupo: cada dimensión se factoriza y se combinan en un entero
+        if dimensions:
+            uniques, inverses = [], []
+            for name in dimensions:
+                unique, inverse = np.unique(self._dimension(name, cols)[mask], return_inverse=True)
+                uniques.append(unique)
+                inverses.append(inverse)
+            combined = np.ravel_multi_index(inverses, [max(len(u), 1) for u in uniques])
+            keys, group = np.unique(combined, return_inverse=True)
+            positions = np.unravel_index(keys, [max(len(u), 1) for u in uniques])
+        else:
+            keys = np.zeros(1 if mask.any() else 0, dtype=np.int64)
+            group = np.zeros(int(mask.sum()), dtype=np.int64)
+        n_groups = len(keys)
+
+        values = {}
+        if "units" in measures:
+            values["units"] = np.bincount(group, weights=cols["units"][mask], minlength=n_groups)
+        if "revenue" in measures or "avg_ticket" in measures:
+            values["revenue"] = np.bincount(group, weights=cols["revenue"][mask], minlength=n_groups)
+        if "lines" in measures:
+            values["lines"] = np.bincount(group, minlength=n_groups)
+        if "orders" in measures or "avg_ticket" in measures:
+            pairs = np.unique(np.stack([group, cols["order_id"][mask]]), axis=1) if n_groups else np.empty((2, 0), np.int64)
+            values["orders"] = np.bincount(pairs[0], minlength=n_groups)
+        if "avg_ticket" in measures:
+            values["avg_ticket"] = np.divide(values["revenue"], values["orders"],
+                                             out=np.zeros(n_groups), where=values["orders"] > 0)
+
+        order = np.arange(n_groups)
+        if sort and n_groups:
+            key = sort.lstrip("-")
+            if key in values:
+                order = np.argsort(values[key], kind="stable")
+            else:
+                order = np.argsort(uniques[list(dimensions).index(key)][positions[list(dimensions).index(key)]], kind="stable")
+            if sort.startswith("-"):
+                order = order[::-1]
+        order = order[:limit] if limit else order
+
+        rows = []
+        for g in order:
+            row = {}
+            for i, name in enumerate(dimensions):
+                code = uniques[i][positions[i][g]]
+                row[name] = self._label(name, code)
+                if DIMENSIONS[name]:
+                    row[f"{name}_id"] = int(code) if code >= 0 else None
+            for name in measures:
+                value = values[name][g]
+                row[name] = round(float(value), 2) if name in ("revenue", "avg_ticket", "units") else int(value)
+            rows.append(row)
+        return {"groups": int(n_groups), "rows": rows}
+
+    def stats(self):
+        return {
+            "lines": self._columns.size,
+            "bytes": self._columns.nbytes(),
+            "watermark": self._watermark,
+            "full_loads": self.full_loads,
+            "incremental_loads": self.incremental_loads,
+            "corrections": self.corrections,
+        }
+
+
+analytics_cube = AnalyticsCube()
+
+
+def note_correction(cursor, detail_id):
+    """
+    Registra que se canceló una línea de una orden pagada, para que cada worker
+    la quite de su cubo. Llamar en la transacción de la cancelación.
+    """
+    cursor.execute("INSERT INTO analytics_corrections (detail_id) VALUES (%s)", (detail_id,))
+
+
+def note_reload(cursor):
+    """ Pide a todos los workers recargar el cubo completo (p. ej. tras corregir órdenes a mano). """
+    cache_versions.bump(cursor, RELOAD_VERSION)
+
+
+def refresh_analytics_cube():
+    """
+    Tarea programada: agrega al cubo las órdenes cerradas desde la última
+    carga, aplica las cancelaciones y depura las correcciones viejas.
+    """
+    from database import db_connection
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            analytics_cube.refresh(cursor)
+            cursor.execute("DELETE FROM analytics_corrections WHERE created_at < NOW() - INTERVAL %s HOUR",
+                           (CORRECTIONS_RETENTION_HOURS,))
+            conn.commit()
+    except Exception as e:
+        print(f"Error al actualizar el cubo analítico: {e}")
+
+
+def _metrics():
+    stats = analytics_cube.stats()
+    return [
+        ("doppler_analytics_cube_lines", "gauge", "Líneas de venta cargadas en el cubo analítico.", [({}, stats["lines"])]),
+        ("doppler_analytics_cube_bytes", "gauge", "Memoria de las columnas del cubo analítico.", [({}, stats["bytes"])]),
+    ]
+
+
+get_registry().register_collector(_metrics)
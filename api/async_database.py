@@ -0,0 +1,274 @@
+# api/async_database.py
+"""
+Capa de acceso asíncrono a MySQL usando mysql.connector.aio.
+
+Las rutas calientes del POS y del KDS son `async def` y usan este pool para
+no ocupar un hilo del threadpool de Starlette mientras esperan a MySQL; así la
+concurrencia la limita el tamaño del pool y no el número de hilos.
+"""
+import os
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+import mysql.connector
+from mysql.connector import aio
+from dotenv import load_dotenv
+
+from database import PoolTimeoutError
+from query_metrics import AsyncInstrumentedCursor, get_registry
+
+load_dotenv()
+
+ASYNC_POOL_SIZE = int(os.getenv("DB_ASYNC_POOL_SIZE", "10"))
+ASYNC_POOL_MAX_OVERFLOW = int(os.getenv("DB_ASYNC_POOL_MAX_OVERFLOW", "10"))
+ASYNC_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+ASYNC_POOL_RECYCLE = float(os.getenv("DB_POOL_RECYCLE", "1800"))
+ASYNC_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+
+
+async def _connect():
+    """ Abre una conexión asíncrona nueva con las credenciales del .env. """
+    return await aio.connect(
+        host=os.getenv("DB_HOST"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        database=os.getenv("DB_NAME")
+    )
+
+
+class AsyncPooledConnection:
+    """
+    Envoltura de una conexión asíncrona del pool; `await conn.close()` la
+    devuelve al pool en lugar de cerrar el socket.
+    """
+
+    def __init__(self, pool, raw_conn, created_at):
+        self._pool = pool
+        self._conn = raw_conn
+        self._created_at = created_at
+        self._returned = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    async def cursor(self, *args, **kwargs):
+        return AsyncInstrumentedCursor(await self._conn.cursor(*args, **kwargs))
+
+    async def is_connected(self):
+        return not self._returned and await self._conn.is_connected()
+
+    async def close(self):
+        if self._returned:
+            return
+        self._returned = True
+        await self._pool._release(self._conn, self._created_at)
+
+
+class AsyncConnectionPool:
+    """ Equivalente asíncrono de database.ConnectionPool. """
+
+    def __init__(self, size=ASYNC_POOL_SIZE, max_overflow=ASYNC_POOL_MAX_OVERFLOW, timeout=ASYNC_POOL_TIMEOUT,
+                 recycle=ASYNC_POOL_RECYCLE, pre_ping=ASYNC_POOL_PRE_PING, connect=_connect):
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self._connect = connect
+        self._idle = deque()
+        self._open = 0
+        self._in_use = 0
+        self._closed = False
+        self._cond = asyncio.Condition()
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+        self._connects = 0
+        self._recycled = 0
+        self._failed_pings = 0
+
+    async def acquire(self):
+        """ Presta una conexión; espera hasta `timeout` segundos si el pool está lleno. """
+        start = time.monotonic()
+        waited = False
+        async with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeoutError("El pool asíncrono está cerrado.")
+                if self._idle:
+                    raw_conn, created_at = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._open < self.size + self.max_overflow:
+                    self._open += 1
+                    self._in_use += 1
+                    raw_conn, created_at = None, None
+                    break
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(f"No hubo conexiones libres en {self.timeout}s.")
+                waited = True
+                try:
+                    await asyncio.wait_for(self._cond.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+                self._wait_time += time.monotonic() - start
+
+        try:
+            if raw_conn is not None:
+                raw_conn, created_at = await self._validate(raw_conn, created_at)
+            if raw_conn is None:
+                raw_conn = await self._connect()
+                created_at = time.monotonic()
+                self._connects += 1
+        except Exception:
+            async with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return AsyncPooledConnection(self, raw_conn, created_at)
+
+    async def _validate(self, raw_conn, created_at):
+        if self.recycle and time.monotonic() - created_at > self.recycle:
+            self._recycled += 1
+            await self._discard(raw_conn)
+            return None, None
+        if self.pre_ping:
+            try:
+                await raw_conn.ping(reconnect=False)
+            except Exception:
+                self._failed_pings += 1
+                await self._discard(raw_conn)
+                return None, None
+        return raw_conn, created_at
+
+    async def _release(self, raw_conn, created_at):
+        reusable = True
+        try:
+            if raw_conn.in_transaction:
+                await raw_conn.rollback()
+            reusable = await raw_conn.is_connected()
+        except Exception:
+            reusable = False
+
+        async with self._cond:
+            self._in_use -= 1
+            if reusable and not self._closed and self._open <= self.size:
+                self._idle.append((raw_conn, created_at))
+                raw_conn = None
+            else:
+                self._open -= 1
+            self._cond.notify()
+        if raw_conn is not None:
+            await self._discard(raw_conn)
+
+    @staticmethod
+    async def _discard(raw_conn):
+        try:
+            await raw_conn.close()
+        except Exception:
+            pass
+
+    async def close(self):
+        async with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for raw_conn, _ in idle:
+            await self._discard(raw_conn)
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "max_overflow": self.max_overflow,
+            "open": self._open,
+            "in_use": self._in_use,
+            "idle": len(self._idle),
+            "checkouts": self._checkouts,
+            "waits": self._waits,
+            "wait_time_total": round(self._wait_time, 4),
+            "wait_time_avg": round(self._wait_time / self._waits, 4) if self._waits else 0,
+            "timeouts": self._timeouts,
+            "connects": self._connects,
+            "recycled": self._recycled,
+            "failed_pings": self._failed_pings,
+        }
+
+
+# --- Pool asíncrono global ---
+_async_pool = None
+
+
+async def init_async_pool(**kwargs):
+    """ Crea el pool asíncrono dentro del event loop de la API (evento startup). """
+    global _async_pool
+    if _async_pool is None:
+        _async_pool = AsyncConnectionPool(**kwargs)
+    return _async_pool
+
+
+async def close_async_pool():
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+
+
+def get_async_pool_stats():
+    return _async_pool.stats() if _async_pool is not None else None
+
+
+def _async_pool_metrics():
+    stats = get_async_pool_stats()
+    if stats is None:
+        return []
+    return [
+        ("doppler_db_async_pool_in_use", "gauge", "Conexiones prestadas del pool asíncrono.", [({}, stats["in_use"])]),
+        ("doppler_db_async_pool_waits_total", "counter", "Préstamos asíncronos que tuvieron que esperar.", [({}, stats["waits"])]),
+        ("doppler_db_async_pool_wait_seconds_total", "counter", "Tiempo total esperando una conexión asíncrona.", [({}, stats["wait_time_total"])]),
+        ("doppler_db_async_pool_connects_total", "counter", "Conexiones asíncronas físicas abiertas.", [({}, stats["connects"])]),
+    ]
+
+
+get_registry().register_collector(_async_pool_metrics)
+
+
+async def get_async_db_connection():
+    """
+    Versión asíncrona de get_db_connection(). Devuelve None si no hay conexión,
+    igual que la síncrona, para que las rutas respondan con "Error de BBDD.".
+    """
+    try:
+        if _async_pool is not None:
+            return await _async_pool.acquire()
+        return await _connect()
+    except (mysql.connector.Error, PoolTimeoutError) as err:
+        print(f"Error de conexión asíncrona: {err}")
+        return None
+
+
+@asynccontextmanager
+async def async_db_connection():
+    """ Context manager asíncrono: rollback ante excepciones y devolución al pool. """
+    conn = await get_async_db_connection()
+    if not conn:
+        raise ConnectionError("No se pudo obtener una conexión a la BBDD.")
+    try:
+        yield conn
+    except Exception:
+        try:
+            await conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        await conn.close()
@@ -0,0 +1,34 @@
+# api/cache_versions.py
+"""
+Contadores de versión compartidos en la BBDD para las cachés en memoria.
+
+Cada worker de uvicorn tiene su propia copia de las cachés; cuando una
+escritura las invalida incrementa el contador en la misma transacción, y los
+demás workers detectan el cambio comparando la versión que tienen cargada.
+"""
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS cache_versions (
+        cache_name VARCHAR(50) NOT NULL PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0
+    )
+"""
+
+VERSION_QUERY = "SELECT version FROM cache_versions WHERE cache_name = %s"
+
+BUMP_QUERY = """
+    INSERT INTO cache_versions (cache_name, version) VALUES (%s, 1)
+    ON DUPLICATE KEY UPDATE version = version + 1
+"""
+
+
+def bump(cursor, cache_name):
+    """ Incrementa la versión de una caché (usar dentro de la transacción de escritura). """
+    cursor.execute(BUMP_QUERY, (cache_name,))
+
+
+def version_from_row(row):
+    """ Normaliza la fila de VERSION_QUERY (dict, tupla o None) a un entero. """
+    if not row:
+        return 0
+    return int(row['version'] if isinstance(row, dict) else row[0])
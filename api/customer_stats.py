@@ -0,0 +1,258 @@
+# api/customer_stats.py
+"""
+Métricas de por vida de cada cliente para el CRM.
+
+  customer_stats          cliente: primera y última visita, visitas y total pagado.
+  customer_product_stats  cliente × producto: unidades, órdenes y última vez pedido
+                          (de aquí salen los productos favoritos).
+
+Igual que los resúmenes de ventas (sales_rollup.py), se actualizan dentro de la
+transacción de close_order cuando la orden tiene customer_id, así que leerlas
+no requiere agregar orders, payments ni order_details. El ticket promedio se
+calcula al leer (total_spent / visits).
+
+score_rfm() califica a todos los clientes por recencia, frecuencia y monto
+(1 a 5, por quintiles) con numpy, sin recorrerlos uno por uno.
+
+Reconstrucción (después de cargar datos históricos o corregir órdenes a mano):
+    python customer_stats.py rebuild
+"""
+import datetime
+
+import numpy as np
+
+CREATE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS customer_stats (
+        customer_id INT NOT NULL PRIMARY KEY,
+        first_visit DATETIME NOT NULL,
+        last_visit DATETIME NOT NULL,
+        visits INT NOT NULL DEFAULT 0,
+        total_spent DECIMAL(14,2) NOT NULL DEFAULT 0,
+        KEY idx_customer_stats_total (total_spent)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS customer_product_stats (
+        customer_id INT NOT NULL,
+        product_id INT NOT NULL,
+        units DECIMAL(14,3) NOT NULL DEFAULT 0,
+        order_count INT NOT NULL DEFAULT 0,
+        last_ordered DATETIME NULL,
+        PRIMARY KEY (customer_id, product_id)
+    )
+    """,
+]
+
+# --- Actualización incremental ---
+
+CUSTOMER_STATS_UPSERT = """
+    INSERT INTO customer_stats (customer_id, first_visit, last_visit, visits, total_spent)
+    SELECT o.customer_id, p.payment_timestamp, p.payment_timestamp, 1, p.amount
+    FROM payments p JOIN orders o ON p.order_id = o.order_id
+    WHERE p.payment_id = %s AND o.customer_id IS NOT NULL
+    ON DUPLICATE KEY UPDATE
+        first_visit = LEAST(first_visit, VALUES(first_visit)),
+        last_visit = GREATEST(last_visit, VALUES(last_visit)),
+        visits = visits + 1,
+        total_spent = total_spent + VALUES(total_spent)
+"""
+
+CUSTOMER_PRODUCTS_UPSERT = """
+    INSERT INTO customer_product_stats (customer_id, product_id, units, order_count, last_ordered)
+    SELECT o.customer_id, od.product_id, SUM(od.quantity), 1, o.closed_at
+    FROM orders o JOIN order_details od ON od.order_id = o.order_id
+    WHERE o.order_id = %s AND o.customer_id IS NOT NULL
+    GROUP BY od.product_id
+    ON DUPLICATE KEY UPDATE
+        units = units + VALUES(units),
+        order_count = order_count + 1,
+        last_ordered = GREATEST(COALESCE(last_ordered, VALUES(last_ordered)), VALUES(last_ordered))
+"""
+
+CANCELLED_LINE_UPDATE = """
+    UPDATE customer_product_stats SET units = units - %s
+    WHERE customer_id = %s AND product_id = %s
+"""
+
+
+async def record_order_close(cursor, order_id, payment_id):
+    """
+    Suma la orden recién pagada a las métricas de su cliente (si tiene). Llamar
+    en la transacción de close_order, junto a sales_rollup.record_order_close.
+    """
+    await cursor.execute(CUSTOMER_STATS_UPSERT, (payment_id,))
+    await cursor.execute(CUSTOMER_PRODUCTS_UPSERT, (order_id,))
+
+
+def record_cancelled_line(cursor, item):
+    """
+    Resta las unidades de una línea cancelada de una orden ya pagada. `item`
+    trae product_id, quantity, order_status y customer_id. El total pagado no
+    cambia: el pago ya se registró.
+    """
+    if item.get('order_status') != 'Pagada' or not item.get('customer_id'):
+        return
+    cursor.execute(CANCELLED_LINE_UPDATE, (item['quantity'], item['customer_id'], item['product_id']))
+
+
+def forget_customer(cursor, customer_id):
+    """ Borra las métricas de un cliente eliminado. """
+    cursor.execute("DELETE FROM customer_stats WHERE customer_id = %s", (customer_id,))
+    cursor.execute("DELETE FROM customer_product_stats WHERE customer_id = %s", (customer_id,))
+
+
+# --- Reconstrucción ---
+
+# Se reconstruye por rangos de customer_id: cada lote borra y recalcula a sus
+# clientes en una transacción corta.
+REBUILD_BATCH_CUSTOMERS = 1000
+
+REBUILD_STATEMENTS = [
+    ("DELETE FROM customer_stats WHERE customer_id BETWEEN %s AND %s", """
+    INSERT INTO customer_stats (customer_id, first_visit, last_visit, visits, total_spent)
+    SELECT o.customer_id, MIN(p.payment_timestamp), MAX(p.payment_timestamp), COUNT(*), SUM(p.amount)
+    FROM payments p JOIN orders o ON p.order_id = o.order_id
+    WHERE o.status = 'Pagada' AND o.customer_id BETWEEN %s AND %s
+    GROUP BY o.customer_id
+    """),
+    ("DELETE FROM customer_product_stats WHERE customer_id BETWEEN %s AND %s", """
+    INSERT INTO customer_product_stats (customer_id, product_id, units, order_count, last_ordered)
+    SELECT o.customer_id, od.product_id, SUM(od.quantity), COUNT(DISTINCT o.order_id), MAX(o.closed_at)
+    FROM orders o JOIN order_details od ON od.order_id = o.order_id
+    WHERE o.status = 'Pagada' AND o.customer_id BETWEEN %s AND %s
+    GROUP BY o.customer_id, od.product_id
+    """),
+]
+
+
+def _customer_ranges(cursor, batch=REBUILD_BATCH_CUSTOMERS):
+    """ Parte los customer_id con órdenes en rangos de `batch` ids. """
+    cursor.execute("SELECT MIN(customer_id), MAX(customer_id) FROM orders WHERE customer_id IS NOT NULL")
+    first, last = cursor.fetchone()
+    if first is None:
+        return
+    for start in range(first, last + 1, batch):
+        yield start, min(last, start + batch - 1)
+
+
+def rebuild(conn):
+    """ Recalcula las métricas de todos los clientes desde las tablas crudas, un lote por transacción. """
+    cursor = conn.cursor()
+    for table in CREATE_TABLES:
+        cursor.execute(table)
+    ranges = list(_customer_ranges(cursor))
+    # Métricas de clientes fuera de todos los rangos (ya sin órdenes)
+    first, last = (ranges[0][0], ranges[-1][1]) if ranges else (0, -1)
+    for table in ("customer_stats", "customer_product_stats"):
+        cursor.execute(f"DELETE FROM {table} WHERE customer_id < %s OR customer_id > %s", (first, last))
+    conn.commit()
+    for start, end in ranges:
+        for delete, insert in REBUILD_STATEMENTS:
+            cursor.execute(delete, (start, end))
+            cursor.execute(insert, (start, end))
+        conn.commit()
+    cursor.execute("SELECT COUNT(*) FROM customer_stats")
+    print(f"Métricas de clientes reconstruidas: {cursor.fetchone()[0]} clientes")
+
+
+# --- Lectura ---
+
+STATS_QUERY = """
+    SELECT c.customer_id, c.full_name, s.first_visit, s.last_visit, s.visits, s.total_spent
+    FROM customers c
+    LEFT JOIN customer_stats s ON s.customer_id = c.customer_id
+    WHERE c.customer_id = %s
+"""
+
+FAVOURITES_QUERY = """
+    SELECT p.product_id, p.name, cps.units, cps.order_count, cps.last_ordered
+    FROM customer_product_stats cps
+    JOIN products p ON p.product_id = cps.product_id
+    WHERE cps.customer_id = %s AND cps.units > 0
+    ORDER BY cps.units DESC, cps.order_count DESC
+    LIMIT %s
+"""
+
+RFM_QUERY = """
+    SELECT s.customer_id, c.full_name, s.last_visit, s.visits, s.total_spent
+    FROM customer_stats s
+    JOIN customers c ON c.customer_id = s.customer_id
+"""
+
+# Segmentos por puntaje, en orden de prioridad: (nombre, condición sobre r, f, m)
+RFM_SEGMENTS = [
+    ("Campeones", lambda r, f, m: (r >= 4) & (f >= 4) & (m >= 4)),
+    ("Leales", lambda r, f, m: (r >= 3) & (f >= 4)),
+    ("En riesgo", lambda r, f, m: (r <= 2) & (f >= 3)),
+    ("Nuevos", lambda r, f, m: (r >= 4) & (f <= 2)),
+    ("Perdidos", lambda r, f, m: (r <= 2) & (f <= 2)),
+]
+DEFAULT_SEGMENT = "Requieren atención"
+
+
+def _quintile_scores(values, higher_is_better=True):
+    """ Puntaje 1 a 5 por quintiles; valores iguales reciben el mismo puntaje. """
+    edges = np.quantile(values, [0.2, 0.4, 0.6, 0.8])
+    buckets = np.searchsorted(edges, values, side='left')
+    return buckets + 1 if higher_is_better else 5 - buckets
+
+
+def score_rfm(rows, today=None):
+    """
+    Puntajes RFM de `rows` (customer_id, full_name, last_visit, visits,
+    total_spent). Devuelve (umbrales, clientes) con los clientes ordenados por
+    puntaje de mayor a menor.
+    """
+    if not rows:
+        return {}, []
+    today = today or datetime.date.today()
+    last_visit = np.array([r['last_visit'].date() for r in rows], dtype='datetime64[D]')
+    recency = (np.datetime64(today, 'D') - last_visit).astype(np.int64)
+    frequency = np.array([r['visits'] for r in rows], dtype=np.int64)
+    monetary = np.array([float(r['total_spent']) for r in rows], dtype=np.float64)
+
+    r_score = _quintile_scores(recency, higher_is_better=False)
+    f_score = _quintile_scores(frequency)
+    m_score = _quintile_scores(monetary)
+    segment = np.select(
+        [condition(r_score, f_score, m_score) for _, condition in RFM_SEGMENTS],
+        [name for name, _ in RFM_SEGMENTS],
+        default=DEFAULT_SEGMENT,
+    )
+    average_ticket = monetary / np.maximum(frequency, 1)
+
+    thresholds = {
+        "recency_days": np.quantile(recency, [0.2, 0.4, 0.6, 0.8]).round(1).tolist(),
+        "visits": np.quantile(frequency, [0.2, 0.4, 0.6, 0.8]).round(1).tolist(),
+        "total_spent": np.quantile(monetary, [0.2, 0.4, 0.6, 0.8]).round(2).tolist(),
+    }
+    order = np.lexsort((-monetary, -(r_score * 100 + f_score * 10 + m_score)))
+    customers = [
+        {
+            "customer_id": rows[i]['customer_id'],
+            "full_name": rows[i]['full_name'],
+            "recency_days": int(recency[i]),
+            "visits": int(frequency[i]),
+            "total_spent": round(float(monetary[i]), 2),
+            "average_ticket": round(float(average_ticket[i]), 2),
+            "r": int(r_score[i]), "f": int(f_score[i]), "m": int(m_score[i]),
+            "rfm": f"{r_score[i]}{f_score[i]}{m_score[i]}",
+            "segment": str(segment[i]),
+        }
+        for i in order
+    ]
+    return thresholds, customers
+
+
+if __name__ == "__main__":
+    import argparse
+    from database import db_connection
+
+    parser = argparse.ArgumentParser(description="Métricas de por vida de los clientes.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild", help="Recalcula las métricas desde payments y order_details.")
+    parser.parse_args()
+
+    with db_connection() as conn:
+        rebuild(conn)
@@ -0,0 +1,171 @@
+# api/dashboard_widgets.py
+"""
+Panel de control en una sola petición.
+
+Los routers registran sus widgets con register(name, fn, ttl), donde
+fn(cursor) recibe un cursor de diccionario y devuelve los datos del widget.
+GET /api/dashboard los corre a la vez en un pool acotado de hilos
+(DASHBOARD_WORKERS), cada uno con su propia conexión del pool, y arma una
+sola respuesta:
+
+    {"generated_at": ..., "widgets": {nombre: datos}, "stale": [...], "errors": {nombre: mensaje}}
+
+Cada widget se guarda en memoria durante su TTL, y peticiones simultáneas
+del mismo widget comparten el cálculo en curso. Un widget que falla o tarda
+más de su límite no detiene al resto: se responde con su último valor (y su
+nombre en "stale") o, si nunca se ha calculado, con su error. Un cálculo que
+agotó el tiempo sigue en segundo plano y su resultado queda en caché para la
+siguiente petición.
+"""
+import os
+import time
+import asyncio
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.encoders import jsonable_encoder
+
+from database import db_connection
+from query_metrics import get_registry
+
+DASHBOARD_WORKERS = int(os.getenv("DASHBOARD_WORKERS", "6"))
+DASHBOARD_TIMEOUT_SECONDS = float(os.getenv("DASHBOARD_TIMEOUT_SECONDS", "2"))
+
+_widgets = {}  # name -> (fn, ttl, timeout)
+
+
+def register(name, fn, ttl, timeout=None):
+    """ Registra un widget del panel; `ttl` en segundos, `timeout` por defecto DASHBOARD_TIMEOUT_SECONDS. """
+    _widgets[name] = (fn, ttl, timeout or DASHBOARD_TIMEOUT_SECONDS)
+
+
+def widgets():
+    return list(_widgets)
+
+
+class DashboardError(ValueError):
+    """ Widget desconocido. """
+
+
+class Dashboard:
+
+    def __init__(self, workers=DASHBOARD_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._cache = {}     # name -> (calculado_en monotónico, datos)
+        self._inflight = {}  # name -> Future del cálculo en curso
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+        self.failures = 0
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="dashboard")
+        return self._executor
+
+    def _compute(self, name):
+        fn = _widgets[name][0]
+        with db_connection() as conn:
+            value = jsonable_encoder(fn(conn.cursor(dictionary=True)))
+        with self._lock:
+            self._cache[name] = (time.monotonic(), value)
+        return value
+
+    def _done(self, name, future):
+        with self._lock:
+            if self._inflight.get(name) is future:
+                del self._inflight[name]
+
+    def _future(self, name):
+        """ Cálculo en curso del widget, o uno nuevo si no hay. """
+        with self._lock:
+            future = self._inflight.get(name)
+            if future is not None:
+                return future
+            future = self._pool().submit(self._compute, name)
+            self._inflight[name] = future
+        # Fuera del candado: si el cálculo ya terminó (p. ej. falló al pedir la
+        # conexión), add_done_callback llama a _done en este mismo hilo
+        future.add_done_callback(lambda f: self._done(name, f))
+        return future
+
+    async def _widget(self, name):
+        """ (datos, viejo, error) de un widget. """
+        _, ttl, timeout = _widgets[name]
+        with self._lock:
+            cached = self._cache.get(name)
+        if cached and time.monotonic() - cached[0] < ttl:
+            self.hits += 1
+            return cached[1], False, None
+        self.misses += 1
+        try:
+            # shield: agotar el tiempo no cancela el cálculo compartido, que termina y llena la caché
+            value = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(self._future(name))), timeout)
+            return value, False, None
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            error = f"Sin respuesta en {timeout}s."
+        except Exception as e:
+            self.failures += 1
+            print(f"Error en el widget del panel {name}: {e}")
+            error = str(e) or e.__class__.__name__
+        if cached:
+            return cached[1], True, error
+        return None, False, error
+
+    async def bundle(self, names=None):
+        """ Respuesta del panel con los widgets pedidos (todos por defecto). """
+        names = names or widgets()
+        unknown = [n for n in names if n not in _widgets]
+        if unknown:
+            raise DashboardError(f"Widgets desconocidos: {', '.join(unknown)}. Disponibles: {', '.join(widgets())}.")
+        results = await asyncio.gather(*(self._widget(n) for n in names))
+        payload = {"generated_at": datetime.datetime.now(), "widgets": {}, "stale": [], "errors": {}}
+        for name, (value, stale, error) in zip(names, results):
+            payload["widgets"][name] = value
+            if stale:
+                payload["stale"].append(name)
+            if error and not stale:
+                payload["errors"][name] = error
+        return payload
+
+    def invalidate(self, name):
+        """ Descarta el valor en caché de un widget (p. ej. tras marcar una alerta como leída). """
+        with self._lock:
+            self._cache.pop(name, None)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "widgets": widgets(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+        }
+
+
+dashboard = Dashboard()
+
+
+def _metrics():
+    stats = dashboard.stats()
+    return [
+        ("doppler_dashboard_widgets_total", "counter", "Widgets del panel por resultado.", [
+            ({"result": "hit"}, stats["hits"]),
+            ({"result": "miss"}, stats["misses"]),
+            ({"result": "timeout"}, stats["timeouts"]),
+            ({"result": "failure"}, stats["failures"]),
+        ]),
+    ]
+
+
+get_registry().register_collector(_metrics)
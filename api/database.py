@@ -1,19 +1,312 @@
 import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
 import mysql.connector
 from dotenv import load_dotenv
 
+from query_metrics import InstrumentedCursor, get_registry
+
 load_dotenv()
 
+# --- Configuración del pool (se puede ajustar desde el .env) ---
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))              # Conexiones que se mantienen abiertas
+POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "10"))  # Conexiones extra en picos de demanda
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))         # Segundos máximos esperando una conexión
+POOL_RECYCLE = float(os.getenv("DB_POOL_RECYCLE", "1800"))      # Segundos de vida antes de reciclar una conexión
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"      # Verifica la conexión antes de prestarla
+
+
+class PoolTimeoutError(Exception):
+    """ Se lanza cuando no se consigue una conexión dentro de POOL_TIMEOUT. """
+
+
+def _connect():
+    """ Abre una conexión nueva a MySQL con las credenciales del .env. """
+    return mysql.connector.connect(
+        host=os.getenv("DB_HOST"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        database=os.getenv("DB_NAME")
+    )
+
+
+class PooledConnection:
+    """
+    Envoltura de una conexión del pool. Se comporta como la conexión original,
+    pero close() la devuelve al pool en lugar de cerrar el socket, así los
+    routers que usan el patrón get_db_connection()/conn.close() no cambian.
+    """
+
+    def __init__(self, pool, raw_conn, created_at):
+        self._pool = pool
+        self._conn = raw_conn
+        self._created_at = created_at
+        self._returned = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        # Todos los cursores del pool quedan instrumentados (ver query_metrics.py)
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+
+    def is_connected(self):
+        # Una conexión ya devuelta al pool se reporta como cerrada para el router
+        return not self._returned and self._conn.is_connected()
+
+    def close(self):
+        if self._returned:
+            return
+        self._returned = True
+        self._pool._release(self._conn, self._created_at)
+
+
+class ConnectionPool:
+    """
+    Pool de conexiones MySQL con tamaño fijo más desbordamiento, tiempo máximo
+    de espera, verificación al prestar y reciclaje de conexiones viejas.
+    """
+
+    def __init__(self, size=POOL_SIZE, max_overflow=POOL_MAX_OVERFLOW, timeout=POOL_TIMEOUT,
+                 recycle=POOL_RECYCLE, pre_ping=POOL_PRE_PING, connect=_connect):
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self._connect = connect
+        self._idle = deque()      # (conexión, creada_en)
+        self._open = 0            # Conexiones abiertas (prestadas + ociosas)
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        # Métricas
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+        self._connects = 0
+        self._recycled = 0
+        self._failed_pings = 0
+        self._recent_connects = deque()
+        self._started_at = time.monotonic()
+
+    # --- Préstamo y devolución ---
+    def acquire(self):
+        """ Presta una conexión; espera hasta `timeout` segundos si el pool está lleno. """
+        start = time.monotonic()
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeoutError("El pool de conexiones está cerrado.")
+                if self._idle:
+                    raw_conn, created_at = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._open < self.size + self.max_overflow:
+                    # Reservamos el lugar y conectamos fuera del candado
+                    self._open += 1
+                    self._in_use += 1
+                    raw_conn, created_at = None, None
+                    break
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(f"No hubo conexiones libres en {self.timeout}s.")
+                waited = True
+                self._cond.wait(remaining)
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+                self._wait_time += time.monotonic() - start
+
+        try:
+            if raw_conn is not None:
+                raw_conn, created_at = self._validate(raw_conn, created_at)
+            if raw_conn is None:
+                raw_conn, created_at = self._new_connection()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, raw_conn, created_at)
+
+    def _validate(self, raw_conn, created_at):
+        """ Descarta conexiones vencidas o caídas; devuelve (None, None) si hay que abrir otra. """
+        if self.recycle and time.monotonic() - created_at > self.recycle:
+            self._recycled += 1
+            self._discard(raw_conn)
+            return None, None
+        if self.pre_ping:
+            try:
+                raw_conn.ping(reconnect=False)
+            except Exception:
+                self._failed_pings += 1
+                self._discard(raw_conn)
+                return None, None
+        return raw_conn, created_at
+
+    def _new_connection(self):
+        raw_conn = self._connect()
+        now = time.monotonic()
+        with self._cond:
+            self._connects += 1
+            self._recent_connects.append(now)
+        return raw_conn, now
+
+    def _release(self, raw_conn, created_at):
+        """ Regresa la conexión al pool, deshaciendo cualquier transacción abierta. """
+        reusable = True
+        try:
+            if raw_conn.in_transaction:
+                raw_conn.rollback()
+            reusable = raw_conn.is_connected()
+        except Exception:
+            reusable = False
+
+        with self._cond:
+            self._in_use -= 1
+            if reusable and not self._closed and self._open <= self.size:
+                self._idle.append((raw_conn, created_at))
+                raw_conn = None
+            else:
+                self._open -= 1
+            self._cond.notify()
+        if raw_conn is not None:
+            self._discard(raw_conn)
+
+    @staticmethod
+    def _discard(raw_conn):
+        try:
+            raw_conn.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """ Cierra las conexiones ociosas; las prestadas se cierran al devolverse. """
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for raw_conn, _ in idle:
+            self._discard(raw_conn)
+
+    # --- Métricas ---
+    def stats(self):
+        """ Devuelve un resumen del estado del pool para dimensionarlo. """
+        now = time.monotonic()
+        with self._cond:
+            while self._recent_connects and now - self._recent_connects[0] > 60:
+                self._recent_connects.popleft()
+            return {
+                "size": self.size,
+                "max_overflow": self.max_overflow,
+                "open": self._open,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_time_total": round(self._wait_time, 4),
+                "wait_time_avg": round(self._wait_time / self._waits, 4) if self._waits else 0,
+                "timeouts": self._timeouts,
+                "connects": self._connects,
+                "connects_per_sec": round(len(self._recent_connects) / min(60, max(now - self._started_at, 1)), 4),
+                "recycled": self._recycled,
+                "failed_pings": self._failed_pings,
+            }
+
+
+# --- Pool global de la aplicación ---
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def init_pool(**kwargs):
+    """ Crea el pool global. Se llama desde el evento de arranque de main.py. """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(**kwargs)
+    return _pool
+
+
+def close_pool():
+    """ Cierra el pool global al detener la API. """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def get_pool_stats():
+    """ Estadísticas del pool global, o None si no se ha inicializado. """
+    return _pool.stats() if _pool is not None else None
+
+
+def _pool_metrics():
+    stats = get_pool_stats()
+    if stats is None:
+        return []
+    return [
+        ("doppler_db_pool_in_use", "gauge", "Conexiones prestadas del pool.", [({}, stats["in_use"])]),
+        ("doppler_db_pool_idle", "gauge", "Conexiones ociosas del pool.", [({}, stats["idle"])]),
+        ("doppler_db_pool_waits_total", "counter", "Préstamos que tuvieron que esperar.", [({}, stats["waits"])]),
+        ("doppler_db_pool_wait_seconds_total", "counter", "Tiempo total esperando una conexión.", [({}, stats["wait_time_total"])]),
+        ("doppler_db_pool_timeouts_total", "counter", "Préstamos que agotaron el tiempo de espera.", [({}, stats["timeouts"])]),
+        ("doppler_db_pool_connects_total", "counter", "Conexiones físicas abiertas.", [({}, stats["connects"])]),
+    ]
+
+
+get_registry().register_collector(_pool_metrics)
+
+
 # Asegúrate de que esta función exista tal cual
 def get_db_connection():
+    """
+    Devuelve una conexión a la BBDD. Si el pool está activo la conexión se toma
+    del pool y conn.close() la devuelve; fuera de la API (scripts de entrenamiento,
+    tareas sueltas) se abre una conexión directa como antes.
+    """
     try:
-        conn = mysql.connector.connect(
-            host=os.getenv("DB_HOST"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            database=os.getenv("DB_NAME")
-        )
-        return conn
-    except mysql.connector.Error as err:
+        if _pool is not None:
+            return _pool.acquire()
+        return _connect()
+    except (mysql.connector.Error, PoolTimeoutError) as err:
         print(f"Error de conexión: {err}")
-        return None
\ No newline at end of file
+        return None
+
+
+@contextmanager
+def db_connection():
+    """
+    Context manager para usar en lugar del patrón manual de abrir/cerrar:
+
+        with db_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            ...
+            conn.commit()
+
+    Si ocurre una excepción se hace rollback, y al salir la conexión siempre
+    vuelve al pool. Lanza ConnectionError si no se pudo obtener conexión.
+    """
+    conn = get_db_connection()
+    if not conn:
+        raise ConnectionError("No se pudo obtener una conexión a la BBDD.")
+    try:
+        yield conn
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        conn.close()
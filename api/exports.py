@@ -0,0 +1,140 @@
+# api/exports.py
+"""
+Exportación en streaming de los reportes.
+
+Los reportes aceptan `format=` (csv, ndjson, csv.gz o ndjson.gz) y en lugar de
+JSON devuelven un archivo que se genera mientras llegan las filas: la consulta
+corre con un cursor sin buffer (las filas se quedan en el servidor hasta que se
+piden), se leen de EXPORT_BATCH_ROWS en EXPORT_BATCH_ROWS y cada lote se
+codifica (y comprime, si se pidió .gz) y se envía antes de leer el siguiente.
+La memoria usada no depende de cuántos años abarque la exportación.
+
+La conexión queda prestada mientras dura la descarga y vuelve al pool al
+terminar; si el cliente corta la descarga, el pool descarta esa conexión
+porque aún tiene filas sin leer. El primer bloque se genera antes de
+responder, así el generador ya está dentro de su try/finally: aunque la
+descarga nunca empiece (el cliente se fue antes), cerrarlo o descartarlo
+devuelve la conexión. Además una tarea de fondo la cierra al terminar la
+respuesta.
+"""
+import io
+import os
+import itertools
+import csv
+import json
+import zlib
+import decimal
+import datetime
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from database import get_db_connection
+
+EXPORT_FORMATS = ("csv", "ndjson", "csv.gz", "ndjson.gz")
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "1000"))
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def check_format(format):
+    """ Valida el formato antes de abrir la conexión (400 si no se reconoce). """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado. Usa uno de: {', '.join(EXPORT_FORMATS)}.")
+    return format
+
+
+def _json_default(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    return str(value)
+
+
+def encode_rows(rows, columns, base_format, write_header):
+    """ Un lote de filas (diccionarios) como texto CSV o NDJSON. `columns` es [(encabezado, llave)]. """
+    buffer = io.StringIO()
+    if base_format == "csv":
+        writer = csv.writer(buffer)
+        if write_header:
+            writer.writerow([label for label, _ in columns])
+        for row in rows:
+            writer.writerow([row.get(key) for _, key in columns])
+    else:
+        for row in rows:
+            buffer.write(json.dumps({key: row.get(key) for _, key in columns}, default=_json_default, ensure_ascii=False))
+            buffer.write("\n")
+    return buffer.getvalue()
+
+
+def stream_cursor(conn, cursor, columns, format, row_fn=None, batch_rows=EXPORT_BATCH_ROWS):
+    """
+    Generador de bytes con las filas pendientes del cursor. Devuelve la
+    conexión al pool cuando termina (o cuando se cierra el generador).
+    """
+    base_format = format.split(".")[0]
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if format.endswith(".gz") else None
+    try:
+        first = True
+        while True:
+            rows = cursor.fetchmany(batch_rows)
+            if row_fn is not None:
+                rows = [row_fn(row) for row in rows]
+            # El primer lote lleva el encabezado aunque no haya filas
+            chunk = encode_rows(rows, columns, base_format, write_header=first).encode("utf-8")
+            first = False
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+            if not rows:
+                break
+        if compressor is not None:
+            yield compressor.flush()
+    finally:
+        try:
+            cursor.close()
+        except Exception:
+            pass
+        conn.close()
+
+
+def export_response(query, params, columns, format, filename, row_fn=None, prepare=None):
+    """
+    Corre `query` con un cursor sin buffer y devuelve la respuesta en
+    streaming. La consulta y el primer bloque se generan antes de responder
+    para que un error de SQL llegue como 500 y no como un archivo cortado. `row_fn` puede agregar
+    columnas calculadas a cada fila (diccionario) antes de escribirla y
+    `prepare(conn)` corre antes de la consulta (p. ej. para refrescar una caché).
+    """
+    check_format(format)
+    conn = get_db_connection()
+    if not conn:
+        raise HTTPException(status_code=500, detail="Error de BBDD.")
+    try:
+        if prepare is not None:
+            prepare(conn)
+        cursor = conn.cursor(dictionary=True, buffered=False)
+        cursor.execute(query, params)
+        chunks = stream_cursor(conn, cursor, columns, format, row_fn)
+        first = next(chunks)
+    except Exception as e:
+        conn.close()
+        print(f"Error al exportar {filename}: {e}")
+        raise HTTPException(status_code=500, detail="No se pudo generar la exportación.")
+
+    base_format = format.split(".")[0]
+    media_type = "application/gzip" if format.endswith(".gz") else MEDIA_TYPES[base_format]
+    return StreamingResponse(
+        itertools.chain([first], chunks),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}.{format}"},
+        background=BackgroundTask(chunks.close),
+    )
@@ -0,0 +1,222 @@
+# api/folio_allocator.py
+"""
+Asignación de folios de orden sin colisiones.
+
+Antes el folio era ORD-%Y%m%d%H%M%S, así que dos terminales que abrían una orden
+en el mismo segundo obtenían el mismo folio. Ahora cada día de operación tiene
+una secuencia en la tabla `folio_sequences`; cada worker reserva bloques de
+números (FOLIO_BLOCK_SIZE) en una transacción propia y los reparte desde
+memoria, de modo que la mayoría de los folios no requieren ir a la BBDD.
+
+Los bloques son disjuntos entre workers, así que los folios nunca se repiten;
+dentro de un worker son crecientes durante el día de operación. Entre workers
+el orden puede intercalarse (el worker A puede tener 1-50 y el B 51-100).
+
+Benchmark:  python folio_allocator.py bench --n 20000 --threads 8 [--memoria]
+"""
+import os
+import time
+import asyncio
+import datetime
+import threading
+
+FOLIO_BLOCK_SIZE = int(os.getenv("FOLIO_BLOCK_SIZE", "50"))
+# Hora a la que cambia el día de operación (el bar cierra de madrugada, así
+# que una orden a las 2 AM pertenece al día anterior).
+FOLIO_DAY_CUTOFF_HOUR = int(os.getenv("FOLIO_DAY_CUTOFF_HOUR", "6"))
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS folio_sequences (
+        business_day DATE NOT NULL PRIMARY KEY,
+        next_value BIGINT NOT NULL
+    )
+"""
+
+# Inserta la secuencia del día o la avanza un bloque; LAST_INSERT_ID(expr)
+# devuelve el nuevo valor en el mismo viaje, sin SELECT ni candados extra.
+RESERVE_QUERY = """
+    INSERT INTO folio_sequences (business_day, next_value) VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE next_value = LAST_INSERT_ID(next_value + %s)
+"""
+
+
+def business_day(now=None, cutoff_hour=FOLIO_DAY_CUTOFF_HOUR):
+    now = now or datetime.datetime.now()
+    return (now - datetime.timedelta(hours=cutoff_hour)).date()
+
+
+def format_folio(day, number):
+    return f"ORD-{day:%Y%m%d}-{number:05d}"
+
+
+def _block_from_result(rowcount, lastrowid, block_size):
+    """ Traduce el resultado de RESERVE_QUERY a (primero, último) del bloque reservado. """
+    if rowcount == 1:
+        # Primera reserva del día: la fila se insertó con next_value = block_size + 1
+        return 1, block_size
+    next_value = int(lastrowid)
+    return next_value - block_size, next_value - 1
+
+
+def reserve_block_db(day, block_size):
+    """ Reserva un bloque con una conexión del pool síncrono, en su propia transacción. """
+    from database import db_connection
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(RESERVE_QUERY, (day, block_size + 1, block_size))
+        block = _block_from_result(cursor.rowcount, cursor.lastrowid, block_size)
+        conn.commit()
+        return block
+
+
+async def reserve_block_db_async(day, block_size):
+    """
+    Reserva un bloque con una conexión propia del pool asíncrono: la reserva se
+    confirma aunque la transacción de la orden que la pidió haga rollback.
+    """
+    from async_database import async_db_connection
+    async with async_db_connection() as conn:
+        cursor = await conn.cursor()
+        await cursor.execute(RESERVE_QUERY, (day, block_size + 1, block_size))
+        block = _block_from_result(cursor.rowcount, cursor.lastrowid, block_size)
+        await conn.commit()
+        return block
+
+
+class FolioAllocator:
+
+    def __init__(self, block_size=FOLIO_BLOCK_SIZE, cutoff_hour=FOLIO_DAY_CUTOFF_HOUR):
+        self.block_size = block_size
+        self.cutoff_hour = cutoff_hour
+        self._day = None
+        self._next = 1
+        self._end = 0
+        self._lock = threading.Lock()          # Protege el bloque actual
+        self._reserve_lock = threading.Lock()  # Una sola reserva a la vez (hilos)
+        self._async_reserve_lock = None        # Idem para corrutinas; se crea dentro del loop
+        self.allocations = 0
+        self.reservations = 0
+
+    def _try_take(self, day):
+        with self._lock:
+            if self._day == day and self._next <= self._end:
+                number = self._next
+                self._next += 1
+                self.allocations += 1
+                return number
+            return None
+
+    def _try_take_peek(self, day):
+        with self._lock:
+            return self._day == day and self._next <= self._end
+
+    def _install(self, day, block):
+        start, end = block
+        with self._lock:
+            self._day = day
+            self._next = start
+            self._end = end
+            self.reservations += 1
+
+    def next_folio(self, reserve_block=reserve_block_db, now=None):
+        """ Siguiente folio, reservando un bloque nuevo solo cuando se agota el actual. """
+        day = business_day(now, self.cutoff_hour)
+        while True:
+            number = self._try_take(day)
+            if number is not None:
+                return format_folio(day, number)
+            with self._reserve_lock:
+                # Otro hilo pudo haber reservado mientras esperábamos
+                if self._try_take_peek(day):
+                    continue
+                self._install(day, reserve_block(day, self.block_size))
+
+    async def next_folio_async(self, reserve_block=reserve_block_db_async, now=None):
+        """ Versión para las rutas asíncronas del POS. """
+        day = business_day(now, self.cutoff_hour)
+        if self._async_reserve_lock is None:
+            self._async_reserve_lock = asyncio.Lock()
+        while True:
+            number = self._try_take(day)
+            if number is not None:
+                return format_folio(day, number)
+            async with self._async_reserve_lock:
+                if self._try_take_peek(day):
+                    continue
+                self._install(day, await reserve_block(day, self.block_size))
+
+    def stats(self):
+        return {
+            "business_day": str(self._day) if self._day else None,
+            "remaining_in_block": max(0, self._end - self._next + 1),
+            "allocations": self.allocations,
+            "reservations": self.reservations,
+        }
+
+
+folio_allocator = FolioAllocator()
+
+
+# --- Benchmark ---
+def _bench(n, threads, in_memory, block_size):
+    if in_memory:
+        # Simula la secuencia de la BBDD con una latencia de ida y vuelta de 2 ms
+        sequences = {}
+        seq_lock = threading.Lock()
+
+        def reserve(day, size):
+            time.sleep(0.002)
+            with seq_lock:
+                start = sequences.get(day, 1)
+                sequences[day] = start + size
+            return start, start + size - 1
+    else:
+        from database import init_pool, db_connection
+        init_pool()
+        with db_connection() as conn:
+            conn.cursor().execute(CREATE_TABLE)
+            conn.commit()
+        reserve = reserve_block_db
+
+    # Varias "instancias" simulan varios workers compartiendo la misma secuencia
+    allocators = [FolioAllocator(block_size=block_size) for _ in range(max(1, threads // 2))]
+    per_thread = n // threads
+    results = [[] for _ in range(threads)]
+
+    def work(idx):
+        allocator = allocators[idx % len(allocators)]
+        out = results[idx]
+        for _ in range(per_thread):
+            out.append(allocator.next_folio(reserve))
+
+    workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+
+    folios = [f for r in results for f in r]
+    duplicates = len(folios) - len(set(folios))
+    reservations = sum(a.reservations for a in allocators)
+    print(f"Folios asignados: {len(folios)} en {elapsed:.3f}s ({len(folios) / elapsed:,.0f} por segundo)")
+    print(f"Reservas de bloque (viajes a la BBDD): {reservations}")
+    print(f"Duplicados: {duplicates}")
+    return duplicates
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Asignador de folios de orden.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="Mide folios por segundo y verifica que no haya duplicados.")
+    bench.add_argument("--n", type=int, default=20000)
+    bench.add_argument("--threads", type=int, default=8)
+    bench.add_argument("--block-size", type=int, default=FOLIO_BLOCK_SIZE)
+    bench.add_argument("--memoria", action="store_true", help="Simula la BBDD en memoria.")
+    args = parser.parse_args()
+
+    sys.exit(1 if _bench(args.n, args.threads, args.memoria, args.block_size) else 0)
@@ -0,0 +1,120 @@
+# api/inventory_utils.py
+"""
+Consultas de inventario basadas en conjuntos para el POS.
+
+Las listas de materiales ({supply_id: cantidad}) salen de recipe_cache; las
+funciones build_* construyen (sentencia, parámetros) y procesan filas sin
+tocar la conexión, y deplete_inventory ejecuta el descuento sobre un cursor
+asíncrono dentro de la transacción de cierre de la orden.
+"""
+
+UNKNOWN_SUPPLY_NAME = "Ingrediente desconocido"
+
+
+def build_supply_stock_query(supply_ids, lock=True):
+    """
+    Trae en una sola consulta el stock actual de los insumos de una lista de
+    materiales (ver recipe_cache.bill_of_materials). Con `lock=True` bloquea en
+    modo compartido esas filas de supplies hasta el COMMIT, en orden de
+    supply_id.
+    """
+    supply_ids = sorted(supply_ids)
+    placeholders = ", ".join(["%s"] * len(supply_ids))
+    query = f"SELECT supply_id, name, current_stock FROM supplies WHERE supply_id IN ({placeholders}) ORDER BY supply_id"
+    if lock:
+        query += " FOR SHARE"
+    return query, supply_ids
+
+
+def find_shortfalls(bom, rows):
+    """
+    Compara lo requerido por insumo ({supply_id: cantidad}) contra las filas de
+    build_supply_stock_query y devuelve todos los faltantes de una vez, no solo
+    el primero. Un insumo de la receta que ya no existe cuenta como faltante.
+    """
+    stock = {row['supply_id']: row for row in rows}
+    shortfalls = []
+    for supply_id in sorted(bom):
+        required = bom[supply_id]
+        row = stock.get(supply_id)
+        available = row['current_stock'] if row else 0
+        if row is None or available < required:
+            shortfalls.append({
+                "supply_id": supply_id,
+                "name": row['name'] if row else UNKNOWN_SUPPLY_NAME,
+                "available": available,
+                "required": required,
+            })
+    return shortfalls
+
+
+def shortfall_message(shortfalls):
+    """ Mensaje de error para el POS con todos los insumos faltantes. """
+    names = ", ".join(s["name"] for s in shortfalls)
+    return f"Stock insuficiente para preparar el producto. Falta: {names}"
+
+
+# --- Descuento de inventario al cerrar una orden ---
+
+def build_depletion_statements(order_id, bom):
+    """
+    Convierte {supply_id: cantidad} en las sentencias del descuento, todas con
+    los insumos en orden de supply_id para que dos cierres simultáneos tomen
+    los candados en el mismo orden y no se bloqueen mutuamente:
+      1. Bloqueo de las filas de supplies (SELECT ... FOR UPDATE).
+      2. Un único UPDATE multi-fila con CASE.
+      3. Los movimientos de stock ('Venta') para un executemany.
+      4. Un INSERT ... SELECT de alertas para los insumos bajo su umbral.
+    """
+    supply_ids = sorted(bom)
+    placeholders = ", ".join(["%s"] * len(supply_ids))
+
+    lock_query = f"SELECT supply_id FROM supplies WHERE supply_id IN ({placeholders}) ORDER BY supply_id FOR UPDATE"
+
+    case_sql = " ".join(["WHEN %s THEN %s"] * len(supply_ids))
+    update_query = f"""
+        UPDATE supplies
+        SET current_stock = current_stock - CASE supply_id {case_sql} END
+        WHERE supply_id IN ({placeholders})
+    """
+    update_params = []
+    for supply_id in supply_ids:
+        update_params.extend((supply_id, bom[supply_id]))
+    update_params.extend(supply_ids)
+
+    movement_query = """
+        INSERT INTO stock_movements (supply_id, order_id, movement_type, quantity_change)
+        VALUES (%s, %s, 'Venta', %s)
+    """
+    movement_rows = [(supply_id, order_id, -bom[supply_id]) for supply_id in supply_ids]
+
+    alert_query = f"""
+        INSERT INTO alerts (alert_type, message)
+        SELECT 'stock', CONCAT('Stock bajo para ', name, ': ', current_stock, ' restantes.')
+        FROM supplies
+        WHERE supply_id IN ({placeholders}) AND current_stock <= stock_threshold
+        ORDER BY supply_id
+    """
+
+    return {
+        "lock": (lock_query, supply_ids),
+        "update": (update_query, update_params),
+        "movements": (movement_query, movement_rows),
+        "alerts": (alert_query, supply_ids),
+    }
+
+
+async def deplete_inventory(cursor, order_id, bom):
+    """
+    Aplica el descuento de inventario de una orden con un número fijo de
+    sentencias, sin importar cuántas líneas o ingredientes tenga.
+    """
+    bom = {supply_id: qty for supply_id, qty in bom.items() if qty}
+    if not bom:
+        return
+    statements = build_depletion_statements(order_id, bom)
+    await cursor.execute(*statements["lock"])
+    await cursor.fetchall()
+    await cursor.execute(*statements["update"])
+    await cursor.executemany(*statements["movements"])
+    await cursor.execute(*statements["alerts"])
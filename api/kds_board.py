@@ -0,0 +1,230 @@
+# api/kds_board.py
+"""
+Tablero del KDS en memoria (modelo de lectura).
+
+GET /api/kds/orders ya no arma el tablero con SQL en cada llamada: se construye
+una vez al iniciar la API con una consulta plana (órdenes abiertas y sus
+productos) y luego se mantiene con los mismos eventos que las rutas del POS y
+del KDS publican en kds_events, de modo que leerlo no toca la BBDD.
+
+El filtro por estación usa un índice estación -> {order_id: {detail_id}}, sin
+parsear JSON. Por seguridad el tablero se reconstruye cada
+KDS_BOARD_REBUILD_SECONDS; los eventos publicados mientras corre la consulta
+se reaplican encima, así que la reconstrucción no pierde cambios.
+"""
+import os
+import threading
+
+from kds_events import kds_bus
+from query_metrics import get_registry
+
+KDS_BOARD_REBUILD_SECONDS = int(os.getenv("KDS_BOARD_REBUILD_SECONDS", "300"))
+
+LOAD_QUERY = """
+    SELECT o.order_id, o.order_folio, o.is_priority, o.created_at,
+           IFNULL(t.table_name, 'Para Llevar') as table_name,
+           od.detail_id, p.name, od.quantity, od.notes, od.status, p.station
+    FROM orders o
+    JOIN order_details od ON od.order_id = o.order_id
+    JOIN products p ON od.product_id = p.product_id
+    LEFT JOIN restaurant_tables t ON o.table_id = t.table_id
+    WHERE o.status = 'Abierta'
+    ORDER BY o.order_id, od.detail_id
+"""
+
+ITEM_FIELDS = ("detail_id", "name", "quantity", "notes", "status")
+
+
+class KdsBoard:
+
+    def __init__(self):
+        self._orders = {}      # order_id -> cabecera
+        self._items = {}       # detail_id -> item (con order_id y station)
+        self._order_items = {} # order_id -> {detail_id}
+        self._by_station = {}  # station -> {order_id: {detail_id}}
+        self._lock = threading.RLock()
+        self.loaded = False
+        self.rebuilds = 0
+        self.events_applied = 0
+
+    # --- Construcción ---
+    def _reset(self):
+        self._orders = {}
+        self._items = {}
+        self._order_items = {}
+        self._by_station = {}
+
+    def _add_item(self, order_id, item):
+        detail_id = item["detail_id"]
+        old = self._items.get(detail_id)
+        if old is not None:
+            self._unindex(old)
+        entry = {field: item.get(field) for field in ITEM_FIELDS}
+        entry["order_id"] = order_id
+        entry["station"] = item.get("station")
+        self._items[detail_id] = entry
+        self._order_items.setdefault(order_id, set()).add(detail_id)
+        self._by_station.setdefault(entry["station"], {}).setdefault(order_id, set()).add(detail_id)
+
+    def _unindex(self, item):
+        orders = self._by_station.get(item["station"], {})
+        ids = orders.get(item["order_id"])
+        if ids is not None:
+            ids.discard(item["detail_id"])
+            if not ids:
+                del orders[item["order_id"]]
+
+    def _remove_item(self, detail_id):
+        item = self._items.pop(detail_id, None)
+        if item is None:
+            return
+        self._unindex(item)
+        ids = self._order_items.get(item["order_id"], set())
+        ids.discard(detail_id)
+        if not ids:
+            # Una orden sin productos no se muestra en el KDS
+            self._order_items.pop(item["order_id"], None)
+            self._orders.pop(item["order_id"], None)
+
+    def _remove_order(self, order_id):
+        self._orders.pop(order_id, None)
+        for detail_id in self._order_items.pop(order_id, set()):
+            self._unindex(self._items.pop(detail_id))
+
+    def _load_rows(self, rows):
+        self._reset()
+        for row in rows:
+            order_id = row['order_id']
+            if order_id not in self._orders:
+                self._orders[order_id] = {
+                    "order_id": order_id,
+                    "order_folio": row['order_folio'],
+                    "is_priority": row['is_priority'],
+                    "created_at": row['created_at'],
+                    "table_name": row['table_name'],
+                }
+            self._add_item(order_id, row)
+
+    def rebuild(self, cursor):
+        """ Reconstruye el tablero desde la BBDD (cursor síncrono de tipo diccionario). """
+        seq = kds_bus.seq
+        cursor.execute(LOAD_QUERY)
+        self._install(seq, cursor.fetchall())
+
+    async def rebuild_async(self, cursor):
+        """ Igual que rebuild, para los cursores de mysql.connector.aio. """
+        seq = kds_bus.seq
+        await cursor.execute(LOAD_QUERY)
+        self._install(seq, await cursor.fetchall())
+
+    def _install(self, seq, rows):
+        def load(missed):
+            # Corre con el bus detenido (mismo orden de candados que publish:
+            # primero el del bus y luego el del tablero). Reaplicar los eventos
+            # publicados durante la consulta es idempotente.
+            if missed is None:
+                print("ADVERTENCIA: el tablero del KDS se reconstruyó sin poder reaplicar todos los eventos.")
+            with self._lock:
+                self._load_rows(rows)
+                for event in missed or []:
+                    self.apply(event)
+                self.loaded = True
+                self.rebuilds += 1
+
+        kds_bus.catch_up(seq, load)
+
+    # --- Eventos ---
+    def apply(self, event):
+        """ Aplica un evento del bus (se registra como oyente de kds_bus). """
+        with self._lock:
+            kind = event["type"]
+            order_id = event["order_id"]
+            if kind == "items_added":
+                if order_id not in self._orders:
+                    self._orders[order_id] = {
+                        "order_id": order_id,
+                        "order_folio": event["order_folio"],
+                        "is_priority": event["is_priority"],
+                        "created_at": event["created_at"],
+                        "table_name": event["table_name"],
+                    }
+                for item in event["items"]:
+                    self._add_item(order_id, item)
+            elif kind == "item_status":
+                item = self._items.get(event["detail_id"])
+                if item is not None:
+                    item["status"] = event["status"]
+            elif kind == "item_removed":
+                self._remove_item(event["detail_id"])
+            elif kind == "order_removed":
+                self._remove_order(order_id)
+            elif kind == "order_priority":
+                order = self._orders.get(order_id)
+                if order is not None:
+                    order["is_priority"] = event["is_priority"]
+            self.events_applied += 1
+
+    # --- Lecturas ---
+    def get_orders(self, station=None):
+        """
+        Órdenes abiertas con sus productos (de la estación, si se indica), en el
+        orden del KDS: prioritarias primero y luego por antigüedad.
+        """
+        with self._lock:
+            groups = self._order_items if station is None else self._by_station.get(station, {})
+            orders = []
+            for order_id, detail_ids in groups.items():
+                if not detail_ids or order_id not in self._orders:
+                    continue
+                order = dict(self._orders[order_id])
+                order["items"] = [
+                    {field: self._items[d][field] for field in ITEM_FIELDS}
+                    for d in sorted(detail_ids)
+                ]
+                orders.append(order)
+        orders.sort(key=lambda o: (-(o["is_priority"] or 0), o["created_at"]))
+        return orders
+
+    def items_by_station(self, order_id):
+        """ Productos de una orden agrupados por estación (con su estación incluida). """
+        with self._lock:
+            groups = {}
+            for detail_id in sorted(self._order_items.get(order_id, ())):
+                item = self._items[detail_id]
+                groups.setdefault(item["station"], []).append(dict(item))
+            return groups
+
+    def stats(self):
+        return {
+            "loaded": self.loaded,
+            "orders": len(self._orders),
+            "items": len(self._items),
+            "stations": {s: len(o) for s, o in self._by_station.items()},
+            "rebuilds": self.rebuilds,
+            "events_applied": self.events_applied,
+        }
+
+
+kds_board = KdsBoard()
+kds_bus.add_listener(kds_board.apply)
+
+
+def rebuild_kds_board():
+    """ Tarea programada: reconstruye el tablero con una conexión del pool. """
+    from database import db_connection
+    try:
+        with db_connection() as conn:
+            kds_board.rebuild(conn.cursor(dictionary=True))
+    except Exception as e:
+        print(f"Error al reconstruir el tablero del KDS: {e}")
+
+
+def _metrics():
+    stats = kds_board.stats()
+    return [
+        ("doppler_kds_board_orders", "gauge", "Órdenes abiertas en el tablero del KDS.", [({}, stats["orders"])]),
+        ("doppler_kds_board_items", "gauge", "Productos en el tablero del KDS.", [({}, stats["items"])]),
+    ]
+
+
+get_registry().register_collector(_metrics)
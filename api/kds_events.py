@@ -0,0 +1,228 @@
+# api/kds_events.py
+"""
+Bus de eventos en proceso para las pantallas del KDS.
+
+Antes cada pantalla consultaba /api/kds/orders cada 5 segundos. Ahora las
+rutas del POS y del KDS publican aquí cada cambio de órdenes y productos (después
+del COMMIT) y /api/kds/stream los reparte por Server-Sent Events a las pantallas
+suscritas, filtrando por estación.
+
+Cada evento lleva un número de secuencia creciente. Los últimos
+KDS_EVENT_BUFFER eventos se guardan en un búfer circular, así que una pantalla
+que se reconecta con Last-Event-ID recibe solo lo que se perdió; si el hueco es
+mayor que el búfer (o la API se reinició) se le pide un "resync": recargar
+/api/kds/orders y seguir con los eventos.
+
+El bus vive en memoria del proceso: las escrituras y las pantallas deben
+atenderse en el mismo worker de uvicorn.
+
+Tipos de evento (campo `type`):
+  items_added     Cabecera de la orden + productos nuevos (con su estación).
+  item_status     Un producto cambió de estado.
+  item_removed    Un producto se canceló.
+  order_removed   La orden salió del KDS (lista o pagada).
+  order_priority  La orden se marcó como prioritaria.
+"""
+import os
+import json
+import asyncio
+import threading
+from collections import deque
+
+from query_metrics import get_registry
+
+KDS_EVENT_BUFFER = int(os.getenv("KDS_EVENT_BUFFER", "2000"))
+# Eventos pendientes por pantalla antes de considerarla atrasada y pedirle resync
+KDS_SUBSCRIBER_QUEUE = int(os.getenv("KDS_SUBSCRIBER_QUEUE", "500"))
+# Comentario periódico para que proxies y navegador no cierren el stream inactivo
+KDS_KEEPALIVE_SECONDS = float(os.getenv("KDS_KEEPALIVE_SECONDS", "15"))
+
+
+class KdsSubscription:
+    """ Cola de eventos de una pantalla conectada; `station=None` recibe todo. """
+
+    def __init__(self, station, loop, maxsize=KDS_SUBSCRIBER_QUEUE):
+        self.station = station
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def wants(self, event):
+        stations = event.get("stations")
+        return self.station is None or stations is None or self.station in stations
+
+    def _push(self, event):
+        # Corre dentro del event loop de la suscripción
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    def drain(self):
+        """ Descarta lo encolado (tras un resync ya no sirve). """
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.overflowed = False
+
+
+class KdsEventBus:
+
+    def __init__(self, buffer_size=KDS_EVENT_BUFFER):
+        self._seq = 0
+        self._buffer = deque(maxlen=buffer_size)
+        self._subscribers = set()
+        self._listeners = []
+        self._lock = threading.Lock()
+        self.published = 0
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def publish(self, event_type, order_id, stations=None, **data):
+        """
+        Registra un evento y lo envía a las pantallas interesadas. Se puede
+        llamar desde rutas async o desde el threadpool de las rutas síncronas.
+        `stations` es el conjunto de estaciones afectadas (None = todas).
+        """
+        # products.station admite NULL: los productos sin estación van al final
+        stations = sorted(stations, key=lambda s: (s is None, s or "")) if stations is not None else None
+        with self._lock:
+            self._seq += 1
+            event = {
+                "seq": self._seq,
+                "type": event_type,
+                "order_id": order_id,
+                "stations": stations,
+                **data,
+            }
+            self._buffer.append(event)
+            subscribers = [s for s in self._subscribers if s.wants(event)]
+            self.published += 1
+            # Dentro del candado para que los oyentes vean los eventos en orden de secuencia
+            for listener in self._listeners:
+                listener(event)
+        for sub in subscribers:
+            try:
+                sub.loop.call_soon_threadsafe(sub._push, event)
+            except RuntimeError:
+                # El loop de la suscripción ya se cerró
+                self.unsubscribe(sub)
+        return event
+
+    def since(self, seq, station=None):
+        """
+        Eventos posteriores a `seq` para la estación, o None si ya no están
+        todos en el búfer (la pantalla debe resincronizar).
+        """
+        with self._lock:
+            events = self._events_after(seq)
+        if events is None:
+            return None
+        return [e for e in events if station is None or e["stations"] is None or station in e["stations"]]
+
+    def _events_after(self, seq):
+        if seq > self._seq:
+            return None  # Secuencia de otra vida del proceso
+        if seq == self._seq:
+            return []
+        if not self._buffer or self._buffer[0]["seq"] > seq + 1:
+            return None
+        return [e for e in self._buffer if e["seq"] > seq]
+
+    def catch_up(self, seq, fn):
+        """
+        Llama fn(eventos posteriores a `seq`, o None si ya no están en el búfer)
+        sin que se publique nada mientras corre. Sirve a quien reconstruye un
+        modelo en memoria y necesita reaplicar lo publicado durante su consulta.
+        """
+        with self._lock:
+            return fn(self._events_after(seq))
+
+    def add_listener(self, listener):
+        """ Registra una función síncrona que recibe cada evento al publicarse (p. ej. kds_board). """
+        self._listeners.append(listener)
+
+    def subscribe(self, station=None):
+        sub = KdsSubscription(station, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def stats(self):
+        return {
+            "seq": self._seq,
+            "buffered": len(self._buffer),
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+        }
+
+
+kds_bus = KdsEventBus()
+
+
+def format_sse(event_type, data, event_id=None):
+    """ Serializa un mensaje de Server-Sent Events. """
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, default=str, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def _metrics():
+    stats = kds_bus.stats()
+    return [
+        ("doppler_kds_events_total", "counter", "Eventos publicados en el bus del KDS.", [({}, stats["published"])]),
+        ("doppler_kds_subscribers", "gauge", "Pantallas del KDS conectadas al stream.", [({}, stats["subscribers"])]),
+    ]
+
+
+get_registry().register_collector(_metrics)
+
+
+# --- Ayudantes para las rutas que escriben ---
+
+def build_item_rows_query(detail_ids):
+    """ Cabecera de la orden y datos de KDS de los productos indicados, en una consulta. """
+    placeholders = ", ".join(["%s"] * len(detail_ids))
+    query = f"""
+        SELECT o.order_id, o.order_folio, o.is_priority, o.created_at, o.status,
+               IFNULL(t.table_name, 'Para Llevar') as table_name,
+               od.detail_id, p.name, od.quantity, od.notes, od.status AS item_status, p.station
+        FROM order_details od
+        JOIN orders o ON od.order_id = o.order_id
+        JOIN products p ON od.product_id = p.product_id
+        LEFT JOIN restaurant_tables t ON o.table_id = t.table_id
+        WHERE od.detail_id IN ({placeholders})
+        ORDER BY od.detail_id
+    """
+    return query, list(detail_ids)
+
+
+def publish_items_added(rows):
+    """
+    Publica un evento items_added por orden a partir de las filas de
+    build_item_rows_query. Leer las filas antes del COMMIT y publicar después.
+    """
+    by_order = {}
+    for row in rows:
+        by_order.setdefault(row['order_id'], []).append(row)
+    for order_id, order_rows in by_order.items():
+        head = order_rows[0]
+        if head['status'] != 'Abierta':
+            continue  # El KDS solo muestra órdenes abiertas
+        items = [{
+            "detail_id": r['detail_id'], "name": r['name'], "quantity": r['quantity'],
+            "notes": r['notes'], "status": r['item_status'], "station": r['station'],
+        } for r in order_rows]
+        kds_bus.publish(
+            "items_added", order_id, {i["station"] for i in items},
+            order_folio=head['order_folio'], table_name=head['table_name'],
+            is_priority=head['is_priority'], created_at=head['created_at'], items=items,
+        )
@@ -0,0 +1,166 @@
+# api/kds_scheduler.py
+"""
+Modo programado del KDS (GET /api/kds/orders?mode=programado).
+
+En lugar de ordenar solo por is_priority y antigüedad, cada comanda (orden en
+una estación) se planea con tiempos de preparación aprendidos por producto
+(mediana de item_prep en prep_telemetry, con respaldo por estación y luego
+KDS_DEFAULT_PREP_SECONDS):
+
+  * Disparo conjunto: dentro de una comanda los productos se inician de modo
+    que terminen juntos; el más largo va primero y los demás llevan
+    `fire_in_seconds` de espera.
+  * Tiempos entre estaciones: si la misma orden tarda más en otra estación,
+    la comanda corta lleva `hold_seconds` para que la mesa reciba todo a la vez.
+  * Orden de las comandas: primero las prioritarias y luego la mayor razón de
+    respuesta (espera + servicio) / servicio (HRRN), que favorece comandas
+    cortas sin dejar que las largas esperen indefinidamente.
+
+El plan de cada comanda se calcula al leer, la primera vez que se necesita, y
+se guarda hasta que llega un evento que toca su orden (el planificador es
+oyente del bus después del tablero) o cambian los estimados; en las lecturas
+siguientes solo se recalculan las razones de respuesta, que dependen de la
+hora, y se ordena.
+"""
+import os
+import time
+import datetime
+import threading
+
+from kds_board import kds_board
+from kds_events import kds_bus
+from prep_telemetry import prep_telemetry, KDS_TELEMETRY_RETENTION_HOURS
+
+KDS_DEFAULT_PREP_SECONDS = float(os.getenv("KDS_DEFAULT_PREP_SECONDS", "300"))
+KDS_ESTIMATE_REFRESH_SECONDS = float(os.getenv("KDS_ESTIMATE_REFRESH_SECONDS", "60"))
+# Parte del tiempo que se considera pendiente para un producto ya en preparación
+# (el tablero no guarda cuándo empezó).
+IN_PROGRESS_REMAINING = 0.5
+
+SCHEDULE_MODES = ("fifo", "programado")
+
+# Llave del plan de la orden completa; None es una estación válida (productos sin estación)
+WHOLE_ORDER = "*"
+
+
+class PrepEstimator:
+    """ Tiempos de preparación por producto a partir de la telemetría del KDS. """
+
+    def __init__(self, refresh_seconds=KDS_ESTIMATE_REFRESH_SECONDS, default=KDS_DEFAULT_PREP_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.default = default
+        self._by_product = {}
+        self._by_station = {}
+        self._loaded_at = 0.0
+        self.version = 0
+
+    def refresh(self, force=False):
+        if not force and time.monotonic() - self._loaded_at < self.refresh_seconds:
+            return False
+        minutes = KDS_TELEMETRY_RETENTION_HOURS * 60
+        by_product = {r["key"]: r["p50"] for r in prep_telemetry.query("item_prep", "product", minutes)}
+        by_station = {r["key"]: r["p50"] for r in prep_telemetry.query("item_prep", "station", minutes)}
+        changed = by_product != self._by_product or by_station != self._by_station
+        self._by_product, self._by_station = by_product, by_station
+        self._loaded_at = time.monotonic()
+        if changed:
+            self.version += 1
+        return changed
+
+    def estimate(self, product, station=None):
+        return self._by_product.get(product) or self._by_station.get(station) or self.default
+
+
+def plan_ticket(items, estimate):
+    """
+    Plan de una comanda: segundos de servicio restantes (el producto más largo,
+    pues se preparan en paralelo) y, por producto, su estimado y cuánto esperar
+    para dispararlo y que todos terminen a la vez.
+    """
+    remaining = {}
+    for item in items:
+        prep = estimate(item["name"], item.get("station"))
+        if item["status"] == "Listo":
+            remaining[item["detail_id"]] = (prep, 0.0)
+        elif item["status"] == "En Preparación":
+            remaining[item["detail_id"]] = (prep, prep * IN_PROGRESS_REMAINING)
+        else:
+            remaining[item["detail_id"]] = (prep, prep)
+    service = max((r for _, r in remaining.values()), default=0.0)
+    plan = {}
+    for item in items:
+        prep, left = remaining[item["detail_id"]]
+        fire_in = 0.0 if item["status"] != "Pendiente" else service - left
+        plan[item["detail_id"]] = {"prep_seconds": round(prep), "fire_in_seconds": round(fire_in)}
+    return service, plan
+
+
+class KdsScheduler:
+
+    def __init__(self, board=kds_board, estimator=None):
+        self.board = board
+        self.estimator = estimator or PrepEstimator()
+        self._plans = {}  # (order_id, estación o WHOLE_ORDER) -> (servicio, {detail_id: plan})
+        self._lock = threading.Lock()
+        self.replans = 0
+
+    # --- Mantenimiento incremental ---
+    def on_event(self, event):
+        """ Oyente del bus: invalida solo los planes de la orden tocada. """
+        with self._lock:
+            order_id = event["order_id"]
+            for key in [k for k in self._plans if k[0] == order_id]:
+                del self._plans[key]
+
+    def _plan(self, order_id, station, items):
+        key = (order_id, station)
+        cached = self._plans.get(key)
+        if cached is None:
+            cached = self._plans[key] = plan_ticket(items, self.estimator.estimate)
+            self.replans += 1
+        return cached
+
+    # --- Lectura ---
+    def get_orders(self, station=None, now=None):
+        now = now or datetime.datetime.now()
+        if self.estimator.refresh():
+            with self._lock:
+                self._plans.clear()
+        orders = self.board.get_orders(station)
+        with self._lock:
+            for order in orders:
+                order_id = order["order_id"]
+                by_station = self.board.items_by_station(order_id)
+                if station is None:
+                    service, plan = self._plan(order_id, WHOLE_ORDER, [i for items in by_station.values() for i in items])
+                else:
+                    service, plan = self._plan(order_id, station, by_station.get(station, []))
+                # La estación más lenta de la orden marca el ritmo de las demás
+                slowest = max((self._plan(order_id, s, items)[0] for s, items in by_station.items()), default=service)
+                waiting = max(0.0, (now - order["created_at"]).total_seconds()) if order.get("created_at") else 0.0
+                ratio = (waiting + max(service, 1.0)) / max(service, 1.0)
+                for item in order["items"]:
+                    item.update(plan.get(item["detail_id"], {}))
+                order["items"].sort(key=lambda i: (i["status"] == "Listo", i.get("fire_in_seconds", 0)))
+                order["schedule"] = {
+                    "service_seconds": round(service),
+                    "hold_seconds": round(max(0.0, slowest - service)),
+                    "waiting_seconds": round(waiting),
+                    "response_ratio": round(ratio, 2),
+                }
+        orders.sort(key=lambda o: (-(o["is_priority"] or 0), -o["schedule"]["response_ratio"]))
+        for rank, order in enumerate(orders, start=1):
+            order["schedule"]["rank"] = rank
+        return orders
+
+    def stats(self):
+        return {
+            "plans": len(self._plans),
+            "replans": self.replans,
+            "estimates": len(self.estimator._by_product),
+            "estimates_version": self.estimator.version,
+        }
+
+
+kds_scheduler = KdsScheduler()
+kds_bus.add_listener(kds_scheduler.on_event)
@@ -0,0 +1,128 @@
+# api/kds_transitions.py
+"""
+Cambios de estado de productos del KDS (Pendiente -> En Preparación -> Listo).
+
+Las rutas de un solo producto y la de lote usan el mismo camino: una consulta
+que resuelve y bloquea los productos afectados, un UPDATE con IN y, al pasar a
+'Listo', una sola alerta por orden con todos sus productos en lugar de una por
+producto. Cada paso se sella en kds_item_timings (ver prep_telemetry.py). Los
+eventos del KDS y la telemetría se registran después del COMMIT con
+publish_transition.
+"""
+import datetime
+
+from kds_events import kds_bus
+from prep_telemetry import (
+    build_stamp_update, build_ticket_query, completed_tickets, record_item_transition, record_tickets
+)
+
+ITEM_STATUSES = ("En Preparación", "Listo")
+# Estados desde los que se puede llegar a cada uno: solo se avanza, nunca se regresa
+FROM_STATUSES = {
+    "En Preparación": ("Pendiente",),
+    "Listo": ("Pendiente", "En Preparación"),
+}
+
+
+def build_target_query(status, detail_ids=None, order_id=None, station=None):
+    """
+    Productos a mover a `status`, bloqueados hasta el COMMIT. Se eligen por
+    detail_ids, por orden, por estación (de las órdenes abiertas) o por una
+    combinación. Solo se toman los que pueden avanzar a `status`: un lote a
+    'En Preparación' no regresa productos que ya están 'Listo'.
+    """
+    from_statuses = FROM_STATUSES[status]
+    conditions = [f"od.status IN ({', '.join(['%s'] * len(from_statuses))})"]
+    params = list(from_statuses)
+    if detail_ids:
+        conditions.append(f"od.detail_id IN ({', '.join(['%s'] * len(detail_ids))})")
+        params.extend(detail_ids)
+    if order_id is not None:
+        conditions.append("od.order_id = %s")
+        params.append(order_id)
+    elif not detail_ids:
+        # Por estación sola: solo lo que está en el KDS
+        conditions.append("o.status = 'Abierta'")
+    if station is not None:
+        conditions.append("p.station = %s")
+        params.append(station)
+    query = f"""
+        SELECT od.detail_id, od.order_id, od.quantity, p.name, p.station, o.order_folio,
+               t.queued_at, t.started_at
+        FROM order_details od
+        JOIN products p ON od.product_id = p.product_id
+        JOIN orders o ON od.order_id = o.order_id
+        LEFT JOIN kds_item_timings t ON t.detail_id = od.detail_id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY od.detail_id
+        FOR UPDATE
+    """
+    return query, params
+
+
+def build_ready_alerts(rows):
+    """
+    Una alerta 'item_ready' por orden. Con un solo producto se conserva el
+    mensaje de siempre; con varios se listan juntos.
+    """
+    by_order = {}
+    for row in rows:
+        by_order.setdefault(row['order_id'], []).append(row)
+    alerts = []
+    for order_rows in by_order.values():
+        folio = order_rows[0]['order_folio']
+        if len(order_rows) == 1:
+            message = f"Producto listo: '{order_rows[0]['name']}' de la orden {folio}."
+        else:
+            names = ", ".join(f"{r['quantity']}x {r['name']}" if r['quantity'] > 1 else r['name'] for r in order_rows)
+            message = f"Productos listos de la orden {folio}: {names}."
+        alerts.append(('item_ready', message))
+    return alerts
+
+
+class Transition:
+    """ Resultado de transition_items, para publicarlo tras el COMMIT. """
+
+    def __init__(self, status, at, user_id, rows=(), tickets=()):
+        self.status = status
+        self.at = at
+        self.user_id = user_id
+        self.rows = list(rows)
+        self.tickets = list(tickets)
+
+
+async def transition_items(cursor, status, detail_ids=None, order_id=None, station=None, user_id=None, alerts=True):
+    """
+    Mueve los productos elegidos a `status` dentro de la transacción del cursor
+    (asíncrono, de tipo diccionario), sellando la hora del paso. Al pasar a
+    'Listo' también detecta las comandas (orden, estación) que quedaron completas.
+    Con `alerts=False` no se generan las alertas por producto (la orden completa
+    lleva la suya).
+    """
+    at = datetime.datetime.now().replace(microsecond=0)
+    await cursor.execute(*build_target_query(status, detail_ids, order_id, station))
+    rows = await cursor.fetchall()
+    if not rows:
+        return Transition(status, at, user_id)
+    ids = [row['detail_id'] for row in rows]
+    await cursor.execute(
+        f"UPDATE order_details SET status = %s WHERE detail_id IN ({', '.join(['%s'] * len(ids))})",
+        [status] + ids
+    )
+    await cursor.execute(*build_stamp_update(ids, status, at, user_id))
+    tickets = []
+    if status == "Listo":
+        if alerts:
+            await cursor.executemany("INSERT INTO alerts (alert_type, message) VALUES (%s, %s)", build_ready_alerts(rows))
+        await cursor.execute(*build_ticket_query({row['order_id'] for row in rows}))
+        touched = {(row['order_id'], row['station']) for row in rows}
+        tickets = completed_tickets(await cursor.fetchall(), touched)
+    return Transition(status, at, user_id, rows, tickets)
+
+
+def publish_transition(transition):
+    """ Publica en el bus del KDS el nuevo estado de cada producto y registra la telemetría (tras el COMMIT). """
+    for row in transition.rows:
+        kds_bus.publish("item_status", row['order_id'], {row['station']}, detail_id=row['detail_id'], status=transition.status)
+    record_item_transition(transition.rows, transition.status, transition.at, transition.user_id)
+    record_tickets(transition.tickets, transition.user_id)
@@ -0,0 +1,182 @@
+# api/kpi_engine.py
+"""
+KPIs de comparación entre periodos en una sola pasada.
+
+Cada KPI se declara como datos en KPI_METRICS (tabla, columna de fecha,
+agregado, expresión y filtro) y se calcula para un par de periodos con una
+sola consulta de agregación condicional:
+
+    SELECT SUM(CASE WHEN ts >= %s AND ts < %s THEN expr END) AS current_value,
+           SUM(CASE WHEN ts >= %s AND ts < %s THEN expr END) AS previous_value
+    FROM tabla
+    WHERE filtro AND ((ts >= %s AND ts < %s) OR (ts >= %s AND ts < %s))
+
+Los rangos son semiabiertos sobre la columna de fecha, así que la consulta
+usa los índices (filtro, fecha) de migrations/m0003 y nunca mezcla años.
+Los KPIs derivados (p. ej. ticket promedio) se declaran como cociente de
+otros dos. Agregar un KPI es agregar una entrada aquí.
+"""
+import datetime
+
+KPI_METRICS = {
+    "reservations": {
+        "label": "Reservaciones confirmadas",
+        "table": "reservations", "timestamp": "created_at",
+        "aggregate": "COUNT", "expression": "1", "where": "status = 'Confirmada'",
+    },
+    "waste": {
+        "label": "Mermas (cantidad)",
+        "table": "stock_movements", "timestamp": "movement_timestamp",
+        "aggregate": "SUM", "expression": "ABS(quantity_change)", "where": "movement_type = 'Ajuste Merma'",
+    },
+    "sales": {
+        "label": "Ventas",
+        "table": "payments_rollup", "timestamp": "sale_date",
+        "aggregate": "SUM", "expression": "amount",
+    },
+    "orders": {
+        "label": "Órdenes pagadas",
+        "table": "payments_rollup", "timestamp": "sale_date",
+        "aggregate": "SUM", "expression": "order_count",
+    },
+    "units_sold": {
+        "label": "Productos vendidos",
+        "table": "sales_rollup", "timestamp": "sale_date",
+        "aggregate": "SUM", "expression": "units",
+    },
+    "cancellations": {
+        "label": "Productos cancelados",
+        "table": "audit_logs", "timestamp": "log_timestamp",
+        "aggregate": "COUNT", "expression": "1", "where": "action = 'CANCEL_ORDER_ITEM'",
+    },
+    "average_ticket": {
+        "label": "Ticket promedio",
+        "ratio": ("sales", "orders"),
+    },
+}
+
+PERIODS = ("day", "week", "month", "custom")
+COMPARISONS = ("previous", "year")
+
+
+class KpiError(ValueError):
+    """ KPI, periodo o comparación inválidos. """
+
+
+# --- Periodos ---
+
+def _month_start(day, months_back=0):
+    """ Primer día del mes que está `months_back` meses antes del de `day`. """
+    month = day.month - 1 - months_back
+    return datetime.date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def _minus_year(day):
+    try:
+        return day.replace(year=day.year - 1)
+    except ValueError:
+        # 29 de febrero
+        return day.replace(year=day.year - 1, day=28)
+
+
+def period_bounds(period, anchor=None, start_date=None, end_date=None):
+    """ Rango semiabierto [inicio, fin) del periodo que contiene `anchor` (o el rango personalizado). """
+    anchor = anchor or datetime.date.today()
+    if period == "day":
+        return anchor, anchor + datetime.timedelta(days=1)
+    if period == "week":
+        start = anchor - datetime.timedelta(days=anchor.weekday())
+        return start, start + datetime.timedelta(days=7)
+    if period == "month":
+        return _month_start(anchor), _month_start(anchor, -1)
+    if period == "custom":
+        if not start_date or not end_date or end_date < start_date:
+            raise KpiError("El periodo personalizado requiere start_date <= end_date.")
+        return start_date, end_date + datetime.timedelta(days=1)
+    raise KpiError(f"Periodo desconocido: {period}. Disponibles: {', '.join(PERIODS)}.")
+
+
+def comparison_bounds(period, current, compare="previous"):
+    """ Periodo contra el que se compara: el inmediato anterior o el mismo del año pasado. """
+    start, end = current
+    if compare == "year":
+        return _minus_year(start), _minus_year(end)
+    if compare != "previous":
+        raise KpiError(f"Comparación desconocida: {compare}. Disponibles: {', '.join(COMPARISONS)}.")
+    if period == "month":
+        return _month_start(start, 1), start
+    length = end - start
+    return start - length, start
+
+
+def to_date(current, previous, anchor):
+    """ Recorta ambos periodos al mismo tramo transcurrido (p. ej. mes a la fecha contra el mismo tramo). """
+    elapsed = min(anchor + datetime.timedelta(days=1), current[1]) - current[0]
+    return (current[0], current[0] + elapsed), (previous[0], min(previous[0] + elapsed, previous[1]))
+
+
+# --- SQL ---
+
+def build_query(metric, current, previous):
+    """ Consulta de una pasada para `metric` (entrada de KPI_METRICS sin cociente). """
+    ts = metric["timestamp"]
+    expression = metric["expression"]
+    aggregate = metric["aggregate"]
+    in_range = f"{ts} >= %s AND {ts} < %s"
+    conditions = [f"(({in_range}) OR ({in_range}))"]
+    if metric.get("where"):
+        conditions.insert(0, metric["where"])
+    query = f"""
+        SELECT {aggregate}(CASE WHEN {in_range} THEN {expression} END) AS current_value,
+               {aggregate}(CASE WHEN {in_range} THEN {expression} END) AS previous_value
+        FROM {metric['table']}
+        WHERE {' AND '.join(conditions)}
+    """
+    params = [current[0], current[1], previous[0], previous[1], current[0], current[1], previous[0], previous[1]]
+    return query, params
+
+
+def percentage_change(current, previous):
+    if previous > 0:
+        return ((current - previous) / previous) * 100
+    return 100 if current > 0 else 0
+
+
+def _values(cursor, name, current, previous):
+    metric = KPI_METRICS[name]
+    if "ratio" in metric:
+        num_current, num_previous = _values(cursor, metric["ratio"][0], current, previous)
+        den_current, den_previous = _values(cursor, metric["ratio"][1], current, previous)
+        return (num_current / den_current if den_current else 0,
+                num_previous / den_previous if den_previous else 0)
+    cursor.execute(*build_query(metric, current, previous))
+    row = cursor.fetchone()
+    return float(row['current_value'] or 0), float(row['previous_value'] or 0)
+
+
+def compute(cursor, name, period="month", compare="previous", anchor=None,
+            start_date=None, end_date=None, elapsed_only=False):
+    """
+    Valor de un KPI en el periodo actual y en el de comparación (cursor de
+    tipo diccionario). Con `elapsed_only` ambos periodos se recortan al tramo
+    que ya transcurrió del actual.
+    """
+    if name not in KPI_METRICS:
+        raise KpiError(f"KPI desconocido: {name}. Disponibles: {', '.join(KPI_METRICS)}.")
+    anchor = anchor or datetime.date.today()
+    current = period_bounds(period, anchor, start_date, end_date)
+    previous = comparison_bounds(period, current, compare)
+    if elapsed_only:
+        current, previous = to_date(current, previous, anchor)
+    current_value, previous_value = _values(cursor, name, current, previous)
+    return {
+        "metric": name,
+        "label": KPI_METRICS[name]["label"],
+        "period": period,
+        "compare": compare,
+        # Fechas inclusivas para mostrar
+        "current": {"start": current[0], "end": current[1] - datetime.timedelta(days=1), "value": current_value},
+        "previous": {"start": previous[0], "end": previous[1] - datetime.timedelta(days=1), "value": previous_value},
+        "change": current_value - previous_value,
+        "percentage_change": percentage_change(current_value, previous_value),
+    }
@@ -1,8 +1,18 @@
 # api/main.py
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from database import get_db_connection
+from database import db_connection, init_pool, close_pool
+from async_database import init_async_pool, close_async_pool
+import query_metrics
+import migrations
+from recipe_cache import recipe_cache
+from product_costs import product_costs
+import prep_telemetry
+from kds_board import kds_board, rebuild_kds_board, KDS_BOARD_REBUILD_SECONDS
+from report_jobs import report_jobs, purge_report_jobs
+from analytics_cube import refresh_analytics_cube, ANALYTICS_REFRESH_SECONDS
+import dashboard_widgets
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import datetime
 
@@ -11,7 +21,7 @@ from routers import (
     menu, reservations, events, gallery, settings, tables, pos, auth,
     attendance, inventory, reports, suppliers, purchase_orders, promotions,
     users, recipes, alerts, menu_management, management, audit, predictions,
-    model_management, kds, customers, chatbot, login_kds, Chat
+    model_management, kds, customers, chatbot, login_kds, Chat, system, jobs, analytics, dashboard
 )
 
 # --- Instancia de la aplicación ---
@@ -24,18 +34,15 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 def archive_past_events():
     """Archiva eventos cuya fecha ya pasó."""
     print("Ejecutando tarea programada: Archivando eventos pasados...")
-    conn = get_db_connection()
-    if conn and conn.is_connected():
-        try:
+    try:
+        with db_connection() as conn:
             cursor = conn.cursor()
             query = "UPDATE events SET status = 'Archivado' WHERE event_date < CURDATE() AND status = 'Activo'"
             cursor.execute(query)
             conn.commit()
             print(f"Tarea finalizada. {cursor.rowcount} eventos archivados.")
-        except Exception as e:
-            print(f"Error en la tarea de archivado: {e}")
-        finally:
-            conn.close()
+    except Exception as e:
+        print(f"Error en la tarea de archivado: {e}")
 
 # --- Scheduler para tareas automáticas ---
 scheduler = AsyncIOScheduler()
@@ -43,7 +50,35 @@ scheduler = AsyncIOScheduler()
 @app.on_event("startup")
 async def startup_event():
     """Se ejecuta al iniciar la API."""
+    pool = init_pool()
+    print(f"Pool de conexiones iniciado (tamaño {pool.size}, desbordamiento {pool.max_overflow}).")
+    await init_async_pool()
+    # Sin el esquema al día la API no puede atender: si una migración falla, no arranca
+    with db_connection() as conn:
+        applied = migrations.migrate(conn)
+        if applied:
+            print(f"Migraciones aplicadas: {applied}")
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            recipe_cache.ensure_fresh(cursor, force=True)
+            product_costs.ensure_fresh(cursor)
+            conn.commit()
+        print(f"Caché de recetas cargada ({recipe_cache.stats()['products']} productos).")
+    except Exception as e:
+        print(f"No se pudo precargar la caché de recetas: {e}")
+    rebuild_kds_board()
+    print(f"Tablero del KDS cargado ({kds_board.stats()['orders']} órdenes abiertas).")
+    try:
+        with db_connection() as conn:
+            stats = prep_telemetry.rehydrate(conn.cursor(dictionary=True))
+        print(f"Telemetría del KDS reconstruida ({stats['recorded']} tiempos).")
+    except Exception as e:
+        print(f"No se pudo reconstruir la telemetría del KDS: {e}")
     scheduler.add_job(archive_past_events, 'cron', hour=2, minute=0)  # Todos los días a las 2 AM
+    scheduler.add_job(rebuild_kds_board, 'interval', seconds=KDS_BOARD_REBUILD_SECONDS)
+    scheduler.add_job(purge_report_jobs, 'interval', hours=1)
+    scheduler.add_job(refresh_analytics_cube, 'interval', seconds=ANALYTICS_REFRESH_SECONDS)
     scheduler.start()
     print("Scheduler iniciado. La tarea de archivado está programada.")
 
@@ -52,6 +87,28 @@ async def shutdown_event():
     """Se ejecuta al detener la API."""
     scheduler.shutdown()
     print("Scheduler detenido.")
+    report_jobs.shutdown()
+    dashboard_widgets.dashboard.shutdown()
+    close_pool()
+    await close_async_pool()
+    print("Pool de conexiones cerrado.")
+
+# --- Instrumentación de consultas por petición ---
+@app.middleware("http")
+async def query_metrics_middleware(request: Request, call_next):
+    """Cuenta las sentencias SQL de cada petición y las publica en Server-Timing."""
+    stats, token = query_metrics.begin_request()
+    try:
+        response = await call_next(request)
+    finally:
+        query_metrics.end_request(token)
+    # Sin ruta (404, escaneos) se usa una etiqueta fija: la URL cruda haría
+    # crecer sin límite las series de Prometheus
+    route = request.scope.get("route")
+    path = getattr(route, "path", query_metrics.UNMATCHED_ROUTE)
+    query_metrics.finish_request(request.method, path, stats)
+    response.headers["Server-Timing"] = stats.server_timing()
+    return response
 
 # --- Configuración CORS ---
 origins = [
@@ -74,7 +131,7 @@ routers = [
     menu, reservations, events, gallery, settings, tables, pos, auth,
     attendance, inventory, reports, suppliers, purchase_orders, promotions,
     users, recipes, alerts, menu_management, management, audit, predictions,
-    model_management, kds, customers, chatbot, login_kds, Chat
+    model_management, kds, customers, chatbot, login_kds, Chat, system, jobs, analytics, dashboard
 ]
 
 for r in routers:
@@ -0,0 +1,103 @@
+# api/migrations/__init__.py
+"""
+Esquema versionado de la BBDD.
+
+Cada migración es un módulo mNNNN_<nombre>.py con VERSION, DESCRIPTION y
+upgrade(cursor), y se agrega a MIGRATIONS. La tabla `schema_migrations` guarda
+las que ya se aplicaron; migrate() corre las pendientes en orden al iniciar la
+API (con GET_LOCK, para que varios workers de uvicorn no las corran a la vez).
+
+Una migración de datos larga define upgrade_in_batches(conn) en vez de
+upgrade(cursor) y hace COMMIT por lote; se registra como aplicada al terminar
+todos los lotes, así que debe poder repetirse completa.
+
+Las migraciones deben poder repetirse sobre una BBDD que ya tenga las tablas
+(CREATE TABLE IF NOT EXISTS, migrations.ddl.ensure_index), porque la de
+producción existía antes de este paquete.
+
+Desde la carpeta api/:
+    python -m migrations migrate        aplica las pendientes
+    python -m migrations status         lista aplicadas y pendientes
+    python -m migrations seed           datos sintéticos en una BBDD local vacía
+    python -m migrations check-plans    EXPLAIN de las consultas calientes (ver plans.py)
+"""
+from migrations import (
+    m0001_base_schema, m0002_support_tables, m0003_hot_query_indexes, m0004_report_jobs,
+    m0005_customer_stats, m0006_backfill_summaries, m0007_analytics_corrections,
+)
+
+MIGRATIONS = [
+    m0001_base_schema,
+    m0002_support_tables,
+    m0003_hot_query_indexes,
+    m0004_report_jobs,
+    m0005_customer_stats,
+    m0006_backfill_summaries,
+    m0007_analytics_corrections,
+]
+
+LOCK_NAME = "doppler_schema_migrations"
+LOCK_TIMEOUT_SECONDS = 60
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT NOT NULL PRIMARY KEY,
+        description VARCHAR(200) NOT NULL,
+        applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+def applied_versions(cursor):
+    cursor.execute(CREATE_TABLE)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def pending(cursor):
+    done = applied_versions(cursor)
+    return [m for m in MIGRATIONS if m.VERSION not in done]
+
+
+def _acquire_lock(cursor):
+    """
+    Espera el candado de migraciones. Mientras otro worker aplica una migración
+    larga (p. ej. el llenado de m0006) se sigue esperando en vez de fallar; al
+    obtenerlo, pending() ya no devuelve lo que el otro aplicó.
+    """
+    while True:
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, LOCK_TIMEOUT_SECONDS))
+        acquired = cursor.fetchone()[0]
+        if acquired == 1:
+            return
+        if acquired is None:
+            raise RuntimeError("No se pudo pedir el candado de migraciones.")
+        print("Otro proceso está aplicando las migraciones; esperando...")
+
+
+def migrate(conn):
+    """
+    Aplica las migraciones pendientes y devuelve sus versiones. El DDL de MySQL
+    hace COMMIT implícito, así que cada migración se registra al terminar y
+    una que falle a la mitad se vuelve a intentar completa la próxima vez.
+    """
+    cursor = conn.cursor()
+    _acquire_lock(cursor)
+    try:
+        applied = []
+        for migration in pending(cursor):
+            print(f"Aplicando migración {migration.VERSION}: {migration.DESCRIPTION}")
+            if hasattr(migration, "upgrade_in_batches"):
+                migration.upgrade_in_batches(conn)
+            else:
+                migration.upgrade(cursor)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                (migration.VERSION, migration.DESCRIPTION)
+            )
+            conn.commit()
+            applied.append(migration.VERSION)
+        return applied
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+        cursor.fetchone()
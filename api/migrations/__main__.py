@@ -0,0 +1,45 @@
+# api/migrations/__main__.py
+""" Línea de comandos de las migraciones (ver migrations/__init__.py). """
+import sys
+import argparse
+
+import migrations
+from migrations import plans
+from database import db_connection
+
+parser = argparse.ArgumentParser(prog="python -m migrations", description="Esquema versionado de la BBDD.")
+sub = parser.add_subparsers(dest="command", required=True)
+sub.add_parser("migrate", help="Aplica las migraciones pendientes.")
+sub.add_parser("status", help="Lista las migraciones aplicadas y pendientes.")
+seed_cmd = sub.add_parser("seed", help="Carga datos sintéticos en una BBDD vacía.")
+seed_cmd.add_argument("--orders", type=int, default=20000)
+seed_cmd.add_argument("--days", type=int, default=730)
+sub.add_parser("check-plans", help="EXPLAIN de las consultas calientes; falla si alguna recorre una tabla completa.")
+args = parser.parse_args()
+
+with db_connection() as conn:
+    if args.command == "migrate":
+        applied = migrations.migrate(conn)
+        print(f"Migraciones aplicadas: {applied or 'ninguna (al día)'}")
+    elif args.command == "status":
+        done = migrations.applied_versions(conn.cursor())
+        for migration in migrations.MIGRATIONS:
+            mark = "aplicada " if migration.VERSION in done else "pendiente"
+            print(f"{migration.VERSION:>4}  {mark}  {migration.DESCRIPTION}")
+    elif args.command == "seed":
+        migrations.migrate(conn)
+        print(f"Datos sintéticos cargados: {plans.seed(conn, orders=args.orders, days=args.days)}")
+    elif args.command == "check-plans":
+        failed = 0
+        for name, scans, plan in plans.check_plans(conn.cursor(dictionary=True)):
+            if scans:
+                failed += 1
+                print(f"FALLA  {name}: recorre completa {', '.join(scans)}")
+                for row in plan:
+                    print(f"         {row['table']}: type={row['type']} key={row['key']} rows={row['rows']} {row['Extra'] or ''}")
+            else:
+                keys = ", ".join(f"{row['table']}:{row['key']}" for row in plan if row['table'])
+                print(f"ok     {name} ({keys})")
+        if failed:
+            print(f"{failed} consulta(s) caliente(s) sin índice.")
+            sys.exit(1)
@@ -0,0 +1,36 @@
+# api/migrations/ddl.py
+"""
+Ayudas para escribir migraciones que se puedan repetir sin error: MySQL no
+tiene CREATE INDEX IF NOT EXISTS, así que los índices se crean después de
+revisar information_schema.
+"""
+
+INDEX_QUERY = """
+    SELECT index_name, GROUP_CONCAT(column_name ORDER BY seq_in_index)
+    FROM information_schema.statistics
+    WHERE table_schema = DATABASE() AND table_name = %s
+    GROUP BY index_name
+"""
+
+
+def existing_indexes(cursor, table):
+    """ {nombre del índice: [columnas en orden]} de una tabla (cursor de tuplas). """
+    cursor.execute(INDEX_QUERY, (table,))
+    return {name: columns.split(",") for name, columns in cursor.fetchall()}
+
+
+def ensure_index(cursor, table, name, columns):
+    """
+    Crea el índice si no existe uno con el mismo nombre o uno que ya empiece
+    por las mismas columnas (p. ej. el que MySQL crea para una llave foránea),
+    para no duplicar índices en una BBDD creada a mano. Devuelve True si lo creó.
+    """
+    indexes = existing_indexes(cursor, table)
+    if name in indexes:
+        return False
+    for existing in indexes.values():
+        if existing[:len(columns)] == list(columns):
+            return False
+    cursor.execute(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+    print(f"Índice creado: {table}.{name} ({', '.join(columns)})")
+    return True
@@ -0,0 +1,173 @@
+# api/migrations/m0001_base_schema.py
+"""
+Tablas base de la API tal como las usan los routers.
+
+La BBDD de producción se creó a mano antes de este paquete, así que aquí se
+usa CREATE TABLE IF NOT EXISTS: sobre ella la migración no cambia nada y solo
+queda registrada; sobre una BBDD vacía (local o de pruebas) crea el esquema.
+Solo se describen las columnas que lee o escribe la API; los índices para las
+consultas calientes van en m0003.
+"""
+
+VERSION = 1
+DESCRIPTION = "Esquema base (órdenes, pagos, inventario, personal y reservaciones)"
+
+TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS menu_categories (
+        category_id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        display_order INT NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS products (
+        product_id INT AUTO_INCREMENT PRIMARY KEY,
+        category_id INT NULL,
+        name VARCHAR(150) NOT NULL,
+        description TEXT NULL,
+        price DECIMAL(10,2) NOT NULL DEFAULT 0,
+        is_recommended TINYINT(1) NOT NULL DEFAULT 0,
+        is_available TINYINT(1) NOT NULL DEFAULT 1,
+        station VARCHAR(50) NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS restaurant_tables (
+        table_id INT AUTO_INCREMENT PRIMARY KEY,
+        table_name VARCHAR(50) NOT NULL,
+        status VARCHAR(20) NOT NULL DEFAULT 'Libre'
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INT AUTO_INCREMENT PRIMARY KEY,
+        full_name VARCHAR(150) NOT NULL,
+        email VARCHAR(150) NOT NULL UNIQUE,
+        password_hash VARCHAR(255) NULL,
+        pin_hash VARCHAR(255) NULL,
+        role_id INT NOT NULL,
+        is_active TINYINT(1) NOT NULL DEFAULT 1,
+        failed_login_attempts INT NOT NULL DEFAULT 0,
+        lockout_until DATETIME NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS customers (
+        customer_id INT AUTO_INCREMENT PRIMARY KEY,
+        full_name VARCHAR(150) NOT NULL,
+        phone VARCHAR(30) NULL,
+        email VARCHAR(150) NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS orders (
+        order_id INT AUTO_INCREMENT PRIMARY KEY,
+        order_folio VARCHAR(30) NOT NULL,
+        table_id INT NULL,
+        user_id INT NULL,
+        customer_id INT NULL,
+        status VARCHAR(20) NOT NULL DEFAULT 'Abierta',
+        is_priority TINYINT(1) NOT NULL DEFAULT 0,
+        created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        closed_at DATETIME NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS order_details (
+        detail_id INT AUTO_INCREMENT PRIMARY KEY,
+        order_id INT NOT NULL,
+        product_id INT NOT NULL,
+        quantity INT NOT NULL,
+        price_at_time_of_order DECIMAL(10,2) NOT NULL,
+        notes VARCHAR(255) NULL,
+        status VARCHAR(20) NOT NULL DEFAULT 'Pendiente'
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS payments (
+        payment_id INT AUTO_INCREMENT PRIMARY KEY,
+        order_id INT NOT NULL,
+        payment_method VARCHAR(50) NOT NULL,
+        amount DECIMAL(10,2) NOT NULL,
+        processed_by_user_id INT NULL,
+        payment_timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS supplies (
+        supply_id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(150) NOT NULL,
+        unit_of_measure VARCHAR(20) NULL,
+        current_stock DECIMAL(12,3) NOT NULL DEFAULT 0,
+        stock_threshold DECIMAL(12,3) NOT NULL DEFAULT 0,
+        price DECIMAL(10,2) NULL,
+        last_cost DECIMAL(12,4) NULL,
+        category_id INT NULL,
+        is_sellable TINYINT(1) NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS recipes (
+        recipe_id INT AUTO_INCREMENT PRIMARY KEY,
+        product_id INT NOT NULL,
+        supply_id INT NOT NULL,
+        quantity_used DECIMAL(12,4) NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stock_movements (
+        movement_id INT AUTO_INCREMENT PRIMARY KEY,
+        supply_id INT NOT NULL,
+        order_id INT NULL,
+        user_id INT NULL,
+        movement_type VARCHAR(50) NOT NULL,
+        quantity_change DECIMAL(12,3) NOT NULL,
+        reason VARCHAR(255) NULL,
+        movement_timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS audit_logs (
+        log_id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NULL,
+        action VARCHAR(50) NOT NULL,
+        details TEXT NULL,
+        log_timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS attendance_records (
+        record_id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        clock_in DATETIME NOT NULL,
+        clock_out DATETIME NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS reservations (
+        reservation_id INT AUTO_INCREMENT PRIMARY KEY,
+        customer_name VARCHAR(150) NOT NULL,
+        customer_email VARCHAR(150) NULL,
+        customer_phone VARCHAR(30) NULL,
+        num_people INT NOT NULL,
+        reservation_datetime DATETIME NOT NULL,
+        status VARCHAR(20) NOT NULL DEFAULT 'Pendiente',
+        created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS alerts (
+        alert_id INT AUTO_INCREMENT PRIMARY KEY,
+        alert_type VARCHAR(50) NOT NULL,
+        message TEXT NOT NULL,
+        is_read TINYINT(1) NOT NULL DEFAULT 0,
+        created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+
+
+def upgrade(cursor):
+    for statement in TABLES:
+        cursor.execute(statement)
@@ -0,0 +1,20 @@
+# api/migrations/m0002_support_tables.py
+"""
+Tablas de apoyo que antes se creaban una por una en el arranque de main.py.
+Cada módulo sigue siendo dueño de su definición; la migración solo las reúne.
+"""
+import cache_versions
+import folio_allocator
+import prep_telemetry
+import sales_rollup
+
+VERSION = 2
+DESCRIPTION = "Versiones de caché, folios, tiempos del KDS y resúmenes de ventas"
+
+
+def upgrade(cursor):
+    cursor.execute(cache_versions.CREATE_TABLE)
+    cursor.execute(folio_allocator.CREATE_TABLE)
+    cursor.execute(prep_telemetry.CREATE_TABLE)
+    for statement in sales_rollup.CREATE_TABLES:
+        cursor.execute(statement)
@@ -0,0 +1,40 @@
+# api/migrations/m0003_hot_query_indexes.py
+"""
+Índices compuestos para las consultas calientes registradas en plans.py.
+Las columnas de igualdad van primero y la de rango (fecha) al final.
+"""
+from migrations.ddl import ensure_index
+
+VERSION = 3
+DESCRIPTION = "Índices para las consultas calientes"
+
+INDEXES = [
+    # KDS, órdenes abiertas del POS y reconstrucción del resumen de ventas
+    ("orders", "idx_orders_status_created", ("status", "created_at")),
+    ("orders", "idx_orders_status_closed", ("status", "closed_at")),
+    # Historial del cliente
+    ("orders", "idx_orders_customer", ("customer_id", "status", "created_at")),
+    ("orders", "idx_orders_table", ("table_id", "status")),
+    ("order_details", "idx_order_details_order", ("order_id",)),
+    ("order_details", "idx_order_details_product", ("product_id",)),
+    ("payments", "idx_payments_timestamp", ("payment_timestamp",)),
+    ("payments", "idx_payments_order", ("order_id",)),
+    # Historial de un insumo y KPI de mermas
+    ("stock_movements", "idx_stock_movements_supply", ("supply_id", "movement_timestamp")),
+    ("stock_movements", "idx_stock_movements_type", ("movement_type", "movement_timestamp")),
+    ("audit_logs", "idx_audit_logs_timestamp", ("log_timestamp",)),
+    # Detección de cancelaciones anómalas en el POS
+    ("audit_logs", "idx_audit_logs_user_action", ("user_id", "action", "log_timestamp")),
+    ("attendance_records", "idx_attendance_clock_in", ("clock_in",)),
+    ("attendance_records", "idx_attendance_user_open", ("user_id", "clock_out")),
+    ("reservations", "idx_reservations_status_created", ("status", "created_at")),
+    ("reservations", "idx_reservations_datetime", ("reservation_datetime",)),
+    ("alerts", "idx_alerts_unread", ("is_read", "created_at")),
+    ("recipes", "idx_recipes_product", ("product_id",)),
+    ("recipes", "idx_recipes_supply", ("supply_id",)),
+]
+
+
+def upgrade(cursor):
+    for table, name, columns in INDEXES:
+        ensure_index(cursor, table, name, columns)
@@ -0,0 +1,10 @@
+# api/migrations/m0004_report_jobs.py
+""" Tabla de estado de los reportes en segundo plano (ver report_jobs.py). """
+import report_jobs
+
+VERSION = 4
+DESCRIPTION = "Reportes en segundo plano"
+
+
+def upgrade(cursor):
+    cursor.execute(report_jobs.CREATE_TABLE)
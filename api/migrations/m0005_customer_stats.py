@@ -0,0 +1,11 @@
+# api/migrations/m0005_customer_stats.py
+""" Métricas de por vida de los clientes (ver customer_stats.py); se llenan en m0006. """
+import customer_stats
+
+VERSION = 5
+DESCRIPTION = "Métricas de por vida de los clientes"
+
+
+def upgrade(cursor):
+    for statement in customer_stats.CREATE_TABLES:
+        cursor.execute(statement)
@@ -0,0 +1,21 @@
+# api/migrations/m0006_backfill_summaries.py
+"""
+Llena los resúmenes de ventas y las métricas de clientes con el historial, para
+que los reportes no salgan en cero en una BBDD que ya tenía ventas. Corre
+después de los índices de m0003 y con las mismas reconstrucciones por lotes
+que la línea de comandos (un mes o un rango de clientes por transacción), así
+que no bloquea las tablas en una sola transacción larga. Si se interrumpe, la
+próxima vez se repite completa sin duplicar nada.
+"""
+import datetime
+
+import customer_stats
+import sales_rollup
+
+VERSION = 6
+DESCRIPTION = "Resúmenes de ventas y métricas de clientes con el historial"
+
+
+def upgrade_in_batches(conn):
+    sales_rollup.rebuild(conn, sales_rollup.history_start(conn.cursor()), datetime.date.today())
+    customer_stats.rebuild(conn)
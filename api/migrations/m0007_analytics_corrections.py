@@ -0,0 +1,10 @@
+# api/migrations/m0007_analytics_corrections.py
+""" Cancelaciones de líneas pagadas pendientes de aplicar al cubo analítico (ver analytics_cube.py). """
+import analytics_cube
+
+VERSION = 7
+DESCRIPTION = "Correcciones del cubo analítico"
+
+
+def upgrade(cursor):
+    cursor.execute(analytics_cube.CREATE_TABLE)
@@ -0,0 +1,241 @@
+# api/migrations/plans.py
+"""
+Revisión de planes de ejecución de las consultas calientes.
+
+HOT_QUERIES registra las consultas que corren en cada servicio (KDS, POS,
+reportes del panel); check_plans() les hace EXPLAIN y marca las que recorren
+completa una tabla grande (type = ALL). Las tablas de catálogo pueden
+recorrerse completas sin problema.
+
+El optimizador de MySQL prefiere recorrer tablas casi vacías aunque haya
+índice, así que la revisión se corre sobre una BBDD local con datos
+sintéticos:
+
+    python -m migrations migrate
+    python -m migrations seed --orders 20000
+    python -m migrations check-plans
+
+check-plans termina con código 1 si alguna consulta registrada dejó de usar
+índice. La misma revisión corre con pytest (tests/test_query_plans.py) cuando
+DB_PLANS_TEST_DSN apunta a una BBDD local desechable. Al agregar una consulta caliente nueva, regístrala aquí.
+"""
+import random
+import datetime
+
+import kpi_engine
+from kds_board import LOAD_QUERY as KDS_BOARD_QUERY
+from kds_transitions import build_target_query
+from prep_telemetry import REHYDRATE_QUERY
+from sales_rollup import REBUILD_STATEMENTS
+
+SMALL_TABLES = {"products", "menu_categories", "restaurant_tables", "users", "supplies", "customers"}
+
+
+def hot_queries(today=None):
+    """ (nombre, sql, parámetros) de cada consulta caliente, con fechas relativas a hoy. """
+    today = today or datetime.date.today()
+    month_start = today.replace(day=1)
+    previous_month = (month_start - datetime.timedelta(days=1)).replace(day=1)
+    week_ago = today - datetime.timedelta(days=7)
+    return [
+        ("kds.tablero", KDS_BOARD_QUERY, ()),
+        ("kds.transicion_por_estacion", *build_target_query("Listo", station="Cocina")),
+        ("kds.telemetria", REHYDRATE_QUERY, (week_ago,)),
+        ("pos.ordenes_abiertas", """
+            SELECT o.order_id, o.order_folio, o.created_at, o.status,
+                   IFNULL(t.table_name, 'Para Llevar') as table_name
+            FROM orders o
+            LEFT JOIN restaurant_tables t ON o.table_id = t.table_id
+            WHERE o.status IN ('Abierta', 'Lista')
+            ORDER BY o.created_at ASC
+        """, ()),
+        ("pos.productos_de_orden",
+         "SELECT od.*, p.name, p.price FROM order_details od JOIN products p ON od.product_id = p.product_id WHERE od.order_id = %s",
+         (1,)),
+        ("pos.cancelaciones_anomalas",
+         "SELECT COUNT(*) as count FROM audit_logs WHERE user_id = %s AND action = 'CANCEL_ORDER_ITEM' AND log_timestamp > %s",
+         (1, datetime.datetime.combine(today, datetime.time()))),
+        ("clientes.historial", """
+            SELECT order_id, order_folio, created_at
+            FROM orders
+            WHERE customer_id = %s AND status = 'Pagada' AND (created_at < %s OR (created_at = %s AND order_id < %s))
+            ORDER BY created_at DESC, order_id DESC
+            LIMIT %s
+        """, (1, today, today, 1000000, 21)),
+        ("clientes.historial_lineas", """
+            SELECT od.order_id, p.name, od.quantity, od.price_at_time_of_order
+            FROM order_details od
+            JOIN products p ON od.product_id = p.product_id
+            WHERE od.order_id IN (%s, %s, %s)
+            ORDER BY od.order_id, od.detail_id
+        """, (1, 2, 3)),
+        ("asistencia.entrada_abierta",
+         "SELECT record_id FROM attendance_records WHERE user_id = %s AND clock_out IS NULL", (1,)),
+        ("asistencia.reporte", """
+            SELECT ar.record_id, ar.user_id, u.full_name, ar.clock_in, ar.clock_out
+            FROM attendance_records ar
+            JOIN users u ON ar.user_id = u.user_id
+            WHERE ar.clock_in >= %s AND ar.clock_in < %s + INTERVAL 1 DAY
+            ORDER BY ar.clock_in DESC
+        """, (week_ago, today)),
+        ("inventario.historial_insumo", """
+            SELECT sm.movement_timestamp, sm.movement_type, sm.quantity_change, sm.reason, u.full_name as user_name
+            FROM stock_movements sm
+            LEFT JOIN users u ON sm.user_id = u.user_id
+            WHERE sm.supply_id = %s
+            ORDER BY sm.movement_timestamp DESC
+        """, (1,)),
+        ("alertas.no_leidas", "SELECT * FROM alerts WHERE is_read = 0 ORDER BY created_at DESC", ()),
+        ("resumen.reconstruir_ventas", REBUILD_STATEMENTS[0][1], (previous_month, today)),
+        ("resumen.reconstruir_pagos", REBUILD_STATEMENTS[1][1], (previous_month, today)),
+    ] + [
+        # Una entrada por KPI declarado, con el par mes actual / mismo mes del año anterior
+        (f"reportes.kpi_{name}", *kpi_engine.build_query(
+            metric,
+            kpi_engine.period_bounds("month", today),
+            kpi_engine.comparison_bounds("month", kpi_engine.period_bounds("month", today), "year"),
+        ))
+        for name, metric in kpi_engine.KPI_METRICS.items() if "ratio" not in metric
+    ]
+
+
+def full_scans(plan):
+    """ Tablas grandes que el plan recorre completas. """
+    return [
+        row['table'] for row in plan
+        if row['type'] == 'ALL' and row['table'] not in SMALL_TABLES and not str(row['table']).startswith('<')
+    ]
+
+
+def check_plans(cursor, today=None):
+    """ EXPLAIN de cada consulta caliente (cursor de diccionario): [(nombre, tablas recorridas, plan)]. """
+    results = []
+    for name, sql, params in hot_queries(today):
+        cursor.execute("EXPLAIN " + sql, params)
+        plan = cursor.fetchall()
+        results.append((name, full_scans(plan), plan))
+    return results
+
+
+# --- Datos sintéticos ---
+
+STATIONS = ("Cocina", "Barra", "Parrilla")
+PAYMENT_METHODS = ("Efectivo", "Tarjeta", "Transferencia")
+RESERVATION_STATUSES = ("Pendiente", "Confirmada", "Cancelada")
+SEED_TABLES = (
+    "menu_categories", "products", "restaurant_tables", "users", "customers", "supplies", "recipes",
+    "orders", "order_details", "payments", "stock_movements", "kds_item_timings", "audit_logs",
+    "attendance_records", "reservations", "alerts",
+)
+
+
+def _insert(cursor, table, columns, rows, batch=1000):
+    query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+    for i in range(0, len(rows), batch):
+        cursor.executemany(query, rows[i:i + batch])
+
+
+def seed(conn, orders=20000, days=730, open_orders=40, seed_value=7):
+    """
+    Llena una BBDD vacía con `orders` órdenes repartidas en los últimos `days`
+    días (las `open_orders` más recientes quedan abiertas) y sus productos,
+    pagos, movimientos de inventario, bitácora, asistencia y reservaciones.
+    Se niega a correr si la tabla orders ya tiene datos.
+    """
+    rng = random.Random(seed_value)
+    now = datetime.datetime.now().replace(microsecond=0)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM orders")
+    if cursor.fetchone()[0]:
+        raise RuntimeError("La tabla orders ya tiene datos; seed solo corre sobre una BBDD vacía.")
+
+    _insert(cursor, "menu_categories", ("category_id", "name", "display_order"),
+            [(i, f"Categoría {i}", i) for i in range(1, 7)])
+    products = [(i, rng.randint(1, 6), f"Producto {i}", round(rng.uniform(40, 260), 2), STATIONS[i % len(STATIONS)])
+                for i in range(1, 61)]
+    _insert(cursor, "products", ("product_id", "category_id", "name", "price", "station"), products)
+    _insert(cursor, "restaurant_tables", ("table_id", "table_name"), [(i, f"Mesa {i}") for i in range(1, 16)])
+    _insert(cursor, "users", ("user_id", "full_name", "email", "role_id"),
+            [(i, f"Empleado {i}", f"empleado{i}@example.com", 1 + i % 3) for i in range(1, 21)])
+    _insert(cursor, "customers", ("customer_id", "full_name"), [(i, f"Cliente {i}") for i in range(1, 801)])
+    _insert(cursor, "supplies", ("supply_id", "name", "current_stock", "stock_threshold", "last_cost"),
+            [(i, f"Insumo {i}", rng.uniform(10, 500), 5, round(rng.uniform(0.5, 80), 4)) for i in range(1, 101)])
+    _insert(cursor, "recipes", ("product_id", "supply_id", "quantity_used"),
+            [(p[0], s, round(rng.uniform(0.05, 1.5), 4)) for p in products for s in rng.sample(range(1, 101), 3)])
+
+    order_rows, detail_rows, payment_rows, movement_rows, timing_rows = [], [], [], [], []
+    detail_id = 0
+    for order_id in range(1, orders + 1):
+        is_open = order_id > orders - open_orders
+        if is_open:
+            created_at = now - datetime.timedelta(minutes=rng.randint(1, 90))
+        else:
+            created_at = now - datetime.timedelta(days=rng.uniform(1, days))
+        created_at = created_at.replace(microsecond=0)
+        closed_at = None if is_open else created_at + datetime.timedelta(minutes=rng.randint(20, 150))
+        customer_id = rng.randint(1, 800) if rng.random() < 0.3 else None
+        order_rows.append((order_id, f"SEED-{order_id}", rng.randint(1, 15), rng.randint(1, 20), customer_id,
+                           "Abierta" if is_open else "Pagada", created_at, closed_at))
+        total = 0
+        for product in rng.sample(products, rng.randint(1, 5)):
+            detail_id += 1
+            quantity = rng.randint(1, 3)
+            total += quantity * product[3]
+            detail_rows.append((detail_id, order_id, product[0], quantity, product[3],
+                                "Pendiente" if is_open else "Listo"))
+            movement_rows.append((rng.randint(1, 100), order_id, None, "Venta", -quantity, None, created_at))
+            if is_open or created_at > now - datetime.timedelta(days=7):
+                timing_rows.append((detail_id, order_id, product[0], product[4], created_at,
+                                    None if is_open else created_at + datetime.timedelta(minutes=2),
+                                    None if is_open else created_at + datetime.timedelta(minutes=rng.randint(4, 20))))
+        if not is_open:
+            payment_rows.append((order_id, rng.choice(PAYMENT_METHODS), round(total, 2), closed_at))
+
+    for _ in range(orders // 5):
+        at = now - datetime.timedelta(days=rng.uniform(0, days), seconds=rng.randint(0, 3600))
+        kind = rng.choice(("Ajuste Merma", "Ajuste Corrección", "Entrada"))
+        change = rng.uniform(0.5, 20) * (-1 if kind == "Ajuste Merma" else 1)
+        movement_rows.append((rng.randint(1, 100), None, rng.randint(1, 20), kind, change, "Sintético", at.replace(microsecond=0)))
+
+    _insert(cursor, "orders", ("order_id", "order_folio", "table_id", "user_id", "customer_id", "status",
+                               "created_at", "closed_at"), order_rows)
+    _insert(cursor, "order_details", ("detail_id", "order_id", "product_id", "quantity",
+                                      "price_at_time_of_order", "status"), detail_rows)
+    _insert(cursor, "payments", ("order_id", "payment_method", "amount", "payment_timestamp"), payment_rows)
+    _insert(cursor, "stock_movements", ("supply_id", "order_id", "user_id", "movement_type", "quantity_change",
+                                        "reason", "movement_timestamp"), movement_rows)
+    _insert(cursor, "kds_item_timings", ("detail_id", "order_id", "product_id", "station", "queued_at",
+                                         "started_at", "ready_at"), timing_rows)
+
+    start = now - datetime.timedelta(days=days)
+    _insert(cursor, "audit_logs", ("user_id", "action", "details", "log_timestamp"), [
+        (rng.randint(1, 20), rng.choice(("CANCEL_ORDER_ITEM", "UPDATE_PRODUCT", "ADJUST_STOCK")), "Sintético",
+         start + datetime.timedelta(seconds=rng.randint(0, days * 86400)))
+        for _ in range(orders // 4)
+    ])
+    attendance = []
+    for day in range(days):
+        for user_id in range(1, 21):
+            if rng.random() < 0.7:
+                clock_in = (start + datetime.timedelta(days=day, hours=rng.randint(12, 17))).replace(microsecond=0)
+                attendance.append((user_id, clock_in, clock_in + datetime.timedelta(hours=rng.uniform(4, 9))))
+    _insert(cursor, "attendance_records", ("user_id", "clock_in", "clock_out"), attendance)
+    reservations = []
+    for i in range(orders // 4):
+        created = start + datetime.timedelta(seconds=rng.randint(0, days * 86400))
+        reservations.append((f"Cliente {i}", rng.randint(2, 10), created + datetime.timedelta(days=rng.randint(1, 20)),
+                             rng.choice(RESERVATION_STATUSES), created))
+    _insert(cursor, "reservations", ("customer_name", "num_people", "reservation_datetime", "status", "created_at"),
+            reservations)
+    _insert(cursor, "alerts", ("alert_type", "message", "is_read", "created_at"), [
+        ("stock", "Sintético", 1 if rng.random() < 0.98 else 0, start + datetime.timedelta(seconds=rng.randint(0, days * 86400)))
+        for _ in range(orders // 5)
+    ])
+    conn.commit()
+
+    # Estadísticas frescas para que el optimizador vea los tamaños reales
+    for table in SEED_TABLES:
+        cursor.execute(f"ANALYZE TABLE {table}")
+        cursor.fetchall()
+    return {"orders": len(order_rows), "order_details": len(detail_rows), "payments": len(payment_rows),
+            "stock_movements": len(movement_rows), "attendance_records": len(attendance)}
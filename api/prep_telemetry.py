@@ -0,0 +1,325 @@
+# api/prep_telemetry.py
+"""
+Telemetría de tiempos de preparación del KDS.
+
+Cada producto que entra al KDS tiene una fila en `kds_item_timings` con la hora
+en que se pidió (queued_at), en que se empezó (started_at) y en que quedó
+listo (ready_at), y quién hizo cada paso. Las transiciones del KDS sellan esas
+horas y, además, alimentan en memoria histogramas de latencia:
+
+  item_wait   pedido -> en preparación
+  item_prep   en preparación -> listo
+  item_total  pedido -> listo
+  ticket      la comanda de una estación: primer producto pedido -> último listo
+
+por producto, estación, hora del día y persona. Los histogramas usan buckets
+logarítmicos (~8% de error en los percentiles) y se guardan en franjas de
+KDS_TELEMETRY_SLOT_MINUTES, de modo que p50/p90/p99 de la última hora o del
+último día salen de sumar unas cuantas franjas, sin volver a leer
+order_details. Al iniciar la API las franjas se reconstruyen desde la tabla.
+"""
+import os
+import math
+import datetime
+import threading
+from collections import OrderedDict
+
+from query_metrics import get_registry
+
+KDS_TELEMETRY_SLOT_MINUTES = int(os.getenv("KDS_TELEMETRY_SLOT_MINUTES", "15"))
+KDS_TELEMETRY_RETENTION_HOURS = int(os.getenv("KDS_TELEMETRY_RETENTION_HOURS", "168"))
+
+METRICS = ("item_wait", "item_prep", "item_total", "ticket")
+DIMENSIONS = ("product", "station", "hour", "staff")
+UNASSIGNED_STAFF = "Sin asignar"
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS kds_item_timings (
+        detail_id INT NOT NULL PRIMARY KEY,
+        order_id INT NOT NULL,
+        product_id INT NOT NULL,
+        station VARCHAR(50) NULL,
+        queued_at DATETIME NOT NULL,
+        started_at DATETIME NULL,
+        started_by INT NULL,
+        ready_at DATETIME NULL,
+        ready_by INT NULL,
+        KEY idx_kds_item_timings_queued (queued_at),
+        KEY idx_kds_item_timings_order (order_id, station)
+    )
+"""
+
+
+# --- Histograma ---
+
+_GROWTH = 1.08
+_LOG_GROWTH = math.log(_GROWTH)
+
+
+def _bucket(seconds):
+    return 0 if seconds < 1 else int(math.log(seconds) / _LOG_GROWTH) + 1
+
+
+def _bucket_upper(index):
+    return 1.0 if index == 0 else _GROWTH ** index
+
+
+class LatencyHistogram:
+    """ Histograma disperso de duraciones en segundos con buckets logarítmicos. """
+
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        seconds = max(0.0, seconds)
+        index = _bucket(seconds)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        for index, n in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        rank = math.ceil(self.count * p / 100)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(_bucket_upper(index), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 1) if self.count else None,
+            "p50": _round(self.percentile(50)),
+            "p90": _round(self.percentile(90)),
+            "p99": _round(self.percentile(99)),
+            "max": _round(self.max) if self.count else None,
+        }
+
+
+def _round(value):
+    return round(value, 1) if value is not None else None
+
+
+# --- Almacén por franjas de tiempo ---
+
+class PrepTelemetry:
+
+    def __init__(self, slot_minutes=KDS_TELEMETRY_SLOT_MINUTES, retention_hours=KDS_TELEMETRY_RETENTION_HOURS):
+        self.slot_seconds = slot_minutes * 60
+        self.max_slots = max(1, retention_hours * 60 // slot_minutes)
+        self._slots = OrderedDict()  # inicio de franja (epoch) -> {(métrica, dimensión, clave): histograma}
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    def _slot_for(self, at):
+        epoch = int(at.timestamp())
+        return epoch - epoch % self.slot_seconds
+
+    def record(self, metric, seconds, at, product=None, station=None, staff=None, hour=None):
+        """ Registra una duración en todas sus dimensiones y en el total ('all'). """
+        keys = {
+            "all": "all",
+            "product": product,
+            "station": station,
+            "hour": hour if hour is not None else at.hour,
+            "staff": staff if staff is not None else UNASSIGNED_STAFF,
+        }
+        slot = self._slot_for(at)
+        with self._lock:
+            histograms = self._slots.get(slot)
+            if histograms is None:
+                newest = next(reversed(self._slots), None)
+                histograms = self._slots[slot] = {}
+                if newest is not None and slot < newest:
+                    # Registro atrasado (p. ej. al reconstruir): reordenar
+                    self._slots = OrderedDict(sorted(self._slots.items()))
+                while len(self._slots) > self.max_slots:
+                    self._slots.popitem(last=False)
+            for dimension, key in keys.items():
+                if key is None:
+                    continue
+                histogram = histograms.get((metric, dimension, key))
+                if histogram is None:
+                    histogram = histograms[(metric, dimension, key)] = LatencyHistogram()
+                histogram.record(seconds)
+            self.recorded += 1
+
+    def query(self, metric, dimension="all", minutes=60, now=None):
+        """ Percentiles por clave de la dimensión, sumando las franjas de los últimos `minutes`. """
+        now = now or datetime.datetime.now()
+        since = self._slot_for(now - datetime.timedelta(minutes=minutes))
+        merged = {}
+        with self._lock:
+            for slot, histograms in self._slots.items():
+                if slot < since:
+                    continue
+                for (m, d, key), histogram in histograms.items():
+                    if m != metric or d != dimension:
+                        continue
+                    merged.setdefault(key, LatencyHistogram()).merge(histogram)
+        rows = [{"key": key, **histogram.summary()} for key, histogram in merged.items()]
+        rows.sort(key=lambda r: r["p90"] or 0, reverse=True)
+        return rows
+
+    def stats(self):
+        return {"slots": len(self._slots), "recorded": self.recorded}
+
+
+prep_telemetry = PrepTelemetry()
+
+
+def _seconds(start, end):
+    return (end - start).total_seconds() if start and end else None
+
+
+def record_item_transition(rows, status, at, user_id=None):
+    """
+    Alimenta los histogramas con los productos que acaban de cambiar de
+    estado (filas de kds_transitions con queued_at/started_at previos).
+    """
+    for row in rows:
+        dims = {"product": row['name'], "station": row['station'], "staff": user_id,
+                "hour": row['queued_at'].hour if row.get('queued_at') else None}
+        if status == "En Preparación":
+            if row.get('started_at') is None:
+                wait = _seconds(row.get('queued_at'), at)
+                if wait is not None:
+                    prep_telemetry.record("item_wait", wait, at, **dims)
+        else:
+            started_at = row.get('started_at')
+            if started_at is not None:
+                prep_telemetry.record("item_prep", _seconds(started_at, at), at, **dims)
+            total = _seconds(row.get('queued_at'), at)
+            if total is not None:
+                prep_telemetry.record("item_total", total, at, **dims)
+
+
+def record_tickets(tickets, user_id=None):
+    """ Comandas (orden, estación) que quedaron completas. """
+    for ticket in tickets:
+        latency = _seconds(ticket['queued_at'], ticket['ready_at'])
+        if latency is not None:
+            prep_telemetry.record("ticket", latency, ticket['ready_at'], station=ticket['station'],
+                                  staff=user_id, hour=ticket['queued_at'].hour)
+
+
+# --- SQL ---
+
+def build_queue_insert(detail_ids, at):
+    """ Alta de los productos recién pedidos en kds_item_timings, en una sentencia. """
+    placeholders = ", ".join(["%s"] * len(detail_ids))
+    query = f"""
+        INSERT IGNORE INTO kds_item_timings (detail_id, order_id, product_id, station, queued_at)
+        SELECT od.detail_id, od.order_id, od.product_id, p.station, %s
+        FROM order_details od JOIN products p ON od.product_id = p.product_id
+        WHERE od.detail_id IN ({placeholders})
+    """
+    return query, [at] + list(detail_ids)
+
+
+def build_stamp_update(detail_ids, status, at, user_id=None):
+    """ Sella la hora (y la persona) del paso en los productos indicados. """
+    placeholders = ", ".join(["%s"] * len(detail_ids))
+    if status == "En Preparación":
+        sets = "started_at = COALESCE(started_at, %s), started_by = COALESCE(started_by, %s)"
+        params = [at, user_id]
+    else:
+        sets = "ready_at = %s, ready_by = %s"
+        params = [at, user_id]
+    query = f"UPDATE kds_item_timings SET {sets} WHERE detail_id IN ({placeholders})"
+    return query, params + list(detail_ids)
+
+
+def build_ticket_query(order_ids):
+    """
+    Por (orden, estación): primer pedido, último listo y productos aún pendientes.
+    Se une con order_details para no contar líneas canceladas (p. ej. filas
+    anteriores a que la cancelación borrara su registro de tiempos).
+    """
+    placeholders = ", ".join(["%s"] * len(order_ids))
+    query = f"""
+        SELECT t.order_id, t.station, MIN(t.queued_at) AS queued_at, MAX(t.ready_at) AS ready_at,
+               SUM(t.ready_at IS NULL) AS pending
+        FROM kds_item_timings t
+        JOIN order_details od ON od.detail_id = t.detail_id
+        WHERE t.order_id IN ({placeholders})
+        GROUP BY t.order_id, t.station
+    """
+    return query, list(order_ids)
+
+
+# Al cancelar una línea su registro de tiempos se borra en la misma transacción
+DELETE_TIMING = "DELETE FROM kds_item_timings WHERE detail_id = %s"
+
+
+def completed_tickets(ticket_rows, touched):
+    """ Comandas completas entre los pares (orden, estación) tocados en esta transición. """
+    return [t for t in ticket_rows if not t['pending'] and (t['order_id'], t['station']) in touched]
+
+
+REHYDRATE_QUERY = """
+    SELECT t.order_id, t.station, t.queued_at, t.started_at, t.started_by, t.ready_at, t.ready_by, p.name
+    FROM kds_item_timings t
+    JOIN products p ON t.product_id = p.product_id
+    JOIN order_details od ON od.detail_id = t.detail_id
+    WHERE t.queued_at >= %s
+    ORDER BY t.queued_at
+"""
+
+
+def rehydrate(cursor, now=None):
+    """ Reconstruye las franjas de memoria desde kds_item_timings (cursor síncrono de diccionario). """
+    now = now or datetime.datetime.now()
+    cursor.execute(REHYDRATE_QUERY, (now - datetime.timedelta(hours=KDS_TELEMETRY_RETENTION_HOURS),))
+    tickets = {}
+    for row in cursor.fetchall():
+        dims = {"product": row['name'], "station": row['station'], "hour": row['queued_at'].hour}
+        if row['started_at']:
+            prep_telemetry.record("item_wait", _seconds(row['queued_at'], row['started_at']), row['started_at'],
+                                  staff=row['started_by'], **dims)
+        if row['ready_at']:
+            if row['started_at']:
+                prep_telemetry.record("item_prep", _seconds(row['started_at'], row['ready_at']), row['ready_at'],
+                                      staff=row['ready_by'], **dims)
+            prep_telemetry.record("item_total", _seconds(row['queued_at'], row['ready_at']), row['ready_at'],
+                                  staff=row['ready_by'], **dims)
+        ticket = tickets.setdefault((row['order_id'], row['station']), {
+            "station": row['station'], "queued_at": row['queued_at'], "ready_at": None, "pending": 0, "ready_by": None,
+        })
+        if row['ready_at'] is None:
+            ticket["pending"] += 1
+        elif ticket["ready_at"] is None or row['ready_at'] >= ticket["ready_at"]:
+            ticket["ready_at"], ticket["ready_by"] = row['ready_at'], row['ready_by']
+    for ticket in tickets.values():
+        if not ticket["pending"] and ticket["ready_at"]:
+            record_tickets([ticket], ticket["ready_by"])
+    return prep_telemetry.stats()
+
+
+def _metrics():
+    samples = []
+    for row in prep_telemetry.query("item_total", "station", minutes=60):
+        for quantile in ("p50", "p90", "p99"):
+            samples.append(({"station": row["key"], "quantile": quantile}, row[quantile]))
+    return [
+        ("doppler_kds_item_latency_seconds", "gauge", "Latencia pedido -> listo por estación (última hora).", samples),
+    ]
+
+
+get_registry().register_collector(_metrics)
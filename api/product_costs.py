@@ -0,0 +1,125 @@
+# api/product_costs.py
+"""
+Índice en memoria del costo de receta de cada producto.
+
+El costo de un producto es SUM(quantity_used * last_cost) de su receta. Antes
+se recalculaba con subconsultas correlacionadas en cada reporte (cuatro veces
+por fila en el de rentabilidad); ahora se guarda por producto y solo se
+recalcula lo afectado:
+
+  * si cambia el last_cost de un insumo, los productos que lo usan;
+  * si cambia una receta (versión de recipe_cache), los productos cuya receta
+    es distinta.
+
+Las escrituras que cambian last_cost llaman invalidate(cursor) antes del
+COMMIT; igual que en recipe_cache, el contador en `cache_versions` avisa a los
+demás workers, que recargan los costos (una consulta a supplies) y comparan.
+Los cursores que reciben estas funciones deben ser de tipo diccionario.
+"""
+import time
+import threading
+
+import cache_versions
+from recipe_cache import recipe_cache, CHECK_INTERVAL
+from query_metrics import get_registry
+
+CACHE_NAME = "supply_costs"
+
+COSTS_QUERY = "SELECT supply_id, last_cost FROM supplies"
+
+
+def _as_float(value):
+    return float(value) if value is not None else 0.0
+
+
+class ProductCostIndex:
+
+    def __init__(self, check_interval=CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._supply_costs = {}
+        self._product_costs = {}
+        self._recipes = {}           # Recetas con las que se calcularon los costos
+        self._recipes_version = None
+        self._costs_version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.recomputed = 0
+
+    def _compute(self, product_id):
+        return sum(_as_float(qty) * self._supply_costs.get(supply_id, 0.0)
+                   for supply_id, qty in self._recipes.get(product_id, []))
+
+    def _recompute(self, product_ids):
+        for product_id in product_ids:
+            if product_id in self._recipes:
+                self._product_costs[product_id] = self._compute(product_id)
+            else:
+                self._product_costs.pop(product_id, None)
+        self.recomputed += len(product_ids)
+
+    def ensure_fresh(self, cursor, force=False):
+        """ Sincroniza con recetas y costos, recalculando solo los productos que cambiaron. """
+        recipe_cache.ensure_fresh(cursor, force=force)
+        with self._lock:
+            affected = set()
+
+            if recipe_cache.version != self._recipes_version or self._recipes_version is None:
+                new_recipes = recipe_cache.snapshot()
+                for product_id in set(new_recipes) | set(self._recipes):
+                    if new_recipes.get(product_id) != self._recipes.get(product_id):
+                        affected.add(product_id)
+                self._recipes = new_recipes
+                self._recipes_version = recipe_cache.version
+
+            if force or self._costs_version is None or time.monotonic() - self._checked_at > self.check_interval:
+                cursor.execute(cache_versions.VERSION_QUERY, (CACHE_NAME,))
+                version = cache_versions.version_from_row(cursor.fetchone())
+                if version != self._costs_version or force:
+                    cursor.execute(COSTS_QUERY)
+                    costs = {row['supply_id']: _as_float(row['last_cost']) for row in cursor.fetchall()}
+                    for supply_id in set(costs) | set(self._supply_costs):
+                        if costs.get(supply_id) != self._supply_costs.get(supply_id):
+                            affected.update(recipe_cache.products_using(supply_id))
+                    self._supply_costs = costs
+                    self._costs_version = version
+                self._checked_at = time.monotonic()
+
+            if affected:
+                self._recompute(affected)
+
+    def invalidate(self, cursor):
+        """
+        Avisa que cambió el last_cost de algún insumo. Llamar con el cursor de
+        la transacción que lo modificó, antes del COMMIT.
+        """
+        cache_versions.bump(cursor, CACHE_NAME)
+        with self._lock:
+            self._costs_version = None
+
+    # --- Lecturas ---
+    def cost(self, product_id):
+        """ Costo de receta del producto; 0 si no tiene receta. """
+        return self._product_costs.get(product_id, 0.0)
+
+    def products_with_recipe(self):
+        return list(self._product_costs)
+
+    def stats(self):
+        return {
+            "products": len(self._product_costs),
+            "supplies": len(self._supply_costs),
+            "recomputed": self.recomputed,
+        }
+
+
+product_costs = ProductCostIndex()
+
+
+def _metrics():
+    stats = product_costs.stats()
+    return [
+        ("doppler_product_costs_recomputed_total", "counter", "Costos de producto recalculados.", [({}, stats["recomputed"])]),
+    ]
+
+
+get_registry().register_collector(_metrics)
@@ -0,0 +1,255 @@
+# api/query_metrics.py
+"""
+Instrumentación de consultas SQL.
+
+database.py y async_database.py entregan cursores instrumentados que anotan
+cada sentencia en las estadísticas de la petición actual (guardadas en un
+ContextVar por el middleware de main.py). Al terminar la petición se agregan
+a los contadores globales que se exponen en /api/_metrics.
+"""
+import os
+import re
+import time
+import threading
+from contextvars import ContextVar
+
+# Número de veces que una misma forma de sentencia puede repetirse en una
+# petición antes de considerarla un posible N+1.
+NPLUS1_THRESHOLD = int(os.getenv("DB_NPLUS1_THRESHOLD", "10"))
+# Peticiones que pasan más de estos segundos en la BBDD se registran en el log
+# junto con sus SLOWEST_PER_REQUEST sentencias más lentas.
+SLOW_REQUEST_DB_SECONDS = float(os.getenv("DB_SLOW_REQUEST_SECONDS", "1.0"))
+SLOWEST_PER_REQUEST = 5
+# Etiqueta de las peticiones que no coinciden con ninguna ruta
+UNMATCHED_ROUTE = "<unmatched>"
+
+_current_stats = ContextVar("query_stats", default=None)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)")
+_VALUES_RE = re.compile(r"(VALUES\s*\(.*?\))(?:\s*,\s*\(.*?\))+", re.IGNORECASE)
+
+
+def normalize_statement(sql):
+    """
+    Reduce una sentencia a su "forma": sin literales, sin espacios repetidos y con
+    las listas IN / VALUES colapsadas, para poder detectar repeticiones.
+    """
+    if isinstance(sql, (bytes, bytearray)):
+        sql = sql.decode("utf-8", "replace")
+    shape = _WHITESPACE_RE.sub(" ", sql).strip().rstrip(";")
+    shape = _STRING_RE.sub("?", shape)
+    shape = _NUMBER_RE.sub("?", shape)
+    shape = _IN_LIST_RE.sub("(...)", shape)
+    shape = _VALUES_RE.sub(r"\1, ...", shape)
+    return shape
+
+
+class RequestQueryStats:
+    """ Estadísticas de las sentencias ejecutadas durante una petición. """
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes = {}        # forma -> [veces, segundos]
+        self.slowest = []       # [(segundos, forma)] de mayor a menor
+        self._lock = threading.Lock()
+
+    def record(self, shape, duration):
+        with self._lock:
+            self.count += 1
+            self.total_time += duration
+            entry = self.shapes.setdefault(shape, [0, 0.0])
+            entry[0] += 1
+            entry[1] += duration
+            self.slowest.append((duration, shape))
+            self.slowest.sort(key=lambda x: x[0], reverse=True)
+            del self.slowest[SLOWEST_PER_REQUEST:]
+
+    def repeated(self, threshold=NPLUS1_THRESHOLD):
+        """ Formas que se ejecutaron más de `threshold` veces en la petición. """
+        return {shape: v[0] for shape, v in self.shapes.items() if v[0] > threshold}
+
+    def server_timing(self):
+        """ Valor para la cabecera Server-Timing. """
+        return f'db;dur={self.total_time * 1000:.1f};desc="{self.count} queries"'
+
+
+def begin_request():
+    """ Inicia la recolección para la petición actual; devuelve (stats, token). """
+    stats = RequestQueryStats()
+    return stats, _current_stats.set(stats)
+
+
+def end_request(token):
+    _current_stats.reset(token)
+
+
+def record_statement(sql, duration):
+    shape = normalize_statement(sql)
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.record(shape, duration)
+    _registry.record_statement(shape, duration)
+
+
+# --- Agregados globales ---
+class MetricsRegistry:
+    """ Contadores acumulados de todo el proceso, en formato Prometheus. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.statements = {}   # forma -> [veces, segundos, máximo]
+        self.endpoints = {}    # (método, ruta) -> [peticiones, sentencias, segundos_bd, posibles_n+1]
+        self.extra_collectors = []
+
+    def record_statement(self, shape, duration):
+        with self._lock:
+            entry = self.statements.setdefault(shape, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += duration
+            entry[2] = max(entry[2], duration)
+
+    def record_request(self, method, path, stats):
+        with self._lock:
+            entry = self.endpoints.setdefault((method, path), [0, 0, 0.0, 0])
+            entry[0] += 1
+            entry[1] += stats.count
+            entry[2] += stats.total_time
+            if stats.repeated():
+                entry[3] += 1
+
+    def register_collector(self, collector):
+        """
+        Registra una función que devuelve [(nombre, tipo, ayuda, [(etiquetas, valor)])]
+        para que otros módulos (pool, cachés) publiquen sus métricas aquí.
+        """
+        self.extra_collectors.append(collector)
+
+    def render_prometheus(self, top_statements=50):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+            statements = sorted(self.statements.items(), key=lambda kv: kv[1][1], reverse=True)[:top_statements]
+
+        ep_labels = [({"method": m, "path": p}, v) for (m, p), v in endpoints]
+        metric("doppler_http_requests_total", "counter", "Peticiones atendidas por endpoint.",
+               [(l, v[0]) for l, v in ep_labels])
+        metric("doppler_db_queries_total", "counter", "Sentencias SQL ejecutadas por endpoint.",
+               [(l, v[1]) for l, v in ep_labels])
+        metric("doppler_db_time_seconds_total", "counter", "Tiempo total en la BBDD por endpoint.",
+               [(l, round(v[2], 6)) for l, v in ep_labels])
+        metric("doppler_db_nplus1_requests_total", "counter", "Peticiones con sentencias repetidas (posible N+1).",
+               [(l, v[3]) for l, v in ep_labels])
+
+        st_labels = [({"statement": shape}, v) for shape, v in statements]
+        metric("doppler_db_statement_executions_total", "counter", "Ejecuciones por forma de sentencia.",
+               [(l, v[0]) for l, v in st_labels])
+        metric("doppler_db_statement_seconds_total", "counter", "Tiempo acumulado por forma de sentencia.",
+               [(l, round(v[1], 6)) for l, v in st_labels])
+        metric("doppler_db_statement_max_seconds", "gauge", "Ejecución más lenta por forma de sentencia.",
+               [(l, round(v[2], 6)) for l, v in st_labels])
+
+        for collector in self.extra_collectors:
+            try:
+                for name, kind, help_text, samples in collector():
+                    metric(name, kind, help_text, samples)
+            except Exception as e:
+                print(f"Error en un colector de métricas: {e}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry():
+    return _registry
+
+
+def finish_request(method, path, stats):
+    """ Agrega la petición y avisa si alguna sentencia se repitió demasiado o si fue lenta en la BBDD. """
+    _registry.record_request(method, path, stats)
+    for shape, times in stats.repeated().items():
+        print(f"ADVERTENCIA: posible N+1 en {method} {path}: la sentencia se ejecutó {times} veces -> {shape[:200]}")
+    if stats.total_time > SLOW_REQUEST_DB_SECONDS:
+        print(f"ADVERTENCIA: {method} {path} pasó {stats.total_time:.2f} s en la BBDD ({stats.count} sentencias). Las más lentas:")
+        for duration, shape in stats.slowest:
+            print(f"    {duration * 1000:.1f} ms -> {shape[:200]}")
+
+
+# --- Cursores instrumentados ---
+class InstrumentedCursor:
+    """ Envoltura de un cursor síncrono que mide cada execute/executemany. """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            record_statement(operation, time.perf_counter() - start)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            record_statement(operation, time.perf_counter() - start)
+
+
+class AsyncInstrumentedCursor:
+    """ Envoltura de un cursor de mysql.connector.aio que mide cada sentencia. """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._cursor.close()
+
+    async def execute(self, operation, params=None, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            record_statement(operation, time.perf_counter() - start)
+
+    async def executemany(self, operation, seq_params, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            record_statement(operation, time.perf_counter() - start)
@@ -0,0 +1,137 @@
+# api/recipe_cache.py
+"""
+Caché en memoria de recetas (lista de materiales por producto).
+
+La tabla `recipes` se lee en cada venta pero solo cambia cuando alguien edita
+una receta, así que se carga una vez como product_id -> [(supply_id,
+quantity_used)] y se recarga cuando cambia su versión en `cache_versions`.
+Los cursores que reciben estas funciones deben ser de tipo diccionario.
+"""
+import os
+import time
+import threading
+
+import cache_versions
+from query_metrics import get_registry
+
+CACHE_NAME = "recipes"
+# Cada cuántos segundos se consulta la versión en la BBDD para detectar
+# cambios hechos por otros workers.
+CHECK_INTERVAL = float(os.getenv("RECIPE_CACHE_CHECK_SECONDS", "2"))
+
+LOAD_QUERY = "SELECT product_id, supply_id, quantity_used FROM recipes ORDER BY product_id, supply_id"
+
+
+class RecipeCache:
+
+    def __init__(self, check_interval=CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._recipes = {}
+        self._version = None       # None = nunca cargada o invalidada localmente
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    # --- Frescura ---
+    def _needs_check(self, force):
+        return force or self._version is None or time.monotonic() - self._checked_at > self.check_interval
+
+    def _load(self, version, rows):
+        recipes = {}
+        for row in rows:
+            recipes.setdefault(row['product_id'], []).append((row['supply_id'], row['quantity_used']))
+        with self._lock:
+            self._recipes = recipes
+            self._version = version
+            self._checked_at = time.monotonic()
+            self.reloads += 1
+
+    def ensure_fresh(self, cursor, force=False):
+        """ Revisa la versión (a lo más cada `check_interval` s) y recarga si cambió. """
+        if not self._needs_check(force):
+            self.hits += 1
+            return
+        cursor.execute(cache_versions.VERSION_QUERY, (CACHE_NAME,))
+        version = cache_versions.version_from_row(cursor.fetchone())
+        if version == self._version and not force:
+            self._checked_at = time.monotonic()
+            self.hits += 1
+            return
+        self.misses += 1
+        cursor.execute(LOAD_QUERY)
+        self._load(version, cursor.fetchall())
+
+    async def ensure_fresh_async(self, cursor, force=False):
+        """ Igual que ensure_fresh, para los cursores de mysql.connector.aio. """
+        if not self._needs_check(force):
+            self.hits += 1
+            return
+        await cursor.execute(cache_versions.VERSION_QUERY, (CACHE_NAME,))
+        version = cache_versions.version_from_row(await cursor.fetchone())
+        if version == self._version and not force:
+            self._checked_at = time.monotonic()
+            self.hits += 1
+            return
+        self.misses += 1
+        await cursor.execute(LOAD_QUERY)
+        self._load(version, await cursor.fetchall())
+
+    def invalidate(self, cursor):
+        """
+        Marca la caché como obsoleta en todos los workers. Debe llamarse con el
+        cursor de la transacción que modificó `recipes`, antes del commit.
+        """
+        cache_versions.bump(cursor, CACHE_NAME)
+        with self._lock:
+            self._version = None
+
+    # --- Lecturas ---
+    @property
+    def version(self):
+        return self._version
+
+    def snapshot(self):
+        """ Diccionario product_id -> receta actual; se reemplaza completo al recargar, no se muta. """
+        return self._recipes
+
+    def get(self, product_id):
+        """ Receta de un producto como [(supply_id, quantity_used)]; [] si no tiene. """
+        return self._recipes.get(product_id, [])
+
+    def products_using(self, supply_id):
+        """ Productos cuya receta incluye el insumo. """
+        return [pid for pid, items in self._recipes.items() if any(s == supply_id for s, _ in items)]
+
+    def bill_of_materials(self, lines):
+        """ Suma [(product_id, quantity)] en {supply_id: cantidad total requerida}. """
+        bom = {}
+        for product_id, quantity in lines:
+            for supply_id, quantity_used in self._recipes.get(product_id, []):
+                bom[supply_id] = bom.get(supply_id, 0) + quantity_used * quantity
+        return bom
+
+    def stats(self):
+        return {
+            "version": self._version,
+            "products": len(self._recipes),
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+        }
+
+
+recipe_cache = RecipeCache()
+
+
+def _metrics():
+    stats = recipe_cache.stats()
+    return [
+        ("doppler_recipe_cache_hits_total", "counter", "Accesos servidos desde la caché de recetas.", [({}, stats["hits"])]),
+        ("doppler_recipe_cache_misses_total", "counter", "Accesos que obligaron a recargar recetas.", [({}, stats["misses"])]),
+        ("doppler_recipe_cache_products", "gauge", "Productos con receta en caché.", [({}, stats["products"])]),
+    ]
+
+
+get_registry().register_collector(_metrics)
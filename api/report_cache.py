@@ -0,0 +1,216 @@
+# api/report_cache.py
+"""
+Caché de resultados de reportes por periodo.
+
+Un reporte sobre días que ya terminaron (corte de caja, clientes frecuentes,
+asistencia) no cambia, así que su resultado se guarda por endpoint +
+parámetros normalizados:
+
+  * Si el rango termina antes de hoy, el resultado no caduca; además se
+    escribe en disco (REPORT_CACHE_DIR) para sobrevivir reinicios.
+  * Si el rango toca hoy (o el futuro), se guarda solo en memoria por
+    REPORT_CACHE_TODAY_TTL segundos.
+
+Las escrituras tardías sobre días pasados (una cancelación sobre una orden ya
+pagada, una salida de turno después de medianoche, la reconstrucción de los
+resúmenes, borrar un cliente) llaman a note_write() en su transacción, que
+incrementa la versión de la fuente ('report:sales', 'report:attendance',
+'report:customers') en `cache_versions`; los resultados guardados con otra
+versión se descartan en todos los workers.
+"""
+import os
+import json
+import time
+import hashlib
+import datetime
+import threading
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from fastapi.encoders import jsonable_encoder
+
+import cache_versions
+from query_metrics import get_registry
+
+REPORT_CACHE_TODAY_TTL = float(os.getenv("REPORT_CACHE_TODAY_TTL", "60"))
+REPORT_CACHE_MAX_ENTRIES = int(os.getenv("REPORT_CACHE_MAX_ENTRIES", "500"))
+# Carpeta del nivel en disco; vacía para desactivarlo.
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".report_cache"))
+# Cada cuántos segundos se consultan las versiones en la BBDD (como recipe_cache).
+CHECK_INTERVAL = float(os.getenv("REPORT_CACHE_CHECK_SECONDS", "2"))
+
+SOURCE_PREFIX = "report:"
+VERSIONS_QUERY = "SELECT cache_name, version FROM cache_versions WHERE cache_name LIKE 'report:%'"
+
+
+def make_key(endpoint, params):
+    """ Llave estable: endpoint + parámetros sin los vacíos, ordenados y con fechas en ISO. """
+    normalized = {}
+    for name, value in params.items():
+        if value is None:
+            continue
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            value = value.isoformat()
+        normalized[name] = str(value).strip()
+    return f"{endpoint}?{urlencode(sorted(normalized.items()))}"
+
+
+def _as_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+class ReportCache:
+
+    def __init__(self, directory=REPORT_CACHE_DIR, today_ttl=REPORT_CACHE_TODAY_TTL,
+                 max_entries=REPORT_CACHE_MAX_ENTRIES, check_interval=CHECK_INTERVAL):
+        self.directory = directory
+        self.today_ttl = today_ttl
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self._entries = OrderedDict()  # llave -> {"versions", "expires_at", "value"}
+        self._versions = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.stale = 0
+
+    # --- Versiones de las fuentes ---
+    def _refresh_versions(self, cursor):
+        if time.monotonic() - self._checked_at <= self.check_interval:
+            return
+        cursor.execute(VERSIONS_QUERY)
+        self._versions = {row['cache_name']: int(row['version']) for row in cursor.fetchall()}
+        self._checked_at = time.monotonic()
+
+    def _current(self, sources):
+        return {source: self._versions.get(SOURCE_PREFIX + source, 0) for source in sources}
+
+    def note_write(self, cursor, source, day=None):
+        """
+        Avisa de una escritura que cambia los datos de `source` en `day` (None =
+        sin fecha, p. ej. el nombre de un cliente). Si el día ya pasó invalida
+        los resultados guardados de esa fuente en todos los workers; los de hoy
+        ya caducan solos. Llamar con el cursor de la transacción de escritura.
+        """
+        day = _as_date(day) if day is not None else None
+        if day is not None and day >= datetime.date.today():
+            return
+        cache_versions.bump(cursor, SOURCE_PREFIX + source)
+        self._checked_at = 0.0
+
+    # --- Niveles ---
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+    def _read_disk(self, key):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("key") == key else None
+
+    def _write_disk(self, key, entry):
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(key)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"key": key, **entry}, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"No se pudo guardar el reporte en disco: {e}")
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _valid(self, entry, versions):
+        if entry["versions"] != versions:
+            self.stale += 1
+            return False
+        return entry["expires_at"] is None or entry["expires_at"] > time.time()
+
+    # --- Uso desde los routers ---
+    def fetch(self, cursor, endpoint, params, last_day, sources, compute):
+        """
+        Resultado del reporte `endpoint` con `params`, desde la caché o llamando
+        a compute(). `last_day` es el último día del rango (decide si el
+        resultado caduca) y `sources` las fuentes de las que depende. El cursor
+        debe ser de tipo diccionario.
+        """
+        key = make_key(endpoint, params)
+        self._refresh_versions(cursor)
+        versions = self._current(sources)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None and self._valid(entry, versions):
+            self.hits_memory += 1
+            return entry["value"]
+        entry = self._read_disk(key)
+        if entry is not None and self._valid(entry, versions):
+            self.hits_disk += 1
+            self._remember(key, entry)
+            return entry["value"]
+
+        self.misses += 1
+        value = jsonable_encoder(compute())
+        last_day = _as_date(last_day)
+        closed = last_day is not None and last_day < datetime.date.today()
+        entry = {"versions": versions, "expires_at": None if closed else time.time() + self.today_ttl, "value": value}
+        self._remember(key, entry)
+        if closed:
+            self._write_disk(key, entry)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_ratio": round((self.hits_memory + self.hits_disk) / lookups, 4) if lookups else 0,
+        }
+
+
+report_cache = ReportCache()
+
+
+def _metrics():
+    stats = report_cache.stats()
+    return [
+        ("doppler_report_cache_lookups_total", "counter", "Consultas a la caché de reportes por resultado.", [
+            ({"result": "hit_memory"}, stats["hits_memory"]),
+            ({"result": "hit_disk"}, stats["hits_disk"]),
+            ({"result": "miss"}, stats["misses"]),
+        ]),
+        ("doppler_report_cache_entries", "gauge", "Reportes guardados en memoria.", [({}, stats["entries"])]),
+    ]
+
+
+get_registry().register_collector(_metrics)
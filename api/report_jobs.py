@@ -0,0 +1,346 @@
+# api/report_jobs.py
+"""
+Reportes pesados en segundo plano.
+
+POST /api/report-jobs devuelve un job_id de inmediato; el reporte corre en un
+pool acotado de hilos (REPORT_JOB_WORKERS) fuera de la petición, con su propia
+conexión, y el resultado se guarda comprimido en REPORT_JOB_DIR para pedirlo
+después por id. El estado y el avance viven en la tabla `report_jobs`, así que
+cualquier worker de uvicorn puede responder la consulta de estado.
+
+Dos envíos con el mismo tipo y parámetros mientras el primero sigue en cola o
+en proceso se juntan en el mismo trabajo, aunque lleguen a workers distintos:
+la búsqueda del trabajo activo y el INSERT se hacen con GET_LOCK sobre el hash
+de los parámetros. Mientras un trabajo está en cola o
+en proceso, su worker renueva `updated_at` cada REPORT_JOB_HEARTBEAT_SECONDS
+(aunque la consulta no informe avance). Si deja de renovarlo por
+REPORT_JOB_STALE_SECONDS, p. ej. porque su worker se reinició, se considera
+abandonado y un envío nuevo lo reemplaza.
+
+Los routers registran sus reportes con register(kind, fn), donde
+fn(conn, params, progress) devuelve las filas (de preferencia un iterable
+como el de collect(), que se escribe al archivo sin armar la lista completa en
+memoria) y llama progress(fracción).
+"""
+import os
+import json
+import gzip
+import time
+import uuid
+import hashlib
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.encoders import jsonable_encoder
+
+from database import db_connection
+from report_cache import make_key
+from query_metrics import get_registry
+
+REPORT_JOB_WORKERS = int(os.getenv("REPORT_JOB_WORKERS", "2"))
+REPORT_JOB_MAX_PENDING = int(os.getenv("REPORT_JOB_MAX_PENDING", "20"))
+REPORT_JOB_DIR = os.getenv("REPORT_JOB_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".report_jobs"))
+REPORT_JOB_RETENTION_HOURS = int(os.getenv("REPORT_JOB_RETENTION_HOURS", "24"))
+REPORT_JOB_STALE_SECONDS = int(os.getenv("REPORT_JOB_STALE_SECONDS", "600"))
+REPORT_JOB_HEARTBEAT_SECONDS = float(os.getenv("REPORT_JOB_HEARTBEAT_SECONDS", "60"))
+# Cada cuántos segundos se escribe el avance en la tabla
+PROGRESS_INTERVAL = float(os.getenv("REPORT_JOB_PROGRESS_SECONDS", "1"))
+FETCH_BATCH_ROWS = 2000
+SUBMIT_LOCK_TIMEOUT_SECONDS = 10
+
+QUEUED, RUNNING, DONE, FAILED = "en_cola", "en_proceso", "terminado", "error"
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS report_jobs (
+        job_id CHAR(32) NOT NULL PRIMARY KEY,
+        kind VARCHAR(50) NOT NULL,
+        params TEXT NOT NULL,
+        params_hash CHAR(40) NOT NULL,
+        status VARCHAR(20) NOT NULL,
+        progress DECIMAL(5,4) NOT NULL DEFAULT 0,
+        row_count INT NULL,
+        error VARCHAR(500) NULL,
+        created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        started_at DATETIME NULL,
+        finished_at DATETIME NULL,
+        updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        KEY idx_report_jobs_hash (params_hash, status),
+        KEY idx_report_jobs_finished (finished_at)
+    )
+"""
+
+ACTIVE_QUERY = f"""
+    SELECT job_id FROM report_jobs
+    WHERE params_hash = %s AND status IN ('{QUEUED}', '{RUNNING}')
+      AND updated_at > NOW() - INTERVAL %s SECOND
+    ORDER BY created_at DESC LIMIT 1
+"""
+
+STATUS_QUERY = """
+    SELECT job_id, kind, params, status, progress, row_count, error,
+           created_at, started_at, finished_at, updated_at
+    FROM report_jobs WHERE job_id = %s
+"""
+
+_kinds = {}
+
+
+def register(kind, fn):
+    """ Registra un reporte que puede correr en segundo plano. """
+    _kinds[kind] = fn
+
+
+def kinds():
+    return sorted(_kinds)
+
+
+class TooManyJobsError(Exception):
+    """
+    Se lanza cuando ya hay REPORT_JOB_MAX_PENDING trabajos en este worker o
+    cuando un envío igual retiene el candado más de SUBMIT_LOCK_TIMEOUT_SECONDS.
+    """
+
+
+def collect(cursor, query, params, progress, total=None, batch_rows=FETCH_BATCH_ROWS):
+    """
+    Generador con las filas de `query`, leídas por lotes, informando el avance
+    si se conoce el total de filas (p. ej. con un COUNT previo). Para los fn
+    registrados; el cursor debe seguir abierto mientras se recorre.
+    """
+    cursor.execute(query, params)
+    read = 0
+    while True:
+        batch = cursor.fetchmany(batch_rows)
+        if not batch:
+            break
+        yield from batch
+        read += len(batch)
+        if total:
+            progress(min(read / total, 0.99))
+
+
+def _write_rows(f, rows):
+    """ Escribe `rows` como un arreglo JSON fila por fila; devuelve cuántas escribió. """
+    count = 0
+    f.write("[")
+    for row in rows:
+        if count:
+            f.write(",")
+        json.dump(jsonable_encoder(row), f)
+        count += 1
+    f.write("]")
+    return count
+
+
+class ReportJobRunner:
+
+    def __init__(self, workers=REPORT_JOB_WORKERS, max_pending=REPORT_JOB_MAX_PENDING, directory=REPORT_JOB_DIR):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.directory = directory
+        self._executor = None
+        self._pending = {}  # job_id -> Future (solo los de este worker)
+        self._lock = threading.Lock()
+        self._heartbeat = None
+        self._stopping = threading.Event()
+        self.submitted = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="report-job")
+        return self._executor
+
+    def result_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json.gz")
+
+    # --- Envío ---
+    def submit(self, kind, params):
+        """
+        Encola el reporte o devuelve el trabajo activo con los mismos parámetros.
+        Regresa (job_id, coalesced). Lanza KeyError si el tipo no existe y
+        TooManyJobsError si la cola de este worker está llena.
+        """
+        if kind not in _kinds:
+            raise KeyError(kind)
+        params_hash = hashlib.sha1(make_key(kind, params).encode()).hexdigest()
+        lock_name = f"report_job:{params_hash}"
+        with self._lock:
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                # Serializa los envíos iguales entre workers, no solo entre hilos
+                cursor.execute("SELECT GET_LOCK(%s, %s)", (lock_name, SUBMIT_LOCK_TIMEOUT_SECONDS))
+                if cursor.fetchone()[0] != 1:
+                    raise TooManyJobsError()
+                try:
+                    cursor.execute(ACTIVE_QUERY, (params_hash, REPORT_JOB_STALE_SECONDS))
+                    row = cursor.fetchone()
+                    if row:
+                        self.coalesced += 1
+                        return row[0], True
+                    self._prune()
+                    if len(self._pending) >= self.max_pending:
+                        raise TooManyJobsError()
+                    job_id = uuid.uuid4().hex
+                    cursor.execute(
+                        "INSERT INTO report_jobs (job_id, kind, params, params_hash, status) VALUES (%s, %s, %s, %s, %s)",
+                        (job_id, kind, json.dumps(jsonable_encoder(params)), params_hash, QUEUED)
+                    )
+                    conn.commit()
+                finally:
+                    cursor.execute("SELECT RELEASE_LOCK(%s)", (lock_name,))
+                    cursor.fetchone()
+            self._pending[job_id] = self._pool().submit(self._run, job_id, kind, params)
+            self.submitted += 1
+            self._start_heartbeat()
+        return job_id, False
+
+    # --- Latido ---
+    def _start_heartbeat(self):
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(target=self._beat, name="report-job-heartbeat", daemon=True)
+            self._heartbeat.start()
+
+    def _beat(self):
+        """ Renueva updated_at de los trabajos en cola o en proceso de este worker. """
+        while not self._stopping.wait(REPORT_JOB_HEARTBEAT_SECONDS):
+            with self._lock:
+                self._prune()
+                job_ids = list(self._pending)
+            if not job_ids:
+                continue
+            try:
+                self._update_many(job_ids, "updated_at = NOW()", ())
+            except Exception as e:
+                print(f"Error al renovar los reportes en segundo plano: {e}")
+
+    def _prune(self):
+        for job_id in [j for j, future in self._pending.items() if future.done()]:
+            del self._pending[job_id]
+
+    # --- Ejecución (en el pool) ---
+    def _update(self, job_id, sets, params):
+        with db_connection() as conn:
+            conn.cursor().execute(f"UPDATE report_jobs SET {sets} WHERE job_id = %s", (*params, job_id))
+            conn.commit()
+
+    def _update_many(self, job_ids, sets, params):
+        placeholders = ", ".join(["%s"] * len(job_ids))
+        with db_connection() as conn:
+            conn.cursor().execute(
+                f"UPDATE report_jobs SET {sets} WHERE job_id IN ({placeholders}) AND status IN ('{QUEUED}', '{RUNNING}')",
+                (*params, *job_ids)
+            )
+            conn.commit()
+
+    def _run(self, job_id, kind, params):
+        last = [0.0]
+
+        def progress(fraction):
+            # También sirve de latido para que el trabajo no se considere abandonado
+            now = time.monotonic()
+            if now - last[0] >= PROGRESS_INTERVAL:
+                last[0] = now
+                self._update(job_id, "progress = %s", (round(max(0.0, min(fraction, 1.0)), 4),))
+
+        try:
+            self._update(job_id, "status = %s, started_at = NOW()", (RUNNING,))
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = f"{self.result_path(job_id)}.tmp"
+            # Las filas se escriben conforme se leen; la conexión sigue abierta hasta el final
+            with db_connection() as conn, gzip.open(tmp, "wt", encoding="utf-8") as f:
+                row_count = _write_rows(f, _kinds[kind](conn, params, progress))
+            os.replace(tmp, self.result_path(job_id))
+            self._update(job_id, "status = %s, progress = 1, row_count = %s, finished_at = NOW()", (DONE, row_count))
+            self.completed += 1
+        except Exception as e:
+            print(f"Error en el reporte en segundo plano {kind} ({job_id}): {e}")
+            self.failed += 1
+            try:
+                self._update(job_id, "status = %s, error = %s, finished_at = NOW()", (FAILED, str(e)[:500]))
+            except Exception as update_error:
+                print(f"No se pudo registrar el error del reporte {job_id}: {update_error}")
+
+    # --- Consulta ---
+    def status(self, job_id):
+        """ Estado del trabajo (diccionario) o None si no existe. """
+        with db_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(STATUS_QUERY, (job_id,))
+            job = cursor.fetchone()
+        if job is None:
+            return None
+        job["params"] = json.loads(job["params"])
+        job["progress"] = float(job["progress"])
+        if job["status"] in (QUEUED, RUNNING) and job["updated_at"] < datetime.datetime.now() - datetime.timedelta(seconds=REPORT_JOB_STALE_SECONDS):
+            job["status"] = FAILED
+            job["error"] = "El trabajo dejó de reportar avance."
+        return job
+
+    def purge(self, retention_hours=REPORT_JOB_RETENTION_HOURS):
+        """ Tarea programada: borra trabajos y resultados más viejos que la retención. """
+        try:
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT job_id FROM report_jobs WHERE created_at < NOW() - INTERVAL %s HOUR",
+                    (retention_hours,)
+                )
+                job_ids = [row[0] for row in cursor.fetchall()]
+                for job_id in job_ids:
+                    try:
+                        os.remove(self.result_path(job_id))
+                    except FileNotFoundError:
+                        pass
+                if job_ids:
+                    cursor.execute(
+                        f"DELETE FROM report_jobs WHERE job_id IN ({', '.join(['%s'] * len(job_ids))})", job_ids
+                    )
+                conn.commit()
+            if job_ids:
+                print(f"Reportes en segundo plano depurados: {len(job_ids)}")
+        except Exception as e:
+            print(f"Error al depurar los reportes en segundo plano: {e}")
+
+    def shutdown(self):
+        self._stopping.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            self._prune()
+            pending = len(self._pending)
+        return {
+            "workers": self.workers,
+            "pending": pending,
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+report_jobs = ReportJobRunner()
+
+
+def purge_report_jobs():
+    report_jobs.purge()
+
+
+def _metrics():
+    stats = report_jobs.stats()
+    return [
+        ("doppler_report_jobs_pending", "gauge", "Reportes en cola o en proceso en este worker.", [({}, stats["pending"])]),
+        ("doppler_report_jobs_total", "counter", "Reportes en segundo plano por resultado.", [
+            ({"result": "completed"}, stats["completed"]),
+            ({"result": "failed"}, stats["failed"]),
+            ({"result": "coalesced"}, stats["coalesced"]),
+        ]),
+    ]
+
+
+get_registry().register_collector(_metrics)
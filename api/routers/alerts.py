@@ -1,18 +1,21 @@
 # api/routers/alerts.py
 from fastapi import APIRouter, HTTPException
 from database import get_db_connection
+import dashboard_widgets
 
 router = APIRouter()
 
+def _unread_alerts(cursor):
+    cursor.execute("SELECT * FROM alerts WHERE is_read = 0 ORDER BY created_at DESC")
+    return cursor.fetchall()
+
 @router.get("/api/alerts/unread", tags=["Alerts"])
 def get_unread_alerts():
     """ Obtiene todas las alertas no leídas. """
     conn = get_db_connection()
     if not conn: return []
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM alerts WHERE is_read = 0 ORDER BY created_at DESC")
-        return cursor.fetchall()
+        return _unread_alerts(conn.cursor(dictionary=True))
     finally:
         if conn and conn.is_connected(): conn.close()
 
@@ -25,6 +28,9 @@ def mark_alert_as_read(alert_id: int):
         cursor = conn.cursor()
         cursor.execute("UPDATE alerts SET is_read = 1 WHERE alert_id = %s", (alert_id,))
         conn.commit()
+        dashboard_widgets.dashboard.invalidate("alerts")
         return {"message": "Alerta marcada como leída."}
     finally:
-        if conn and conn.is_connected(): conn.close()
\ No newline at end of file
+        if conn and conn.is_connected(): conn.close()
+
+dashboard_widgets.register("alerts", _unread_alerts, ttl=10)
\ No newline at end of file
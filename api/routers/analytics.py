@@ -0,0 +1,53 @@
+# api/routers/analytics.py
+from fastapi import APIRouter, HTTPException, Query
+from database import get_db_connection
+from analytics_cube import analytics_cube, CubeQueryError, DIMENSIONS, MEASURES
+from typing import List
+
+router = APIRouter()
+
+def _split(value):
+    return [part.strip() for part in value.split(",") if part.strip()] if value else []
+
+def _parse_filters(filters):
+    """ Filtros `dimensión:valor1,valor2` (se puede repetir el parámetro). """
+    parsed = {}
+    for item in filters:
+        name, sep, values = item.partition(":")
+        if not sep or not values:
+            raise HTTPException(status_code=400, detail=f"Filtro inválido '{item}'; usa dimension:valor1,valor2.")
+        parsed.setdefault(name.strip(), []).extend(_split(values))
+    return parsed
+
+@router.get("/api/analytics/cube", tags=["Analytics"])
+def get_sales_cube(dimensions: str = "", measures: str = "revenue", filter: List[str] = Query(default=[]),
+                   start_date: str | None = None, end_date: str | None = None,
+                   sort: str | None = None, limit: int = 1000):
+    """
+    Cubo de ventas: agrupa las líneas de órdenes pagadas por las dimensiones
+    pedidas (p. ej. dimensions=hour,product) y calcula las medidas
+    (units, revenue, lines, orders, avg_ticket). Los filtros se pasan como
+    filter=waiter:3,4 y las fechas limitan por día de cierre. No requiere SQL
+    nuevo: se resuelve sobre el cubo columnar en memoria.
+    """
+    conn = get_db_connection()
+    if not conn:
+        raise HTTPException(status_code=500, detail="Error de BBDD.")
+    try:
+        analytics_cube.refresh(conn.cursor())
+    except Exception as e:
+        print(f"No se pudo actualizar el cubo analítico: {e}")
+    finally:
+        conn.close()
+    try:
+        return analytics_cube.query(_split(dimensions), _split(measures), _parse_filters(filter),
+                                    start_date, end_date, sort, limit)
+    except CubeQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Fecha inválida; usa AAAA-MM-DD.")
+
+@router.get("/api/analytics/cube/schema", tags=["Analytics"])
+def get_sales_cube_schema():
+    """ Dimensiones y medidas disponibles, y el estado de la carga del cubo. """
+    return {"dimensions": list(DIMENSIONS), "measures": list(MEASURES), "stats": analytics_cube.stats()}
@@ -2,11 +2,11 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from database import get_db_connection
+from report_cache import report_cache
+from exports import export_response
+import report_jobs
 from passlib.context import CryptContext
 import datetime
-from fastapi.responses import StreamingResponse
-import io
-import csv
 
 
 router = APIRouter()
@@ -49,7 +49,7 @@ def clock_in_out(clock_data: ClockInOut):
         user_id = found_user["user_id"]
 
         # Revisa si hay un registro de asistencia abierto
-        query_open_record = "SELECT record_id FROM attendance_records WHERE user_id = %s AND clock_out IS NULL"
+        query_open_record = "SELECT record_id, clock_in FROM attendance_records WHERE user_id = %s AND clock_out IS NULL"
         cursor.execute(query_open_record, (user_id,))
         open_record = cursor.fetchone()
 
@@ -57,6 +57,8 @@ def clock_in_out(clock_data: ClockInOut):
             # Si hay un registro abierto, lo cierra (Salida)
             record_id = open_record["record_id"]
             cursor.execute("UPDATE attendance_records SET clock_out = NOW() WHERE record_id = %s", (record_id,))
+            # Un turno que empezó ayer cambia un reporte de asistencia ya cerrado
+            report_cache.note_write(cursor, "attendance", open_record["clock_in"])
             message = "Salida registrada con éxito."
         else:
             # Si no hay registro abierto, crea uno nuevo (Entrada)
@@ -68,32 +70,58 @@ def clock_in_out(clock_data: ClockInOut):
     finally:
         conn.close()
 
+ATTENDANCE_EXPORT_COLUMNS = [
+    ("Empleado", "full_name"), ("Entrada", "clock_in"), ("Salida", "clock_out"), ("Horas Trabajadas", "hours_worked"),
+]
+
+def _attendance_query(start_date, end_date, user_id=None):
+    """ Consulta del reporte de asistencia, compartida por el reporte y sus exportaciones. """
+    query = """
+        SELECT ar.record_id, ar.user_id, u.full_name, ar.clock_in, ar.clock_out
+        FROM attendance_records ar
+        JOIN users u ON ar.user_id = u.user_id
+        WHERE ar.clock_in >= %s AND ar.clock_in < %s + INTERVAL 1 DAY
+    """
+    params = [start_date, end_date]
+
+    if user_id:
+        query += " AND ar.user_id = %s"
+        params.append(user_id)
+
+    query += " ORDER BY ar.clock_in DESC"
+    return query, tuple(params)
+
+def _with_hours_worked(rec):
+    hours_worked = 'N/A'
+    if rec['clock_out']:
+        diff = rec['clock_out'] - rec['clock_in']
+        hours_worked = round(diff.total_seconds() / 3600, 2)
+    rec['hours_worked'] = hours_worked
+    return rec
+
 @router.get("/api/attendance/report", tags=["Personnel"])
-def get_attendance_report(start_date: datetime.date, end_date: datetime.date, user_id: int | None = None):
+def get_attendance_report(start_date: datetime.date, end_date: datetime.date, user_id: int | None = None,
+                          format: str | None = None):
     """
     Obtiene los registros de asistencia para un rango de fechas y un usuario opcional.
-    Cumple con RF-43.
+    Cumple con RF-43. Con `format` (csv, ndjson, csv.gz, ndjson.gz) se descarga en streaming.
     """
+    query, params = _attendance_query(start_date, end_date, user_id)
+    if format:
+        return export_response(query, params, ATTENDANCE_EXPORT_COLUMNS, format,
+                               f"reporte_asistencia_{start_date}_a_{end_date}", _with_hours_worked)
+
     conn = get_db_connection()
     if not conn: return []
     try:
         cursor = conn.cursor(dictionary=True)
 
-        query = """
-            SELECT ar.record_id, ar.user_id, u.full_name, ar.clock_in, ar.clock_out
-            FROM attendance_records ar
-            JOIN users u ON ar.user_id = u.user_id
-            WHERE DATE(ar.clock_in) BETWEEN %s AND %s
-        """
-        params = [start_date, end_date]
-
-        if user_id:
-            query += " AND ar.user_id = %s"
-            params.append(user_id)
-
-        query += " ORDER BY ar.clock_in DESC"
-        cursor.execute(query, tuple(params))
-        return cursor.fetchall()
+        def compute():
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+        return report_cache.fetch(cursor, "attendance", {"start_date": start_date, "end_date": end_date, "user_id": user_id},
+                                  end_date, ("attendance",), compute)
     finally:
         if conn and conn.is_connected(): conn.close()
 
@@ -101,40 +129,19 @@ def get_attendance_report(start_date: datetime.date, end_date: datetime.date, us
 @router.get("/api/attendance/report/export", tags=["Personnel"])
 def export_attendance_report(start_date: str, end_date: str, user_id: int | None = None):
     """
-    Exporta el reporte de asistencia a un archivo CSV.
+    Exporta el reporte de asistencia a un archivo CSV (en streaming, sin
+    armarlo completo en memoria).
     """
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Error de BBDD.")
-    try:
-        cursor = conn.cursor(dictionary=True)
-
-        # Reutiliza la misma lógica de consulta que el reporte normal
-        query = "SELECT u.full_name, ar.clock_in, ar.clock_out FROM attendance_records ar JOIN users u ON ar.user_id = u.user_id WHERE DATE(ar.clock_in) BETWEEN %s AND %s"
-        params = [start_date, end_date]
-        if user_id:
-            query += " AND ar.user_id = %s"
-            params.append(user_id)
-        cursor.execute(query, tuple(params))
-        records = cursor.fetchall()
-
-        # Crea el archivo CSV en memoria
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Empleado', 'Entrada', 'Salida', 'Horas Trabajadas']) # Cabecera
-
-        for rec in records:
-            hours_worked = 'N/A'
-            if rec['clock_out']:
-                diff = rec['clock_out'] - rec['clock_in']
-                hours_worked = round(diff.total_seconds() / 3600, 2)
-            writer.writerow([rec['full_name'], rec['clock_in'], rec['clock_out'], hours_worked])
-
-        output.seek(0)
-
-        return StreamingResponse(
-            output,
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename=reporte_asistencia_{start_date}_a_{end_date}.csv"}
-        )
-    finally:
-        if conn and conn.is_connected(): conn.close()
\ No newline at end of file
+    query, params = _attendance_query(start_date, end_date, user_id)
+    return export_response(query, params, ATTENDANCE_EXPORT_COLUMNS, "csv",
+                           f"reporte_asistencia_{start_date}_a_{end_date}", _with_hours_worked)
+
+def _attendance_job(conn, params, progress):
+    """ Reporte de asistencia en segundo plano (ver report_jobs.py), con las horas trabajadas. """
+    query, query_params = _attendance_query(params["start_date"], params["end_date"], params.get("user_id"))
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute(f"SELECT COUNT(*) AS total FROM ({query}) AS report", query_params)
+    total = cursor.fetchone()["total"]
+    return (_with_hours_worked(rec) for rec in report_jobs.collect(cursor, query, query_params, progress, total))
+
+report_jobs.register("attendance", _attendance_job)
@@ -1,27 +1,45 @@
 # api/routers/audit.py
 from fastapi import APIRouter, HTTPException
 from database import get_db_connection
+from exports import export_response
+import report_jobs
 
 router = APIRouter()
 
+# Unimos con la tabla de usuarios para obtener el nombre de quién realizó la acción
+AUDIT_LOGS_QUERY = """
+    SELECT al.log_id, al.action, al.details, al.log_timestamp, u.full_name as user_name
+    FROM audit_logs al
+    LEFT JOIN users u ON al.user_id = u.user_id
+    ORDER BY al.log_timestamp DESC
+"""
+
 @router.get("/api/audit-logs", tags=["Auditing"])
-def get_audit_logs():
+def get_audit_logs(format: str | None = None):
     """
     Obtiene todos los registros de la bitácora de auditoría.
     Cumple con el requerimiento RF-94.
+    Con `format` (csv, ndjson, csv.gz, ndjson.gz) se descarga en streaming.
     """
+    if format:
+        return export_response(AUDIT_LOGS_QUERY, (), [
+            ("Folio", "log_id"), ("Fecha", "log_timestamp"), ("Usuario", "user_name"),
+            ("Acción", "action"), ("Detalles", "details"),
+        ], format, "bitacora_auditoria")
     conn = get_db_connection()
     if not conn: return []
     try:
         cursor = conn.cursor(dictionary=True)
-        # Unimos con la tabla de usuarios para obtener el nombre de quién realizó la acción
-        query = """
-            SELECT al.log_id, al.action, al.details, al.log_timestamp, u.full_name as user_name
-            FROM audit_logs al
-            LEFT JOIN users u ON al.user_id = u.user_id
-            ORDER BY al.log_timestamp DESC;
-        """
-        cursor.execute(query)
+        cursor.execute(AUDIT_LOGS_QUERY)
         return cursor.fetchall()
     finally:
-        if conn and conn.is_connected(): conn.close()
\ No newline at end of file
+        if conn and conn.is_connected(): conn.close()
+
+def _audit_logs_job(conn, params, progress):
+    """ Bitácora completa en segundo plano (ver report_jobs.py). """
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("SELECT COUNT(*) AS total FROM audit_logs")
+    total = cursor.fetchone()["total"]
+    return report_jobs.collect(cursor, AUDIT_LOGS_QUERY, (), progress, total)
+
+report_jobs.register("audit-logs", _audit_logs_job)
@@ -12,7 +12,7 @@ class ChatMessage(BaseModel):
 # Cada función se especializa en responder una pregunta específica.
 
 def get_daily_sales(cursor):
-    query = "SELECT SUM(amount) as total FROM payments WHERE DATE(payment_timestamp) = CURDATE()"
+    query = "SELECT SUM(amount) as total FROM payments_rollup WHERE sale_date = CURDATE()"
     cursor.execute(query)
     total = cursor.fetchone()['total'] or 0
     return f"Las ventas totales de hoy son: ${total:.2f}."
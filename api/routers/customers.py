@@ -2,7 +2,10 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from database import get_db_connection
+from report_cache import report_cache
+import customer_stats
 from typing import List
+import datetime
 
 router = APIRouter()
 
@@ -40,43 +43,139 @@ def create_customer(customer: Customer):
     finally:
         if conn and conn.is_connected(): conn.close()
 
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 200
+
+def _history_orders_query(keyset):
+    """ Órdenes pagadas del cliente, de la más reciente a la más vieja, usando el índice (customer_id, status, created_at). """
+    # Paginación por llave (created_at, order_id): cada página cuesta lo mismo sin importar qué tan atrás esté
+    after = "AND (created_at < %s OR (created_at = %s AND order_id < %s))" if keyset else ""
+    return f"""
+        SELECT order_id, order_folio, created_at
+        FROM orders
+        WHERE customer_id = %s AND status = 'Pagada' {after}
+        ORDER BY created_at DESC, order_id DESC
+        LIMIT %s
+    """
+
+def _history_lines_query(order_ids, summary):
+    """ Líneas (o totales por visita, con `summary`) de todas las órdenes de la página en una sola consulta. """
+    placeholders = ", ".join(["%s"] * len(order_ids))
+    if summary:
+        return f"""
+            SELECT order_id, COUNT(*) AS line_count, SUM(quantity) AS item_count,
+                   SUM(quantity * price_at_time_of_order) AS total
+            FROM order_details
+            WHERE order_id IN ({placeholders})
+            GROUP BY order_id
+        """, order_ids
+    return f"""
+        SELECT od.order_id, p.name, od.quantity, od.price_at_time_of_order
+        FROM order_details od
+        JOIN products p ON od.product_id = p.product_id
+        WHERE od.order_id IN ({placeholders})
+        ORDER BY od.order_id, od.detail_id
+    """, order_ids
+
 @router.get("/api/customers/{customer_id}/history", tags=["CRM"])
-def get_customer_history(customer_id: int):
+def get_customer_history(customer_id: int, limit: int = HISTORY_PAGE_SIZE, summary: bool = False,
+                         before_created_at: datetime.datetime | None = None, before_order_id: int | None = None):
     """
     Obtiene el historial de consumo de un cliente específico. Cumple con RF-144.
+    Se pagina de la visita más reciente hacia atrás: para la siguiente página
+    se envían before_created_at y before_order_id tal como vienen en `next`
+    (null en la última). Con `summary` cada visita trae sus totales en lugar
+    de sus productos. Son dos consultas por página sin importar cuántas
+    órdenes tenga.
     """
+    if (before_created_at is None) != (before_order_id is None):
+        raise HTTPException(status_code=400, detail="Indica before_created_at y before_order_id juntos.")
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
     conn = get_db_connection()
     if not conn:
         raise HTTPException(status_code=500, detail="Error de BBDD.")
     try:
         cursor = conn.cursor(dictionary=True)
 
-        # Consulta para obtener las órdenes del cliente
-        query_orders = """
-            SELECT order_id, order_folio, created_at
-            FROM orders
-            WHERE customer_id = %s AND status = 'Pagada'
-            ORDER BY created_at DESC;
-        """
-        cursor.execute(query_orders, (customer_id,))
+        # 1. Una página de órdenes del cliente (una de más para saber si hay otra página)
+        keyset = before_created_at is not None
+        params = [customer_id]
+        if keyset:
+            params += [before_created_at, before_created_at, before_order_id]
+        cursor.execute(_history_orders_query(keyset), (*params, limit + 1))
         orders = cursor.fetchall()
+        has_more = len(orders) > limit
+        orders = orders[:limit]
+        if not orders:
+            return {"orders": [], "next": None}
 
-        # Para cada orden, obtener los productos que compró
+        # 2. Los productos (o totales) de todas esas órdenes juntos
+        by_id = {order['order_id']: order for order in orders}
         for order in orders:
-            query_items = """
-                SELECT p.name, od.quantity, od.price_at_time_of_order
-                FROM order_details od
-                JOIN products p ON od.product_id = p.product_id
-                WHERE od.order_id = %s;
-            """
-            cursor.execute(query_items, (order['order_id'],))
-            order['items'] = cursor.fetchall()
-
-        return orders
+            if summary:
+                order.update({"line_count": 0, "item_count": 0, "total": 0})
+            else:
+                order['items'] = []
+        cursor.execute(*_history_lines_query(list(by_id), summary))
+        for row in cursor.fetchall():
+            order = by_id[row.pop('order_id')]
+            if summary:
+                order.update(row)
+            else:
+                order['items'].append(row)
+
+        last = orders[-1]
+        next_page = {"before_created_at": last['created_at'], "before_order_id": last['order_id']} if has_more else None
+        return {"orders": orders, "next": next_page}
     finally:
         if conn and conn.is_connected():
             conn.close()
 
+@router.get("/api/customers/rfm", tags=["CRM"])
+def get_customers_rfm(segment: str | None = None, limit: int | None = None):
+    """
+    Califica a todos los clientes con visitas por recencia, frecuencia y monto
+    (1 a 5, por quintiles) y los agrupa en segmentos. Lee las métricas
+    precalculadas de customer_stats; `segment` filtra la lista de clientes.
+    """
+    conn = get_db_connection()
+    if not conn: raise HTTPException(status_code=500, detail="Error de BBDD.")
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(customer_stats.RFM_QUERY)
+        thresholds, customers = customer_stats.score_rfm(cursor.fetchall())
+    finally:
+        if conn and conn.is_connected(): conn.close()
+
+    segments = {}
+    for customer in customers:
+        segments[customer['segment']] = segments.get(customer['segment'], 0) + 1
+    if segment:
+        customers = [c for c in customers if c['segment'] == segment]
+    if limit:
+        customers = customers[:limit]
+    return {"thresholds": thresholds, "segments": segments, "customers": customers}
+
+@router.get("/api/customers/{customer_id}/stats", tags=["CRM"])
+def get_customer_stats(customer_id: int, favourites: int = 5):
+    """ Primera y última visita, visitas, gasto total y promedio, y productos favoritos del cliente. """
+    conn = get_db_connection()
+    if not conn: raise HTTPException(status_code=500, detail="Error de BBDD.")
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(customer_stats.STATS_QUERY, (customer_id,))
+        stats = cursor.fetchone()
+        if not stats:
+            raise HTTPException(status_code=404, detail="Cliente no encontrado.")
+        stats['visits'] = stats['visits'] or 0
+        stats['total_spent'] = stats['total_spent'] or 0
+        stats['average_ticket'] = stats['total_spent'] / stats['visits'] if stats['visits'] else 0
+        cursor.execute(customer_stats.FAVOURITES_QUERY, (customer_id, favourites))
+        stats['favourite_products'] = cursor.fetchall()
+        return stats
+    finally:
+        if conn and conn.is_connected(): conn.close()
+
 @router.delete("/api/customers/{customer_id}", tags=["CRM"])
 def delete_customer(customer_id: int):
     """
@@ -94,10 +193,13 @@ def delete_customer(customer_id: int):
 
         # 2. Ahora, eliminar al cliente de la tabla de clientes
         cursor.execute("DELETE FROM customers WHERE customer_id = %s", (customer_id,))
+        deleted = cursor.rowcount
+        customer_stats.forget_customer(cursor, customer_id)
+        report_cache.note_write(cursor, "customers")
 
         conn.commit()
 
-        if cursor.rowcount == 0:
+        if deleted == 0:
             raise HTTPException(status_code=404, detail="Cliente no encontrado.")
 
         return {"message": "Cliente eliminado con éxito."}
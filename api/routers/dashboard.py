@@ -0,0 +1,23 @@
+# api/routers/dashboard.py
+from fastapi import APIRouter, HTTPException
+from dashboard_widgets import dashboard, DashboardError
+
+router = APIRouter()
+
+@router.get("/api/dashboard", tags=["Reports"])
+async def get_dashboard(widgets: str | None = None):
+    """
+    Todos los widgets del panel de control en una sola respuesta (o solo los de
+    `widgets`, separados por coma). Un widget que falla o tarda no bloquea al
+    resto: se responde con su último valor (en "stale") o con su error (en "errors").
+    """
+    names = [w.strip() for w in widgets.split(",") if w.strip()] if widgets else None
+    try:
+        return await dashboard.bundle(names)
+    except DashboardError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/api/_dashboard", tags=["System"])
+def get_dashboard_stats():
+    """ Aciertos de caché, tiempos agotados y fallos de los widgets del panel. """
+    return dashboard.stats()
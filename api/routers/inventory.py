@@ -2,6 +2,8 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from database import get_db_connection
+from recipe_cache import recipe_cache
+from exports import export_response
 from typing import List, Optional
 
 router = APIRouter()
@@ -100,21 +102,31 @@ def adjust_stock(supply_id: int, adjustment: StockAdjustment):
         if conn and conn.is_connected():
             conn.close()
 
+SUPPLY_HISTORY_QUERY = """
+    SELECT sm.movement_timestamp, sm.movement_type, sm.quantity_change, sm.reason, u.full_name as user_name
+    FROM stock_movements sm
+    LEFT JOIN users u ON sm.user_id = u.user_id
+    WHERE sm.supply_id = %s
+    ORDER BY sm.movement_timestamp DESC
+"""
+
 @router.get("/api/inventory/supplies/{supply_id}/history", tags=["Inventory"])
-def get_supply_history(supply_id: int):
-    """Obtiene el historial de movimientos para un insumo específico."""
+def get_supply_history(supply_id: int, format: str | None = None):
+    """
+    Obtiene el historial de movimientos para un insumo específico.
+    Con `format` (csv, ndjson, csv.gz, ndjson.gz) se descarga en streaming.
+    """
+    if format:
+        return export_response(SUPPLY_HISTORY_QUERY, (supply_id,), [
+            ("Fecha", "movement_timestamp"), ("Tipo", "movement_type"), ("Cantidad", "quantity_change"),
+            ("Motivo", "reason"), ("Usuario", "user_name"),
+        ], format, f"historial_insumo_{supply_id}")
     conn = get_db_connection()
     if not conn:
         return []
     try:
         cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT sm.movement_timestamp, sm.movement_type, sm.quantity_change, sm.reason, u.full_name as user_name
-            FROM stock_movements sm
-            LEFT JOIN users u ON sm.user_id = u.user_id
-            WHERE sm.supply_id = %s
-            ORDER BY sm.movement_timestamp DESC
-        """, (supply_id,))
+        cursor.execute(SUPPLY_HISTORY_QUERY, (supply_id,))
         return cursor.fetchall()
     finally:
         if conn and conn.is_connected():
@@ -135,10 +147,12 @@ def delete_supply(supply_id: int):
 
         # Ahora, elimina el insumo de la tabla principal
         cursor.execute("DELETE FROM supplies WHERE supply_id = %s", (supply_id,))
+        deleted = cursor.rowcount
 
+        recipe_cache.invalidate(cursor)
         conn.commit()
 
-        if cursor.rowcount == 0:
+        if deleted == 0:
             # Esto puede pasar si el ID no existe
             raise HTTPException(status_code=404, detail="Insumo no encontrado.")
 
@@ -0,0 +1,50 @@
+# api/routers/jobs.py
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
+from report_jobs import report_jobs, kinds, TooManyJobsError, DONE
+import os
+
+router = APIRouter()
+
+class ReportJobRequest(BaseModel):
+    kind: str
+    params: dict = {}
+
+@router.post("/api/report-jobs", tags=["Reports"], status_code=202)
+def submit_report_job(job: ReportJobRequest):
+    """
+    Encola un reporte pesado y devuelve su job_id sin esperar a que termine.
+    Si ya hay uno igual en cola o en proceso se devuelve ese (coalesced = true).
+    """
+    try:
+        job_id, coalesced = report_jobs.submit(job.kind, job.params)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Reporte desconocido. Disponibles: {', '.join(kinds())}.")
+    except TooManyJobsError:
+        raise HTTPException(status_code=503, detail="Hay demasiados reportes en proceso; intenta en unos minutos.")
+    except ConnectionError:
+        raise HTTPException(status_code=500, detail="Error de BBDD.")
+    return {"job_id": job_id, "coalesced": coalesced}
+
+@router.get("/api/report-jobs/{job_id}", tags=["Reports"])
+def get_report_job(job_id: str):
+    """ Estado y avance (0 a 1) de un reporte en segundo plano. """
+    try:
+        job = report_jobs.status(job_id)
+    except ConnectionError:
+        raise HTTPException(status_code=500, detail="Error de BBDD.")
+    if job is None:
+        raise HTTPException(status_code=404, detail="Reporte no encontrado.")
+    return job
+
+@router.get("/api/report-jobs/{job_id}/result", tags=["Reports"])
+def get_report_job_result(job_id: str):
+    """ Resultado (JSON) de un reporte terminado; se envía tal como está guardado, comprimido. """
+    job = get_report_job(job_id)
+    if job["status"] != DONE:
+        raise HTTPException(status_code=409, detail=f"El reporte aún no termina (estado: {job['status']}).")
+    path = report_jobs.result_path(job_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="El resultado ya no está disponible.")
+    return FileResponse(path, media_type="application/json", headers={"Content-Encoding": "gzip"})
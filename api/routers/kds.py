@@ -1,134 +1,217 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from database import get_db_connection
-import json
+from async_database import get_async_db_connection
+from kds_events import kds_bus, format_sse, KDS_KEEPALIVE_SECONDS
+from kds_board import kds_board
+from kds_scheduler import kds_scheduler, SCHEDULE_MODES
+from kds_transitions import ITEM_STATUSES, transition_items, publish_transition
+from prep_telemetry import prep_telemetry, METRICS, DIMENSIONS
+from pydantic import BaseModel
+from typing import List
+import asyncio
 
 router = APIRouter()
 
+class ItemTransition(BaseModel):
+    status: str
+    detail_ids: List[int] | None = None
+    order_id: int | None = None
+    station: str | None = None
+    user_id: int | None = None  # Quién hace el cambio, para la telemetría
+
 @router.get("/api/kds/orders", tags=["KDS"])
-def get_orders_for_kds(station: str | None = None): # <-- Acepta un parámetro de estación
+async def get_orders_for_kds(station: str | None = None, mode: str = "fifo"): # <-- Acepta un parámetro de estación
     """
     Obtiene las órdenes activas, filtrando los productos por estación si se especifica.
-    Cumple con RF-141.
+    Se sirve desde el tablero en memoria (ver kds_board.py); solo se consulta
+    la BBDD si el tablero aún no se ha cargado. Cumple con RF-141.
+    Con mode=programado las comandas se ordenan y agrupan con tiempos de
+    preparación aprendidos (ver kds_scheduler.py).
     """
-    conn = get_db_connection()
-    if not conn: return []
-    try:
-        cursor = conn.cursor(dictionary=True)
+    if mode not in SCHEDULE_MODES:
+        raise HTTPException(status_code=400, detail=f"Modo no válido. Usa uno de: {', '.join(SCHEDULE_MODES)}.")
+    if not kds_board.loaded:
+        conn = await get_async_db_connection()
+        if not conn: return []
+        try:
+            cursor = await conn.cursor(dictionary=True)
+            await kds_board.rebuild_async(cursor)
+        finally:
+            await conn.close()
+    if mode == "programado":
+        return kds_scheduler.get_orders(station)
+    return kds_board.get_orders(station)
 
-        # La subconsulta de items ahora tiene un WHERE adicional para filtrar por estación
-        query = """
-            SELECT 
-                o.order_id, o.order_folio, o.is_priority,
-                IFNULL(t.table_name, 'Para Llevar') as table_name,
-                COALESCE((
-                    SELECT JSON_ARRAYAGG(
-                        JSON_OBJECT('detail_id', od.detail_id, 'name', p.name, 'quantity', od.quantity, 'notes', od.notes, 'status', od.status)
-                    ) 
-                    FROM order_details od
-                    JOIN products p ON od.product_id = p.product_id
-                    WHERE od.order_id = o.order_id AND (p.station = %s OR %s IS NULL)
-                ), '[]') as items
-            FROM orders o
-            LEFT JOIN restaurant_tables t ON o.table_id = t.table_id
-            WHERE o.status = 'Abierta'
-            ORDER BY o.is_priority DESC, o.created_at ASC;
-        """
-        cursor.execute(query, (station, station))
+@router.get("/api/kds/stream", tags=["KDS"])
+async def stream_kds_events(request: Request, station: str | None = None, since: int | None = None):
+    """
+    Envía por Server-Sent Events los cambios del KDS para la estación.
+    Al reconectar, el navegador manda Last-Event-ID (o se puede pasar `since`)
+    y se reenvían solo los eventos perdidos; si ya no están en el búfer se
+    manda un evento "resync" y la pantalla recarga /api/kds/orders.
+    """
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
 
-        # Filtra las órdenes que quedaron sin items después del filtro de estación
-        orders = [order for order in cursor.fetchall() if len(json.loads(order['items'])) > 0]
+    async def event_stream():
+        # Se suscribe aquí (y no al armar la respuesta) para que la baja del
+        # finally siempre corresponda: un stream que nunca arranca no deja
+        # suscriptor. Antes de leer el búfer, para no perder eventos en medio.
+        subscription = kds_bus.subscribe(station)
+        try:
+            backlog = kds_bus.since(since, station) if since is not None else None
+            if backlog is None:
+                last_sent = kds_bus.seq
+                yield format_sse("resync", {"seq": last_sent}, last_sent)
+            else:
+                last_sent = since
+                for event in backlog:
+                    yield format_sse(event["type"], event, event["seq"])
+                    last_sent = event["seq"]
 
-        return orders
-    finally:
-        if conn and conn.is_connected(): conn.close()
+            while not await request.is_disconnected():
+                if subscription.overflowed:
+                    # La pantalla se atrasó más que su cola: se le pide recargar
+                    subscription.drain()
+                    last_sent = kds_bus.seq
+                    yield format_sse("resync", {"seq": last_sent}, last_sent)
+                    continue
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), KDS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if event["seq"] <= last_sent:
+                    continue
+                yield format_sse(event["type"], event, event["seq"])
+                last_sent = event["seq"]
+        finally:
+            kds_bus.unsubscribe(subscription)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=headers)
 
 @router.post("/api/kds/orders/{order_id}/ready", tags=["KDS"])
-def mark_order_as_ready(order_id: int):
+async def mark_order_as_ready(order_id: int, user_id: int | None = None):
     """
     Cambia el estado de una orden a 'Lista' y genera una alerta para el admin.
+    Los productos que faltaban quedan como 'Listo' para la telemetría del KDS.
     """
-    conn = get_db_connection()
+    conn = await get_async_db_connection()
     if not conn:
         raise HTTPException(status_code=500, detail="Error de BBDD.")
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("UPDATE orders SET status = 'Lista' WHERE order_id = %s", (order_id,))
-        cursor.execute("SELECT order_folio FROM orders WHERE order_id = %s", (order_id,))
-        order = cursor.fetchone()
+        cursor = await conn.cursor(dictionary=True)
+        transition = await transition_items(cursor, "Listo", order_id=order_id, user_id=user_id, alerts=False)
+        await cursor.execute("UPDATE orders SET status = 'Lista' WHERE order_id = %s", (order_id,))
+        await cursor.execute("SELECT order_folio FROM orders WHERE order_id = %s", (order_id,))
+        order = await cursor.fetchone()
         if order:
             alert_message = f"¡Orden {order['order_folio']} lista para recoger!"
-            cursor.execute("INSERT INTO alerts (alert_type, message) VALUES ('order_ready', %s)", (alert_message,))
-        conn.commit()
+            await cursor.execute("INSERT INTO alerts (alert_type, message) VALUES ('order_ready', %s)", (alert_message,))
+        await conn.commit()
+        publish_transition(transition)
+        kds_bus.publish("order_removed", order_id, status="Lista")
         return {"message": "Orden marcada como lista."}
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error al procesar la orden: {e}")
     finally:
-        if conn and conn.is_connected():
-            conn.close()
+        await conn.close()
+
+async def _transition(status, detail_ids=None, order_id=None, station=None, user_id=None):
+    """ Abre la transacción, mueve los productos y publica el cambio al KDS. """
+    conn = await get_async_db_connection()
+    if not conn:
+        raise HTTPException(status_code=500, detail="Error de BBDD.")
+    try:
+        cursor = await conn.cursor(dictionary=True)
+        transition = await transition_items(cursor, status, detail_ids, order_id, station, user_id)
+        await conn.commit()
+        publish_transition(transition)
+        return transition.rows
+    except Exception:
+        await conn.rollback()
+        raise
+    finally:
+        await conn.close()
 
 @router.put("/api/kds/order-item/{detail_id}/status", tags=["KDS"])
-def update_order_item_status(detail_id: int):
+async def update_order_item_status(detail_id: int, user_id: int | None = None):
     """
     Actualiza el estado de un item específico a 'En Preparación'.
     Cumple con el requerimiento RF-137.
     """
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Error de BBDD.")
     try:
-        cursor = conn.cursor()
-        query = "UPDATE order_details SET status = 'En Preparación' WHERE detail_id = %s"
-        cursor.execute(query, (detail_id,))
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Item de la orden no encontrado.")
-        conn.commit()
-        return {"message": "Estado del item actualizado a 'En Preparación'."}
+        rows = await _transition("En Preparación", detail_ids=[detail_id], user_id=user_id)
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
-        conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error al actualizar el estado del item: {e}")
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Item de la orden no encontrado o ya en ese estado o uno posterior.")
+    return {"message": "Estado del item actualizado a 'En Preparación'."}
 
 @router.put("/api/kds/order-item/{detail_id}/ready", tags=["KDS"])
-def mark_item_as_ready(detail_id: int):
+async def mark_item_as_ready(detail_id: int, user_id: int | None = None):
     """
     Actualiza el estado de un item específico a 'Listo' y notifica al panel.
     Cumple con el requerimiento RF-138.
     """
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Error de BBDD.")
     try:
-        cursor = conn.cursor(dictionary=True)
-        query = "UPDATE order_details SET status = 'Listo' WHERE detail_id = %s"
-        cursor.execute(query, (detail_id,))
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Item de la orden no encontrado.")
-        
-        info_query = """
-            SELECT p.name, o.order_folio 
-            FROM order_details od 
-            JOIN products p ON od.product_id = p.product_id
-            JOIN orders o ON od.order_id = o.order_id
-            WHERE od.detail_id = %s
-        """
-        cursor.execute(info_query, (detail_id,))
-        info = cursor.fetchone()
-
-        if info:
-            alert_message = f"Producto listo: '{info['name']}' de la orden {info['order_folio']}."
-            cursor.execute("INSERT INTO alerts (alert_type, message) VALUES ('item_ready', %s)", (alert_message,))
-
-        conn.commit()
-        return {"message": "Estado del item actualizado a 'Listo'."}
+        rows = await _transition("Listo", detail_ids=[detail_id], user_id=user_id)
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
-        conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error al actualizar el estado del item: {e}")
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Item de la orden no encontrado o ya en ese estado o uno posterior.")
+    return {"message": "Estado del item actualizado a 'Listo'."}
+
+@router.post("/api/kds/items/transition", tags=["KDS"])
+async def transition_items_batch(transition: ItemTransition):
+    """
+    Mueve varios productos a 'En Preparación' o 'Listo' en una sola transacción:
+    por lista de detail_ids, por orden completa o por estación. Al pasar a
+    'Listo' genera una sola alerta por orden.
+    """
+    if transition.status not in ITEM_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Estado no válido. Usa uno de: {', '.join(ITEM_STATUSES)}.")
+    if not transition.detail_ids and transition.order_id is None and transition.station is None:
+        raise HTTPException(status_code=400, detail="Indica detail_ids, order_id o station.")
+    try:
+        rows = await _transition(transition.status, transition.detail_ids, transition.order_id,
+                                 transition.station, transition.user_id)
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al actualizar los items: {e}")
+    return {
+        "updated": len(rows),
+        "detail_ids": [row['detail_id'] for row in rows],
+        "orders": sorted({row['order_id'] for row in rows}),
+        "message": f"{len(rows)} items actualizados a '{transition.status}'.",
+    }
+
+@router.get("/api/kds/analytics/latency", tags=["KDS"])
+def get_prep_latency(metric: str = "item_total", by: str = "station", minutes: int = 60):
+    """
+    Percentiles (p50/p90/p99, en segundos) de los tiempos del KDS en los últimos
+    `minutes`, agrupados por producto, estación, hora del día o persona. Sale
+    de la telemetría en memoria, sin consultar la BBDD.
+    """
+    if metric not in METRICS:
+        raise HTTPException(status_code=400, detail=f"Métrica no válida. Usa una de: {', '.join(METRICS)}.")
+    if by not in DIMENSIONS + ("all",):
+        raise HTTPException(status_code=400, detail=f"Agrupación no válida. Usa una de: {', '.join(DIMENSIONS + ('all',))}.")
+    return {
+        "metric": metric,
+        "by": by,
+        "minutes": minutes,
+        "rows": prep_telemetry.query(metric, by, minutes),
+    }
 
 @router.get("/api/kds/summary", tags=["KDS"])
 def get_pending_items_summary():
@@ -170,6 +253,7 @@ def prioritize_order(order_id: int):
         cursor = conn.cursor()
         cursor.execute("UPDATE orders SET is_priority = 1 WHERE order_id = %s", (order_id,))
         conn.commit()
+        kds_bus.publish("order_priority", order_id, is_priority=1)
         return {"message": "Orden priorizada con éxito."}
     finally:
         if conn and conn.is_connected():
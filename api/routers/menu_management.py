@@ -2,6 +2,7 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from database import get_db_connection
+from recipe_cache import recipe_cache
 from typing import List, Optional
 
 router = APIRouter()
@@ -159,6 +160,7 @@ def delete_product(product_id: int):
         # Borrar recetas asociadas primero
         cursor.execute("DELETE FROM recipes WHERE product_id = %s", (product_id,))
         cursor.execute("DELETE FROM products WHERE product_id = %s", (product_id,))
+        recipe_cache.invalidate(cursor)
         conn.commit()
         return {"message": "Producto eliminado con éxito."}
     finally:
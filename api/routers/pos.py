@@ -1,7 +1,19 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from database import get_db_connection
+from async_database import get_async_db_connection
+from inventory_utils import build_supply_stock_query, find_shortfalls, shortfall_message, deplete_inventory
+from recipe_cache import recipe_cache
+from folio_allocator import folio_allocator
+from training_sandbox import training_engine, TrainingStockError, TrainingSessionExpired
+from kds_events import kds_bus, build_item_rows_query, publish_items_added
+from prep_telemetry import build_queue_insert, build_ticket_query, completed_tickets, record_tickets, DELETE_TIMING
+import sales_rollup
+import customer_stats
+import analytics_cube
+from report_cache import report_cache
 import datetime
+import json
 from typing import List
 
 router = APIRouter()
@@ -28,52 +40,195 @@ class CloseOrder(BaseModel):
 class CancelItem(BaseModel):
     reason: str
     user_id: int
+    is_training_mode: bool = False
 
 class AssociateCustomer(BaseModel):
     customer_id: int
 
+class CartLine(BaseModel):
+    product_id: int
+    quantity: int
+
+class NewOrderWithItems(NewOrder):
+    items: List[OrderItem] = []
+
+# --- Funciones auxiliares del POS ---
+
+async def _next_folio():
+    """
+    Folio único por día de operación, aun con varias terminales y workers. Se
+    pide antes de tomar la conexión de la petición: reservar un bloque usa su
+    propia conexión y no debe esperar a que el pool tenga una segunda libre.
+    """
+    try:
+        return await folio_allocator.next_folio_async()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al asignar el folio: {e}")
+
+async def _insert_order(cursor, order: NewOrder, folio: str):
+    """ Ocupa la mesa (si aplica) e inserta la cabecera de la orden. Devuelve el order_id. """
+    if order.table_id:
+        await cursor.execute("UPDATE restaurant_tables SET status = 'Ocupada' WHERE table_id = %s", (order.table_id,))
+
+    query = "INSERT INTO orders (order_folio, table_id, user_id, status) VALUES (%s, %s, %s, 'Abierta')"
+    await cursor.execute(query, (folio, order.table_id, order.user_id))
+    return cursor.lastrowid
+
+async def _insert_order_items(cursor, order_id: int, items: List[OrderItem]):
+    """
+    Verifica el stock de la lista de materiales combinada de todas las líneas
+    (recetas desde la caché, stock en una sola consulta) y las inserta con un
+    solo executemany. Devuelve los detail_id generados.
+    """
+    await recipe_cache.ensure_fresh_async(cursor)
+    bom = recipe_cache.bill_of_materials([(i.product_id, i.quantity) for i in items])
+    if bom:
+        await cursor.execute(*build_supply_stock_query(bom))
+        shortfalls = find_shortfalls(bom, await cursor.fetchall())
+        if shortfalls:
+            raise HTTPException(status_code=400, detail=shortfall_message(shortfalls))
+
+    query = "INSERT INTO order_details (order_id, product_id, quantity, price_at_time_of_order, notes) VALUES (%s, %s, %s, %s, %s)"
+    await cursor.executemany(query, [
+        (order_id, i.product_id, i.quantity, i.price_at_time_of_order, i.notes) for i in items
+    ])
+    # El conector convierte el executemany en un solo INSERT multi-fila, y
+    # InnoDB da a un INSERT con número de filas conocido ids seguidos (en
+    # cualquier innodb_autoinc_lock_mode), separados por auto_increment_increment.
+    # lastrowid es el de la primera fila; así no se leen ids de otra petición.
+    first_id = cursor.lastrowid
+    await cursor.execute("SELECT @@auto_increment_increment AS step")
+    step = (await cursor.fetchone())['step']
+    detail_ids = [first_id + i * step for i in range(len(items))]
+    # Hora de entrada al KDS, para la telemetría de tiempos de preparación
+    await cursor.execute(*build_queue_insert(detail_ids, datetime.datetime.now().replace(microsecond=0)))
+    return detail_ids
+
+async def _kds_rows(cursor, detail_ids):
+    """ Datos de las líneas nuevas para el evento del KDS; se leen antes del COMMIT. """
+    if not detail_ids:
+        return []
+    await cursor.execute(*build_item_rows_query(detail_ids))
+    return await cursor.fetchall()
+
+# --- Modo entrenamiento ---
+# Las operaciones con is_training_mode se atienden en una copia SQLite por
+# persona (ver training_sandbox.py) y nunca tocan la BBDD de producción. Las
+# órdenes de entrenamiento tienen order_id negativo.
+
+async def _training_session(user_id: int):
+    """ Sesión de entrenamiento de la persona, refrescando la plantilla si venció. """
+    if training_engine.template_is_stale():
+        conn = await get_async_db_connection()
+        if not conn:
+            raise HTTPException(status_code=500, detail="Error de BBDD.")
+        try:
+            cursor = await conn.cursor(dictionary=True)
+            await training_engine.ensure_template_async(cursor)
+        finally:
+            await conn.close()
+    return training_engine.session_for_user(user_id)
+
+def _training_session_for_order(order_id: int, is_training_mode: bool):
+    """ Devuelve la sesión si la orden es de entrenamiento, o None si es una orden real. """
+    if order_id >= 0:
+        if is_training_mode:
+            raise HTTPException(status_code=400, detail="La orden no pertenece al modo entrenamiento.")
+        return None
+    session = training_engine.session_for_order(order_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Orden de entrenamiento no encontrada o expirada.")
+    return session
+
+def _training_add_items(session, order_id: int, items: List[OrderItem]):
+    try:
+        return session.add_items(order_id, items)
+    except TrainingStockError as e:
+        raise HTTPException(status_code=400, detail=shortfall_message(e.shortfalls))
+    except TrainingSessionExpired:
+        raise HTTPException(status_code=404, detail="Orden de entrenamiento no encontrada o expirada.")
+
 # --- Endpoints del POS ---
 
 @router.post("/api/orders", tags=["POS"])
-def create_new_order(order: NewOrder):
+async def create_new_order(order: NewOrder):
     """
     Crea una nueva orden, le asigna un folio y, si aplica, ocupa la mesa.
     """
-    conn = get_db_connection()
+    if order.is_training_mode:
+        session = await _training_session(order.user_id)
+        return session.create_order(order.table_id, order.user_id)
+
+    folio = await _next_folio()
+    conn = await get_async_db_connection()
     if not conn:
         raise HTTPException(status_code=500, detail="Error de BBDD.")
     
     try:
-        cursor = conn.cursor(dictionary=True)
+        cursor = await conn.cursor(dictionary=True)
         
-        if order.table_id:
-            cursor.execute("UPDATE restaurant_tables SET status = 'Ocupada' WHERE table_id = %s", (order.table_id,))
+        new_order_id = await _insert_order(cursor, order, folio)
+        await conn.commit()
         
-        folio = f"ORD-{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
-        query = "INSERT INTO orders (order_folio, table_id, user_id, status) VALUES (%s, %s, %s, 'Abierta')"
-        cursor.execute(query, (folio, order.table_id, order.user_id))
-        new_order_id = cursor.lastrowid
-        
-        # --- Control de entrenamiento ---
-        if not order.is_training_mode:
-            conn.commit()
-        else:
-            conn.rollback()
-        
-        cursor.execute("SELECT * FROM orders WHERE order_id = %s", (new_order_id,))
-        created_order = cursor.fetchone()
+        await cursor.execute("SELECT * FROM orders WHERE order_id = %s", (new_order_id,))
+        created_order = await cursor.fetchone()
         
         return created_order
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error al crear la orden: {e}")
     finally:
-        if conn and conn.is_connected(): conn.close()
+        await conn.close()
+
+
+@router.post("/api/orders/with-items", tags=["POS"])
+async def create_order_with_items(order: NewOrderWithItems):
+    """
+    Crea la orden y sus líneas iniciales en una sola transacción, validando el
+    stock de toda la cuenta de una vez.
+    """
+    if order.is_training_mode:
+        session = await _training_session(order.user_id)
+        try:
+            return session.create_order(order.table_id, order.user_id, order.items)
+        except TrainingStockError as e:
+            raise HTTPException(status_code=400, detail=shortfall_message(e.shortfalls))
+
+    folio = await _next_folio()
+    conn = await get_async_db_connection()
+    if not conn:
+        raise HTTPException(status_code=500, detail="Error de BBDD.")
+    try:
+        cursor = await conn.cursor(dictionary=True)
+        new_order_id = await _insert_order(cursor, order, folio)
+        detail_ids = await _insert_order_items(cursor, new_order_id, order.items) if order.items else []
+        kds_rows = await _kds_rows(cursor, detail_ids)
+        await conn.commit()
+        publish_items_added(kds_rows)
+
+        await cursor.execute("SELECT * FROM orders WHERE order_id = %s", (new_order_id,))
+        created_order = await cursor.fetchone() or {"order_id": new_order_id}
+        created_order["detail_ids"] = detail_ids
+        return created_order
+    except HTTPException as http_exc:
+        await conn.rollback()
+        raise http_exc
+    except Exception as e:
+        await conn.rollback()
+        raise HTTPException(status_code=500, detail=f"Error al crear la orden: {e}")
+    finally:
+        await conn.close()
 
 
 @router.get("/api/orders/{order_id}/items", tags=["POS"])
 def get_order_items(order_id: int):
     """ Obtiene todos los productos de una orden específica. """
+    if order_id < 0:
+        session = training_engine.session_for_order(order_id)
+        try:
+            return session.get_order_items(order_id) if session else []
+        except TrainingSessionExpired:
+            return []
     conn = get_db_connection()
     if not conn: return []
     try:
@@ -86,130 +241,167 @@ def get_order_items(order_id: int):
 
 
 @router.post("/api/orders/{order_id}/items", tags=["POS"])
-def add_item_to_order(order_id: int, item: OrderItem):
+async def add_item_to_order(order_id: int, item: OrderItem):
     """
     Añade un producto a una orden, verificando primero el stock de sus insumos.
     Cumple con RF-50 y RF-73.
     """
-    conn = get_db_connection()
+    session = _training_session_for_order(order_id, item.is_training_mode)
+    if session:
+        detail_ids = _training_add_items(session, order_id, [item])
+        return {"detail_id": detail_ids[0], "message": "Producto añadido a la orden."}
+
+    conn = await get_async_db_connection()
     if not conn:
         raise HTTPException(status_code=500, detail="Error de BBDD.")
     try:
-        cursor = conn.cursor(dictionary=True)
-
-        # --- NUEVA LÓGICA DE VERIFICACIÓN DE STOCK (RF-73) ---
-        # 1. Obtener la receta del producto
-        cursor.execute("SELECT supply_id, quantity_used FROM recipes WHERE product_id = %s", (item.product_id,))
-        recipe_items = cursor.fetchall()
-
-        # 2. Verificar el stock de cada insumo en la receta
-        if recipe_items: # Solo verifica si el producto tiene receta
-            for recipe_item in recipe_items:
-                cursor.execute("SELECT name, current_stock FROM supplies WHERE supply_id = %s", (recipe_item['supply_id'],))
-                supply = cursor.fetchone()
-                if not supply or supply['current_stock'] < recipe_item['quantity_used']:
-                    # Si un insumo no existe o no hay suficiente, se levanta un error
-                    raise HTTPException(status_code=400, detail=f"Stock insuficiente para preparar el producto. Falta: {supply['name'] if supply else 'Ingrediente desconocido'}")
+        cursor = await conn.cursor(dictionary=True)
 
-        # 3. Si hay stock, se procede a añadir el producto a la orden
-        query = "INSERT INTO order_details (order_id, product_id, quantity, price_at_time_of_order, notes) VALUES (%s, %s, %s, %s, %s)"
-        cursor.execute(query, (order_id, item.product_id, item.quantity, item.price_at_time_of_order, item.notes))
+        # --- VERIFICACIÓN DE STOCK (RF-73) e inserción ---
+        # La receta sale de la caché y una sola consulta trae el stock de sus
+        # insumos, considerando la cantidad pedida, y bloquea esas filas hasta el COMMIT.
+        detail_ids = await _insert_order_items(cursor, order_id, [item])
+        kds_rows = await _kds_rows(cursor, detail_ids)
 
-        conn.commit()
-        return {"detail_id": cursor.lastrowid, "message": "Producto añadido a la orden."}
+        await conn.commit()
+        publish_items_added(kds_rows)
+        return {"detail_id": detail_ids[0], "message": "Producto añadido a la orden."}
     except HTTPException as http_exc:
         # Re-lanza la excepción HTTP para que el frontend la reciba
         raise http_exc
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error al añadir producto: {e}")
     finally:
-        if conn and conn.is_connected():
-            conn.close()
+        await conn.close()
+
+@router.post("/api/orders/{order_id}/items/batch", tags=["POS"])
+async def add_items_to_order(order_id: int, items: List[OrderItem]):
+    """
+    Añade varias líneas a una orden en una sola petición y una sola transacción
+    (por ejemplo, la ronda completa de una mesa).
+    """
+    if not items:
+        raise HTTPException(status_code=400, detail="No se enviaron productos.")
+    session = _training_session_for_order(order_id, any(i.is_training_mode for i in items))
+    if session:
+        detail_ids = _training_add_items(session, order_id, items)
+        return {"detail_ids": detail_ids, "message": f"{len(detail_ids)} productos añadidos a la orden."}
+
+    conn = await get_async_db_connection()
+    if not conn:
+        raise HTTPException(status_code=500, detail="Error de BBDD.")
+    try:
+        cursor = await conn.cursor(dictionary=True)
+        detail_ids = await _insert_order_items(cursor, order_id, items)
+        kds_rows = await _kds_rows(cursor, detail_ids)
+        await conn.commit()
+        publish_items_added(kds_rows)
+        return {"detail_ids": detail_ids, "message": f"{len(detail_ids)} productos añadidos a la orden."}
+    except HTTPException as http_exc:
+        await conn.rollback()
+        raise http_exc
+    except Exception as e:
+        await conn.rollback()
+        raise HTTPException(status_code=500, detail=f"Error al añadir productos: {e}")
+    finally:
+        await conn.close()
+
+@router.post("/api/orders/stock-check", tags=["POS"])
+async def check_cart_stock(lines: List[CartLine]):
+    """
+    Valida en un solo viaje a la BBDD si hay insumos para todo un carrito y
+    devuelve todos los faltantes a la vez (sumando insumos compartidos).
+    """
+    if not lines:
+        return {"ok": True, "shortfalls": []}
+    conn = await get_async_db_connection()
+    if not conn:
+        raise HTTPException(status_code=500, detail="Error de BBDD.")
+    try:
+        cursor = await conn.cursor(dictionary=True)
+        await recipe_cache.ensure_fresh_async(cursor)
+        bom = recipe_cache.bill_of_materials([(l.product_id, l.quantity) for l in lines])
+        shortfalls = []
+        if bom:
+            await cursor.execute(*build_supply_stock_query(bom, lock=False))
+            shortfalls = find_shortfalls(bom, await cursor.fetchall())
+        return {"ok": not shortfalls, "shortfalls": shortfalls}
+    finally:
+        await conn.close()
 
 @router.post("/api/orders/{order_id}/close", tags=["POS"])
-def close_order(order_id: int, close_data: CloseOrder):
+async def close_order(order_id: int, close_data: CloseOrder):
     """
     Registra un pago, cierra la orden, libera la mesa y descuenta el inventario.
     """
-    conn = get_db_connection()
+    session = _training_session_for_order(order_id, close_data.is_training_mode)
+    if session:
+        try:
+            session.close_order(order_id, close_data.payment_method, close_data.amount)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Orden de entrenamiento no encontrada o expirada.")
+        return {"message": f"Orden {order_id} cerrada y pagada."}
+
+    conn = await get_async_db_connection()
     if not conn:
         raise HTTPException(status_code=500, detail="Error de BBDD.")
     try:
-        cursor = conn.cursor(dictionary=True)
+        cursor = await conn.cursor(dictionary=True)
         
-        # Lógica de descuento de inventario
-        cursor.execute("SELECT product_id, quantity FROM order_details WHERE order_id = %s", (order_id,))
-        items_sold = cursor.fetchall()
-        for item in items_sold:
-            cursor.execute("SELECT supply_id, quantity_used FROM recipes WHERE product_id = %s", (item['product_id'],))
-            recipe_items = cursor.fetchall()
-            for recipe_item in recipe_items:
-                quantity_to_decrement = recipe_item['quantity_used'] * item['quantity']
-
-                # Actualizar stock del insumo
-                cursor.execute(
-                    "UPDATE supplies SET current_stock = current_stock - %s WHERE supply_id = %s",
-                    (quantity_to_decrement, recipe_item['supply_id'])
-                )
-
-                # --- NUEVA LÓGICA PARA VERIFICAR STOCK (RF-70) ---
-                cursor.execute(
-                    "SELECT name, current_stock, stock_threshold FROM supplies WHERE supply_id = %s",
-                    (recipe_item['supply_id'],)
-                )
-                supply_status = cursor.fetchone()
-                if supply_status and supply_status['current_stock'] <= supply_status['stock_threshold']:
-                    # Si el stock es bajo, creamos una alerta
-                    alert_message = f"Stock bajo para {supply_status['name']}: {supply_status['current_stock']} restantes."
-                    cursor.execute(
-                        "INSERT INTO alerts (alert_type, message) VALUES ('stock', %s)",
-                        (alert_message,)
-                    )
-
-                # Registrar movimiento
-                move_query = """
-                    INSERT INTO stock_movements (supply_id, order_id, movement_type, quantity_change)
-                    VALUES (%s, %s, 'Venta', %s)
-                """
-                cursor.execute(move_query, (recipe_item['supply_id'], order_id, -quantity_to_decrement))
+        # Lógica de descuento de inventario: una lista de materiales agregada por
+        # orden y un número fijo de sentencias (ver inventory_utils.deplete_inventory).
+        # Las alertas de stock bajo (RF-70) se generan en el mismo paso.
+        await cursor.execute("SELECT product_id, quantity FROM order_details WHERE order_id = %s", (order_id,))
+        items_sold = await cursor.fetchall()
+        await recipe_cache.ensure_fresh_async(cursor)
+        bom = recipe_cache.bill_of_materials([(i['product_id'], i['quantity']) for i in items_sold])
+        await deplete_inventory(cursor, order_id, bom)
 
         # Lógica para cerrar la orden
-        cursor.execute("SELECT table_id, user_id FROM orders WHERE order_id = %s", (order_id,))
-        order_info = cursor.fetchone()
+        await cursor.execute("SELECT table_id, user_id FROM orders WHERE order_id = %s", (order_id,))
+        order_info = await cursor.fetchone()
         
         table_id = order_info['table_id']
         user_id = order_info['user_id']
         
         query_payment = "INSERT INTO payments (order_id, payment_method, amount, processed_by_user_id) VALUES (%s, %s, %s, %s)"
-        cursor.execute(query_payment, (order_id, close_data.payment_method, close_data.amount, user_id))
+        await cursor.execute(query_payment, (order_id, close_data.payment_method, close_data.amount, user_id))
+        payment_id = cursor.lastrowid
         
-        cursor.execute("UPDATE orders SET status = 'Pagada', closed_at = NOW() WHERE order_id = %s", (order_id,))
+        await cursor.execute("UPDATE orders SET status = 'Pagada', closed_at = NOW() WHERE order_id = %s", (order_id,))
+
+        # Resúmenes de ventas de los reportes, en la misma transacción
+        await sales_rollup.record_order_close(cursor, order_id, payment_id)
+        await customer_stats.record_order_close(cursor, order_id, payment_id)
         
         if table_id:
-            cursor.execute("UPDATE restaurant_tables SET status = 'Libre' WHERE table_id = %s", (table_id,))
+            await cursor.execute("UPDATE restaurant_tables SET status = 'Libre' WHERE table_id = %s", (table_id,))
         
-        # --- Control de entrenamiento ---
-        if not close_data.is_training_mode:
-            conn.commit()
-        else:
-            conn.rollback()
+        await conn.commit()
+        kds_bus.publish("order_removed", order_id, status="Pagada")
         
         return {"message": f"Orden {order_id} cerrada y pagada."}
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error al cerrar la orden: {e}")
     finally:
-        if conn and conn.is_connected(): conn.close()
+        await conn.close()
 
 
 @router.get("/api/orders/open", tags=["POS"])
-def get_open_orders():
-    """ Obtiene todas las órdenes que no están cerradas (Abiertas y Listas). """
-    conn = get_db_connection()
+async def get_open_orders(training_user_id: int | None = None):
+    """
+    Obtiene todas las órdenes que no están cerradas (Abiertas y Listas).
+    Con training_user_id devuelve las de la sesión de entrenamiento de esa persona.
+    """
+    if training_user_id is not None:
+        session = await _training_session(training_user_id)
+        return session.get_open_orders()
+    conn = await get_async_db_connection()
     if not conn: return []
     try:
-        cursor = conn.cursor(dictionary=True)
+        cursor = await conn.cursor(dictionary=True)
         query = """
             SELECT o.order_id, o.order_folio, o.created_at, o.status,
                    IFNULL(t.table_name, 'Para Llevar') as table_name
@@ -218,13 +410,20 @@ def get_open_orders():
             WHERE o.status IN ('Abierta', 'Lista')
             ORDER BY o.created_at ASC;
         """
-        cursor.execute(query)
-        return cursor.fetchall()
+        await cursor.execute(query)
+        return await cursor.fetchall()
     except Exception as e:
         print(f"Error al obtener órdenes abiertas: {e}")
         return []
     finally:
-        if conn and conn.is_connected(): conn.close()
+        await conn.close()
+
+@router.delete("/api/training/sessions/{user_id}", tags=["POS"])
+def reset_training_session(user_id: int):
+    """ Descarta la sesión de entrenamiento de una persona para empezar de cero. """
+    if not training_engine.reset_session(user_id):
+        raise HTTPException(status_code=404, detail="No hay sesión de entrenamiento activa.")
+    return {"message": "Sesión de entrenamiento reiniciada."}
 
 @router.delete("/api/order-details/{detail_id}/cancel", tags=["POS"])
 def cancel_order_item(detail_id: int, cancel_data: CancelItem):
@@ -232,6 +431,18 @@ def cancel_order_item(detail_id: int, cancel_data: CancelItem):
     Cancela un item, lo audita y revisa si es una anomalía.
     Cumple con RF-60 y RF-132.
     """
+    # Las líneas de entrenamiento (detail_id negativo) se cancelan en su sesión
+    if detail_id < 0 or cancel_data.is_training_mode:
+        if detail_id >= 0:
+            raise HTTPException(status_code=400, detail="La línea no pertenece al modo entrenamiento.")
+        session = training_engine.session_for_detail(detail_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Línea de entrenamiento no encontrada o expirada.")
+        try:
+            session.cancel_item(detail_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Línea de entrenamiento no encontrada.")
+        return {"message": "Producto cancelado (modo entrenamiento)."}
     conn = get_db_connection()
     if not conn: raise HTTPException(status_code=500, detail="Error de BBDD.")
     try:
@@ -245,14 +456,33 @@ def cancel_order_item(detail_id: int, cancel_data: CancelItem):
             raise HTTPException(status_code=403, detail="No tienes permiso para cancelar productos.")
 
         # 2. Obtener info del producto antes de borrarlo para la auditoría
-        cursor.execute("SELECT od.order_id, p.name FROM order_details od JOIN products p ON od.product_id = p.product_id WHERE od.detail_id = %s", (detail_id,))
+        cursor.execute("""
+            SELECT od.order_id, od.product_id, od.quantity, od.price_at_time_of_order, p.name, p.station,
+                   od.status AS item_status, o.status AS order_status, o.closed_at, o.customer_id
+            FROM order_details od
+            JOIN products p ON od.product_id = p.product_id
+            JOIN orders o ON od.order_id = o.order_id
+            WHERE od.detail_id = %s
+        """, (detail_id,))
         item_info = cursor.fetchone()
 
-        # 3. Eliminar el item de la orden
+        # 3. Eliminar el item de la orden (y su registro de tiempos del KDS)
         cursor.execute("DELETE FROM order_details WHERE detail_id = %s", (detail_id,))
+        cursor.execute(DELETE_TIMING, (detail_id,))
+        tickets = []
+        if item_info and item_info['order_status'] == 'Abierta' and item_info['item_status'] != 'Listo':
+            # Si era lo único pendiente de su comanda, la comanda queda completa
+            cursor.execute(*build_ticket_query([item_info['order_id']]))
+            tickets = completed_tickets(cursor.fetchall(), {(item_info['order_id'], item_info['station'])})
 
         # 4. Registrar la acción en la bitácora de auditoría
         if item_info:
+            sales_rollup.record_cancelled_line(cursor, item_info)
+            customer_stats.record_cancelled_line(cursor, item_info)
+            if item_info['order_status'] == 'Pagada':
+                analytics_cube.note_correction(cursor, detail_id)
+            if item_info['closed_at']:
+                report_cache.note_write(cursor, "sales", item_info['closed_at'])
             audit_details = {"order_id": item_info['order_id'], "product_cancelled": item_info['name'], "reason": cancel_data.reason}
             cursor.execute("INSERT INTO audit_logs (user_id, action, details) VALUES (%s, %s, %s)",
                            (user_id_cancelling, 'CANCEL_ORDER_ITEM', json.dumps(audit_details)))
@@ -272,6 +502,9 @@ def cancel_order_item(detail_id: int, cancel_data: CancelItem):
             cursor.execute("INSERT INTO alerts (alert_type, message) VALUES ('anomaly', %s)", (alert_message,))
 
         conn.commit()
+        record_tickets(tickets)
+        if item_info:
+            kds_bus.publish("item_removed", item_info['order_id'], {item_info['station']}, detail_id=detail_id)
         return {"message": "Producto cancelado y acción registrada."}
     except Exception as e:
         conn.rollback()
@@ -1,6 +1,7 @@
 # api/routers/predictions.py
 from fastapi import APIRouter, HTTPException
 from database import get_db_connection  # Asegúrate de tener esta función
+from product_costs import product_costs
 import tensorflow as tf
 import numpy as np
 import datetime
@@ -41,25 +42,19 @@ def suggest_price_optimization():
     try:
         cursor = conn.cursor(dictionary=True)
 
-        query = """
-            SELECT 
-                p.product_id, 
-                p.name, 
-                p.price,
-                (SELECT SUM(r.quantity_used * s.last_cost) 
-                 FROM recipes r 
-                 JOIN supplies s ON r.supply_id = s.supply_id 
-                 WHERE r.product_id = p.product_id) AS cost
-            FROM products p
-            WHERE p.product_id IN (SELECT DISTINCT product_id FROM recipes);
-        """
-        cursor.execute(query)
+        # Costos de receta desde el índice en memoria (ver product_costs.py)
+        product_costs.ensure_fresh(cursor)
+        product_ids = product_costs.products_with_recipe()
+        if not product_ids:
+            return []
+        placeholders = ", ".join(["%s"] * len(product_ids))
+        cursor.execute(f"SELECT product_id, name, price FROM products WHERE product_id IN ({placeholders})", product_ids)
         products = cursor.fetchall()
 
         suggestions = []
         for p in products:
-            cost = p['cost'] if p['cost'] else 0
-            price = p['price']
+            cost = product_costs.cost(p['product_id'])
+            price = float(p['price'])
 
             if cost <= 0:
                 continue  # No hay receta, no sugerimos
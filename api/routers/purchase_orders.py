@@ -2,6 +2,7 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from database import get_db_connection
+from product_costs import product_costs
 from typing import List
 
 router = APIRouter()
@@ -94,7 +95,7 @@ def receive_purchase_order(po_id: int):
         cursor = conn.cursor(dictionary=True)
 
         # 1. Obtener todos los insumos de la orden de compra
-        cursor.execute("SELECT supply_id, quantity FROM purchase_order_items WHERE po_id = %s", (po_id,))
+        cursor.execute("SELECT supply_id, quantity, cost FROM purchase_order_items WHERE po_id = %s", (po_id,))
         items_to_receive = cursor.fetchall()
 
         if not items_to_receive:
@@ -102,14 +103,19 @@ def receive_purchase_order(po_id: int):
 
         # 2. Actualizar el stock por cada insumo
         for item in items_to_receive:
-            # Suma la cantidad al stock actual del insumo
-            cursor.execute("UPDATE supplies SET current_stock = current_stock + %s WHERE supply_id = %s", (item['quantity'], item['supply_id']))
+            # Suma la cantidad al stock actual del insumo y registra su último costo
+            # unitario (el costo de la orden de compra es el total de la línea)
+            unit_cost = item['cost'] / item['quantity'] if item['cost'] is not None and item['quantity'] else None
+            cursor.execute("UPDATE supplies SET current_stock = current_stock + %s, last_cost = COALESCE(%s, last_cost) WHERE supply_id = %s",
+                           (item['quantity'], unit_cost, item['supply_id']))
             # Opcional: Registrar el movimiento de 'Entrada' en la bitácora
             move_query = "INSERT INTO stock_movements (supply_id, movement_type, quantity_change, reason) VALUES (%s, 'Entrada', %s, %s)"
             cursor.execute(move_query, (item['supply_id'], item['quantity'], f"Recepción de Orden de Compra #{po_id}"))
 
         # 3. Actualizar el estado de la orden de compra
         cursor.execute("UPDATE purchase_orders SET status = 'Recibida' WHERE po_id = %s", (po_id,))
+        # Los costos de receta de los productos con estos insumos cambian
+        product_costs.invalidate(cursor)
 
         conn.commit()
         return {"message": "Mercancía recibida y stock actualizado con éxito."}
@@ -2,6 +2,8 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from database import get_db_connection
+from recipe_cache import recipe_cache
+from product_costs import product_costs
 from typing import List
 
 router = APIRouter()
@@ -35,6 +37,7 @@ def add_item_to_recipe(product_id: int, item: RecipeItem):
         cursor = conn.cursor()
         query = "INSERT INTO recipes (product_id, supply_id, quantity_used) VALUES (%s, %s, %s)"
         cursor.execute(query, (product_id, item.supply_id, item.quantity_used))
+        recipe_cache.invalidate(cursor)
         conn.commit()
         return {"message": "Insumo añadido a la receta."}
     finally:
@@ -53,18 +56,11 @@ def get_recipe_cost(product_id: int):
         raise HTTPException(status_code=500, detail="Error de BBDD.")
     try:
         cursor = conn.cursor(dictionary=True)
-        # Unimos las tablas de recetas e insumos para multiplicar la cantidad por el último costo
-        query = """
-            SELECT SUM(r.quantity_used * s.last_cost) as total_cost
-            FROM recipes r
-            JOIN supplies s ON r.supply_id = s.supply_id
-            WHERE r.product_id = %s;
-        """
-        cursor.execute(query, (product_id,))
-        result = cursor.fetchone()
+        # El costo sale del índice en memoria (cantidad por último costo de cada insumo)
+        product_costs.ensure_fresh(cursor)
 
         # Si el producto no tiene receta o costo, devolvemos 0
-        total_cost = result['total_cost'] if result['total_cost'] else 0
+        total_cost = product_costs.cost(product_id)
 
         return {"product_id": product_id, "total_cost": total_cost}
     finally:
@@ -1,30 +1,40 @@
 # api/routers/reports.py
 from fastapi import APIRouter, HTTPException
 from database import get_db_connection
+from product_costs import product_costs
+from report_cache import report_cache
+from exports import export_response
+import report_jobs
+import kpi_engine
+import dashboard_widgets
 from typing import List
+import datetime
 
 router = APIRouter()
 
+
+def _top_products(cursor):
+    cursor.execute("""
+        SELECT p.name, SUM(r.units) as total_sold
+        FROM sales_rollup r
+        JOIN products p ON r.product_id = p.product_id
+        GROUP BY p.product_id, p.name
+        ORDER BY total_sold DESC
+        LIMIT 10;
+    """)
+    return cursor.fetchall()
+
 @router.get("/api/reports/top-products", tags=["Reports"])
 def get_top_selling_products():
     """
     Obtiene un reporte de los productos más vendidos. Cumple con RF-78.
+    Lee el resumen de ventas (unidades de órdenes pagadas), no order_details.
     """
     conn = get_db_connection()
     if not conn:
         raise HTTPException(status_code=500, detail="Error de BBDD.")
     try:
-        cursor = conn.cursor(dictionary=True)
-        query = """
-            SELECT p.name, SUM(od.quantity) as total_sold
-            FROM order_details od
-            JOIN products p ON od.product_id = p.product_id
-            GROUP BY p.name
-            ORDER BY total_sold DESC
-            LIMIT 10;
-        """
-        cursor.execute(query)
-        return cursor.fetchall()
+        return _top_products(conn.cursor(dictionary=True))
     finally:
         conn.close()
 
@@ -48,26 +58,38 @@ def get_promotions_report():
         if conn and conn.is_connected(): conn.close()
 
         
+# Suma los montos del resumen de pagos por día y los agrupa
+CASH_FLOW_QUERY = """
+    SELECT payment_method, SUM(amount) as total_amount
+    FROM payments_rollup
+    WHERE sale_date BETWEEN %s AND %s
+    GROUP BY payment_method
+"""
+
 @router.get("/api/reports/cash-flow", tags=["Reports"])
-def get_cash_flow_report(start_date: str, end_date: str):
+def get_cash_flow_report(start_date: str, end_date: str, format: str | None = None):
     """
     Calcula el total de ventas agrupado por método de pago para un rango de fechas.
     Cumple con la base del requerimiento RF-61.
+    Con `format` (csv, ndjson, csv.gz, ndjson.gz) se descarga en streaming.
     """
+    if format:
+        return export_response(CASH_FLOW_QUERY, (start_date, end_date),
+                               [("Método de pago", "payment_method"), ("Total", "total_amount")],
+                               format, f"corte_de_caja_{start_date}_a_{end_date}")
     conn = get_db_connection()
     if not conn:
         return []
     try:
         cursor = conn.cursor(dictionary=True)
-        # Suma los montos de la tabla 'payments' y los agrupa
-        query = """
-            SELECT payment_method, SUM(amount) as total_amount
-            FROM payments
-            WHERE DATE(payment_timestamp) BETWEEN %s AND %s
-            GROUP BY payment_method;
-        """
-        cursor.execute(query, (start_date, end_date))
-        return cursor.fetchall()
+
+        def compute():
+            cursor.execute(CASH_FLOW_QUERY, (start_date, end_date))
+            return cursor.fetchall()
+
+        # Los rangos ya cerrados se sirven de la caché de reportes
+        return report_cache.fetch(cursor, "cash-flow", {"start_date": start_date, "end_date": end_date},
+                                  end_date, ("sales",), compute)
     except Exception as e:
         print(f"Error al generar el reporte de corte de caja: {e}")
         return []
@@ -75,6 +97,30 @@ def get_cash_flow_report(start_date: str, end_date: str):
         if conn and conn.is_connected():
             conn.close()
 
+def _daily_kpis(cursor):
+    # Consulta para obtener las ventas totales y el número de órdenes del día
+    query = """
+        SELECT
+            SUM(amount) as total_sales,
+            SUM(order_count) as order_count
+        FROM payments_rollup
+        WHERE sale_date = CURDATE();
+    """
+    cursor.execute(query)
+    result = cursor.fetchone()
+
+    total_sales = result['total_sales'] if result['total_sales'] else 0
+    order_count = result['order_count'] if result['order_count'] else 0
+
+    # Calcula el ticket promedio, evitando la división por cero
+    average_ticket = total_sales / order_count if order_count > 0 else 0
+
+    return {
+        "total_sales": total_sales,
+        "order_count": order_count,
+        "average_ticket": average_ticket
+    }
+
 @router.get("/api/reports/daily-kpis", tags=["Reports"])
 def get_daily_kpis():
     """
@@ -85,30 +131,7 @@ def get_daily_kpis():
     if not conn:
         return {"total_sales": 0, "order_count": 0, "average_ticket": 0}
     try:
-        cursor = conn.cursor(dictionary=True)
-
-        # Consulta para obtener las ventas totales y el número de órdenes del día
-        query = """
-            SELECT
-                SUM(amount) as total_sales,
-                COUNT(DISTINCT order_id) as order_count
-            FROM payments
-            WHERE DATE(payment_timestamp) = CURDATE();
-        """
-        cursor.execute(query)
-        result = cursor.fetchone()
-
-        total_sales = result['total_sales'] if result['total_sales'] else 0
-        order_count = result['order_count'] if result['order_count'] else 0
-
-        # Calcula el ticket promedio, evitando la división por cero
-        average_ticket = total_sales / order_count if order_count > 0 else 0
-
-        return {
-            "total_sales": total_sales,
-            "order_count": order_count,
-            "average_ticket": average_ticket
-        }
+        return _daily_kpis(conn.cursor(dictionary=True))
     except Exception as e:
         print(f"Error al calcular KPIs diarios: {e}")
         return {"total_sales": 0, "order_count": 0, "average_ticket": 0}
@@ -116,35 +139,78 @@ def get_daily_kpis():
         if conn and conn.is_connected():
             conn.close()
 
+def _profitability_query(start_date=None, end_date=None, order_by=""):
+    conditions, params = [], []
+    if start_date:
+        conditions.append("r.sale_date >= %s")
+        params.append(start_date)
+    if end_date:
+        conditions.append("r.sale_date <= %s")
+        params.append(end_date)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"""
+        SELECT
+            p.product_id,
+            p.name,
+            p.price AS sale_price,
+            SUM(r.units) AS units_sold,
+            SUM(r.revenue) AS total_revenue
+        FROM sales_rollup r
+        JOIN products p ON r.product_id = p.product_id
+        {where}
+        GROUP BY p.product_id, p.name, p.price
+        {order_by}
+    """
+    return query, params
+
+def _profitability_row(row):
+    """ Fila del reporte de rentabilidad con el costo de receta del índice product_costs. """
+    units = float(row['units_sold'] or 0)
+    revenue = float(row['total_revenue'] or 0)
+    recipe_cost = product_costs.cost(row['product_id'])
+    total_cost = recipe_cost * units
+    return {
+        "name": row['name'],
+        "units_sold": units,
+        "sale_price": row['sale_price'],
+        "total_revenue": revenue,
+        "recipe_cost": recipe_cost,
+        "total_cost": total_cost,
+        "profit_margin": float(row['sale_price']) - recipe_cost,
+        "total_profit": revenue - total_cost,
+    }
+
+PROFITABILITY_EXPORT_COLUMNS = [
+    ("Producto", "name"), ("Unidades vendidas", "units_sold"), ("Precio de venta", "sale_price"),
+    ("Ingresos", "total_revenue"), ("Costo de receta", "recipe_cost"), ("Costo total", "total_cost"),
+    ("Margen por unidad", "profit_margin"), ("Utilidad total", "total_profit"),
+]
+
 @router.get("/api/reports/profitability", tags=["Reports"])
-def get_profitability_report():
+def get_profitability_report(start_date: str | None = None, end_date: str | None = None, format: str | None = None):
     """
     Calcula la rentabilidad por producto.
     Cumple con el requerimiento RF-79.
+    Unidades e ingresos salen del resumen de ventas en una sola pasada agrupada
+    (ponderando por cantidad y con el precio cobrado); el costo de receta, del
+    índice en memoria product_costs. Con `format` se descarga en streaming,
+    ordenado por ingresos (la utilidad se calcula fila por fila).
     """
+    if format:
+        query, params = _profitability_query(start_date, end_date, "ORDER BY total_revenue DESC")
+        return export_response(query, params, PROFITABILITY_EXPORT_COLUMNS, format,
+                               f"rentabilidad_{start_date or 'inicio'}_a_{end_date or 'hoy'}", _profitability_row,
+                               prepare=lambda conn: product_costs.ensure_fresh(conn.cursor(dictionary=True)))
     conn = get_db_connection()
     if not conn:
         return []
     try:
         cursor = conn.cursor(dictionary=True)
-        # Esta es una consulta compleja que une varias tablas para calcular la rentabilidad
-        query = """
-            SELECT
-                p.name,
-                COUNT(od.product_id) AS units_sold,
-                p.price AS sale_price,
-                SUM(p.price) AS total_revenue,
-                (SELECT SUM(r.quantity_used * s.last_cost) FROM recipes r JOIN supplies s ON r.supply_id = s.supply_id WHERE r.product_id = p.product_id) AS recipe_cost,
-                SUM((SELECT SUM(r.quantity_used * s.last_cost) FROM recipes r JOIN supplies s ON r.supply_id = s.supply_id WHERE r.product_id = p.product_id)) AS total_cost,
-                (p.price - (SELECT SUM(r.quantity_used * s.last_cost) FROM recipes r JOIN supplies s ON r.supply_id = s.supply_id WHERE r.product_id = p.product_id)) AS profit_margin,
-                SUM(p.price - (SELECT SUM(r.quantity_used * s.last_cost) FROM recipes r JOIN supplies s ON r.supply_id = s.supply_id WHERE r.product_id = p.product_id)) AS total_profit
-            FROM order_details od
-            JOIN products p ON od.product_id = p.product_id
-            GROUP BY p.product_id, p.name, p.price
-            ORDER BY total_profit DESC;
-        """
-        cursor.execute(query)
-        return cursor.fetchall()
+        product_costs.ensure_fresh(cursor)
+        cursor.execute(*_profitability_query(start_date, end_date))
+        report = [_profitability_row(row) for row in cursor.fetchall()]
+        report.sort(key=lambda r: r["total_profit"], reverse=True)
+        return report
     except Exception as e:
         print(f"Error al generar el reporte de rentabilidad: {e}")
         return []
@@ -152,6 +218,59 @@ def get_profitability_report():
         if conn and conn.is_connected():
             conn.close()
 
+def _profitability_job(conn, params, progress):
+    """ Rentabilidad en segundo plano (ver report_jobs.py): mismos parámetros que el endpoint. """
+    cursor = conn.cursor(dictionary=True)
+    product_costs.ensure_fresh(cursor)
+    progress(0.1)
+    rows = report_jobs.collect(cursor, *_profitability_query(params.get("start_date"), params.get("end_date")), progress)
+    report = [_profitability_row(row) for row in rows]
+    report.sort(key=lambda r: r["total_profit"], reverse=True)
+    return report
+
+report_jobs.register("profitability", _profitability_job)
+
+@router.get("/api/reports/kpi", tags=["Reports"])
+def list_kpis():
+    """ KPIs disponibles para /api/reports/kpi/{metric}. """
+    return {
+        "metrics": [{"name": name, "label": metric["label"]} for name, metric in kpi_engine.KPI_METRICS.items()],
+        "periods": list(kpi_engine.PERIODS),
+        "compare": list(kpi_engine.COMPARISONS),
+    }
+
+@router.get("/api/reports/kpi/{metric}", tags=["Reports"])
+def get_kpi(metric: str, period: str = "month", compare: str = "previous", anchor: datetime.date | None = None,
+            start_date: datetime.date | None = None, end_date: datetime.date | None = None, to_date: bool = False):
+    """
+    Compara un KPI entre el periodo que contiene `anchor` (hoy por defecto) y
+    el anterior (compare=previous) o el mismo del año pasado (compare=year).
+    period: day, week, month o custom (con start_date y end_date). Con
+    to_date=true ambos periodos se recortan al tramo transcurrido.
+    """
+    conn = get_db_connection()
+    if not conn: raise HTTPException(status_code=500, detail="Error de BBDD.")
+    try:
+        cursor = conn.cursor(dictionary=True)
+        return kpi_engine.compute(cursor, metric, period, compare, anchor, start_date, end_date, to_date)
+    except kpi_engine.KpiError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        if conn and conn.is_connected(): conn.close()
+
+def _reservations_kpi(cursor):
+    kpi = kpi_engine.compute(cursor, "reservations", "month", "previous")
+    return {
+        "current_month": int(kpi["current"]["value"]),
+        "previous_month": int(kpi["previous"]["value"]),
+        "percentage_change": kpi["percentage_change"],
+    }
+
+def _waste_kpi(cursor):
+    # Mermas en cantidad (no en costo), como siempre se ha reportado
+    kpi = kpi_engine.compute(cursor, "waste", "month", "previous")
+    return {"percentage_change": kpi["percentage_change"]}
+
 @router.get("/api/reports/reservations-kpi", tags=["Reports"])
 def get_reservations_kpi():
     """
@@ -161,24 +280,7 @@ def get_reservations_kpi():
     conn = get_db_connection()
     if not conn: return {"current_month": 0, "previous_month": 0, "percentage_change": 0}
     try:
-        cursor = conn.cursor(dictionary=True)
-        # Cuenta las reservaciones confirmadas del mes actual
-        query_current = "SELECT COUNT(*) as count FROM reservations WHERE status = 'Confirmada' AND MONTH(created_at) = MONTH(CURDATE()) AND YEAR(created_at) = YEAR(CURDATE())"
-        cursor.execute(query_current)
-        current_month = cursor.fetchone()['count']
-
-        # Cuenta las reservaciones confirmadas del mes anterior
-        query_previous = "SELECT COUNT(*) as count FROM reservations WHERE status = 'Confirmada' AND MONTH(created_at) = MONTH(CURDATE() - INTERVAL 1 MONTH) AND YEAR(created_at) = YEAR(CURDATE() - INTERVAL 1 MONTH)"
-        cursor.execute(query_previous)
-        previous_month = cursor.fetchone()['count']
-
-        # Calcula el cambio porcentual
-        if previous_month > 0:
-            percentage_change = ((current_month - previous_month) / previous_month) * 100
-        else:
-            percentage_change = 100 if current_month > 0 else 0
-
-        return {"current_month": current_month, "previous_month": previous_month, "percentage_change": percentage_change}
+        return _reservations_kpi(conn.cursor(dictionary=True))
     finally:
         if conn and conn.is_connected(): conn.close()
 
@@ -191,52 +293,78 @@ def get_waste_kpi():
     conn = get_db_connection()
     if not conn: return {"percentage_change": 0}
     try:
-        cursor = conn.cursor(dictionary=True)
-        # Suma el valor de las mermas del mes actual (asumiendo costo, simplificado a cantidad)
-        query_current = "SELECT SUM(ABS(quantity_change)) as total FROM stock_movements WHERE movement_type LIKE 'Ajuste Merma' AND MONTH(movement_timestamp) = MONTH(CURDATE())"
-        cursor.execute(query_current)
-        current_waste = cursor.fetchone()['total'] or 0
-
-        # Suma el valor de las mermas del mes anterior
-        query_previous = "SELECT SUM(ABS(quantity_change)) as total FROM stock_movements WHERE movement_type LIKE 'Ajuste Merma' AND MONTH(movement_timestamp) = MONTH(CURDATE() - INTERVAL 1 MONTH)"
-        cursor.execute(query_previous)
-        previous_waste = cursor.fetchone()['total'] or 0
-
-        if previous_waste > 0:
-            percentage_change = ((current_waste - previous_waste) / previous_waste) * 100
-        else:
-            percentage_change = 100 if current_waste > 0 else 0
-
-        return {"percentage_change": percentage_change}
+        return _waste_kpi(conn.cursor(dictionary=True))
     finally:
         if conn and conn.is_connected(): conn.close()
 
+# Widgets del panel de control (ver dashboard_widgets.py); TTL en segundos
+dashboard_widgets.register("daily-kpis", _daily_kpis, ttl=30)
+dashboard_widgets.register("reservations-kpi", _reservations_kpi, ttl=300)
+dashboard_widgets.register("waste-kpi", _waste_kpi, ttl=300)
+dashboard_widgets.register("top-products", _top_products, ttl=300)
+
+# Lee el resumen diario por cliente en lugar de unir órdenes y pagos
+FREQUENT_CUSTOMERS_QUERY = """
+    SELECT
+        c.full_name,
+        SUM(r.visits) AS visit_count,
+        SUM(r.amount) AS total_spent
+    FROM customer_sales_rollup r
+    JOIN customers c ON c.customer_id = r.customer_id
+    WHERE r.sale_date BETWEEN %s AND %s
+    GROUP BY c.customer_id, c.full_name
+    ORDER BY total_spent DESC
+"""
+
+# Sin rango de fechas: métricas de por vida ya calculadas (ver customer_stats.py)
+LIFETIME_CUSTOMERS_QUERY = """
+    SELECT c.full_name, s.visits AS visit_count, s.total_spent
+    FROM customer_stats s
+    JOIN customers c ON c.customer_id = s.customer_id
+    ORDER BY s.total_spent DESC
+"""
+
+FREQUENT_CUSTOMERS_COLUMNS = [("Cliente", "full_name"), ("Visitas", "visit_count"), ("Total gastado", "total_spent")]
+
 @router.get("/api/reports/frequent-customers", tags=["Reports"])
-def get_frequent_customers_report(start_date: str, end_date: str):
+def get_frequent_customers_report(start_date: str | None = None, end_date: str | None = None, format: str | None = None):
     """
     Genera un reporte de los clientes más frecuentes y con mayor gasto.
     Cumple con el requerimiento RF-146.
+    Sin start_date/end_date se reporta el historial completo de cada cliente.
+    Con `format` (csv, ndjson, csv.gz, ndjson.gz) se descarga en streaming.
     """
+    if bool(start_date) != bool(end_date):
+        raise HTTPException(status_code=400, detail="Indica start_date y end_date, o ninguno para el historial completo.")
+    if not start_date:
+        if format:
+            return export_response(LIFETIME_CUSTOMERS_QUERY, (), FREQUENT_CUSTOMERS_COLUMNS,
+                                   format, "clientes_frecuentes_historico")
+        conn = get_db_connection()
+        if not conn:
+            return []
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(LIFETIME_CUSTOMERS_QUERY)
+            return cursor.fetchall()
+        finally:
+            if conn and conn.is_connected():
+                conn.close()
+    if format:
+        return export_response(FREQUENT_CUSTOMERS_QUERY, (start_date, end_date), FREQUENT_CUSTOMERS_COLUMNS,
+                               format, f"clientes_frecuentes_{start_date}_a_{end_date}")
     conn = get_db_connection()
     if not conn:
         return []
     try:
         cursor = conn.cursor(dictionary=True)
-        # Esta consulta une clientes, órdenes y pagos para calcular las métricas
-        query = """
-            SELECT
-                c.full_name,
-                COUNT(DISTINCT o.order_id) AS visit_count,
-                SUM(p.amount) AS total_spent
-            FROM customers c
-            JOIN orders o ON c.customer_id = o.customer_id
-            JOIN payments p ON o.order_id = p.order_id
-            WHERE o.status = 'Pagada' AND DATE(p.payment_timestamp) BETWEEN %s AND %s
-            GROUP BY c.customer_id, c.full_name
-            ORDER BY total_spent DESC;
-        """
-        cursor.execute(query, (start_date, end_date))
-        return cursor.fetchall()
+
+        def compute():
+            cursor.execute(FREQUENT_CUSTOMERS_QUERY, (start_date, end_date))
+            return cursor.fetchall()
+
+        return report_cache.fetch(cursor, "frequent-customers", {"start_date": start_date, "end_date": end_date},
+                                  end_date, ("sales", "customers"), compute)
     except Exception as e:
         print(f"Error al generar reporte de clientes frecuentes: {e}")
         return []
@@ -0,0 +1,33 @@
+# api/routers/system.py
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from database import get_pool_stats
+from async_database import get_async_pool_stats
+from query_metrics import get_registry
+from report_cache import report_cache
+
+router = APIRouter()
+
+@router.get("/api/_pool", tags=["System"])
+def get_connection_pool_stats():
+    """
+    Devuelve las estadísticas del pool de conexiones (en uso, esperas,
+    tiempo de espera, conexiones por segundo) para poder dimensionarlo.
+    """
+    return {
+        "sync": get_pool_stats() or {"status": "El pool de conexiones no está inicializado."},
+        "async": get_async_pool_stats() or {"status": "El pool asíncrono no está inicializado."},
+    }
+
+@router.get("/api/_report_cache", tags=["System"])
+def get_report_cache_stats():
+    """ Estado de la caché de reportes: entradas, aciertos en memoria y en disco, fallos y tasa de aciertos. """
+    return report_cache.stats()
+
+@router.get("/api/_metrics", tags=["System"], response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Métricas agregadas en formato de texto de Prometheus: sentencias y tiempo
+    de BBDD por endpoint, formas de sentencia más costosas y estado del pool.
+    """
+    return PlainTextResponse(get_registry().render_prometheus(), media_type="text/plain; version=0.0.4")
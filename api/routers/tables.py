@@ -2,6 +2,7 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from database import get_db_connection
+import dashboard_widgets
 from typing import List
 
 router = APIRouter()
@@ -68,4 +69,31 @@ def delete_table(table_id: int):
         conn.commit()
         return {"message": "Mesa eliminada con éxito."}
     finally:
-        if conn and conn.is_connected(): conn.close()
\ No newline at end of file
+        if conn and conn.is_connected(): conn.close()
+
+def _occupancy(cursor):
+    cursor.execute("SELECT status, COUNT(*) AS count FROM restaurant_tables GROUP BY status")
+    by_status = {row['status']: row['count'] for row in cursor.fetchall()}
+    cursor.execute("SELECT COUNT(*) AS count FROM orders WHERE status = 'Abierta'")
+    open_orders = cursor.fetchone()['count']
+    total = sum(by_status.values())
+    occupied = by_status.get('Ocupada', 0)
+    return {
+        "total_tables": total,
+        "occupied_tables": occupied,
+        "occupancy_percentage": round(occupied / total * 100) if total else 0,
+        "open_orders": open_orders,
+        "by_status": by_status,
+    }
+
+@router.get("/api/tables/occupancy", tags=["Tables"])
+def get_table_occupancy():
+    """ Mesas por estado, porcentaje de ocupación actual y órdenes abiertas. """
+    conn = get_db_connection()
+    if not conn: raise HTTPException(status_code=500, detail="Error de BBDD.")
+    try:
+        return _occupancy(conn.cursor(dictionary=True))
+    finally:
+        if conn and conn.is_connected(): conn.close()
+
+dashboard_widgets.register("occupancy", _occupancy, ttl=5)
@@ -0,0 +1,213 @@
+# api/sales_rollup.py
+"""
+Tablas resumen de ventas para los reportes.
+
+Los reportes de ventas ya no re-agregan payments y order_details en cada
+consulta; leen estas tablas, que se actualizan dentro de la misma transacción
+que cierra (o corrige) una orden:
+
+  sales_rollup           día × hora × producto: unidades, ingreso y líneas
+                         (por orders.closed_at, solo órdenes pagadas).
+  payments_rollup        día × hora × método de pago: monto, pagos y órdenes
+                         (por payments.payment_timestamp).
+  customer_sales_rollup  día × cliente: visitas y monto pagado.
+
+Se guardan por separado porque un pago no se reparte entre productos. Las
+claves primarias empiezan por la fecha, así que los filtros por rango de días
+usan el índice.
+
+Reconstrucción (p. ej. después de cargar datos históricos; mejor fuera del
+horario de servicio, pues un cierre concurrente del mes en curso podría quedar
+fuera):
+    python sales_rollup.py rebuild [--desde 2024-01-01] [--hasta 2024-12-31]
+"""
+import datetime
+
+import analytics_cube
+from report_cache import report_cache
+
+CREATE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS sales_rollup (
+        sale_date DATE NOT NULL,
+        sale_hour TINYINT NOT NULL,
+        product_id INT NOT NULL,
+        units DECIMAL(14,3) NOT NULL DEFAULT 0,
+        revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+        line_count INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (sale_date, sale_hour, product_id),
+        KEY idx_sales_rollup_product (product_id, sale_date)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS payments_rollup (
+        sale_date DATE NOT NULL,
+        sale_hour TINYINT NOT NULL,
+        payment_method VARCHAR(50) NOT NULL,
+        amount DECIMAL(14,2) NOT NULL DEFAULT 0,
+        payment_count INT NOT NULL DEFAULT 0,
+        order_count INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (sale_date, sale_hour, payment_method)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS customer_sales_rollup (
+        sale_date DATE NOT NULL,
+        customer_id INT NOT NULL,
+        visits INT NOT NULL DEFAULT 0,
+        amount DECIMAL(14,2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (sale_date, customer_id),
+        KEY idx_customer_sales_rollup_customer (customer_id, sale_date)
+    )
+    """,
+]
+
+# --- Actualización incremental ---
+
+ORDER_SALES_UPSERT = """
+    INSERT INTO sales_rollup (sale_date, sale_hour, product_id, units, revenue, line_count)
+    SELECT DATE(o.closed_at), HOUR(o.closed_at), od.product_id,
+           SUM(od.quantity), SUM(od.quantity * od.price_at_time_of_order), COUNT(*)
+    FROM orders o JOIN order_details od ON od.order_id = o.order_id
+    WHERE o.order_id = %s
+    GROUP BY od.product_id
+    ON DUPLICATE KEY UPDATE
+        units = units + VALUES(units),
+        revenue = revenue + VALUES(revenue),
+        line_count = line_count + VALUES(line_count)
+"""
+
+PAYMENT_UPSERT = """
+    INSERT INTO payments_rollup (sale_date, sale_hour, payment_method, amount, payment_count, order_count)
+    SELECT DATE(payment_timestamp), HOUR(payment_timestamp), payment_method, amount, 1, 1
+    FROM payments WHERE payment_id = %s
+    ON DUPLICATE KEY UPDATE
+        amount = amount + VALUES(amount),
+        payment_count = payment_count + 1,
+        order_count = order_count + 1
+"""
+
+CUSTOMER_UPSERT = """
+    INSERT INTO customer_sales_rollup (sale_date, customer_id, visits, amount)
+    SELECT DATE(p.payment_timestamp), o.customer_id, 1, p.amount
+    FROM payments p JOIN orders o ON p.order_id = o.order_id
+    WHERE p.payment_id = %s AND o.customer_id IS NOT NULL
+    ON DUPLICATE KEY UPDATE
+        visits = visits + 1,
+        amount = amount + VALUES(amount)
+"""
+
+CANCELLED_LINE_UPDATE = """
+    UPDATE sales_rollup
+    SET units = units - %s, revenue = revenue - %s, line_count = line_count - 1
+    WHERE sale_date = %s AND sale_hour = %s AND product_id = %s
+"""
+
+
+async def record_order_close(cursor, order_id, payment_id):
+    """
+    Suma al resumen la orden recién pagada. Llamar dentro de la transacción de
+    close_order, después de insertar el pago y marcar la orden como 'Pagada'.
+    """
+    await cursor.execute(ORDER_SALES_UPSERT, (order_id,))
+    await cursor.execute(PAYMENT_UPSERT, (payment_id,))
+    await cursor.execute(CUSTOMER_UPSERT, (payment_id,))
+
+
+def record_cancelled_line(cursor, item):
+    """
+    Resta del resumen una línea cancelada de una orden ya pagada. `item` trae
+    product_id, quantity, price_at_time_of_order, order_status y closed_at.
+    Las líneas de órdenes abiertas aún no están en el resumen.
+    """
+    if item.get('order_status') != 'Pagada' or not item.get('closed_at'):
+        return
+    closed_at = item['closed_at']
+    revenue = item['quantity'] * item['price_at_time_of_order']
+    cursor.execute(CANCELLED_LINE_UPDATE, (
+        item['quantity'], revenue, closed_at.date(), closed_at.hour, item['product_id']
+    ))
+
+
+# --- Reconstrucción ---
+
+REBUILD_STATEMENTS = [
+    ("DELETE FROM sales_rollup WHERE sale_date BETWEEN %s AND %s", """
+        INSERT INTO sales_rollup (sale_date, sale_hour, product_id, units, revenue, line_count)
+        SELECT DATE(o.closed_at), HOUR(o.closed_at), od.product_id,
+               SUM(od.quantity), SUM(od.quantity * od.price_at_time_of_order), COUNT(*)
+        FROM orders o JOIN order_details od ON od.order_id = o.order_id
+        WHERE o.status = 'Pagada' AND o.closed_at >= %s AND o.closed_at < %s + INTERVAL 1 DAY
+        GROUP BY DATE(o.closed_at), HOUR(o.closed_at), od.product_id
+    """),
+    ("DELETE FROM payments_rollup WHERE sale_date BETWEEN %s AND %s", """
+        INSERT INTO payments_rollup (sale_date, sale_hour, payment_method, amount, payment_count, order_count)
+        SELECT DATE(payment_timestamp), HOUR(payment_timestamp), payment_method,
+               SUM(amount), COUNT(*), COUNT(DISTINCT order_id)
+        FROM payments
+        WHERE payment_timestamp >= %s AND payment_timestamp < %s + INTERVAL 1 DAY
+        GROUP BY DATE(payment_timestamp), HOUR(payment_timestamp), payment_method
+    """),
+    ("DELETE FROM customer_sales_rollup WHERE sale_date BETWEEN %s AND %s", """
+        INSERT INTO customer_sales_rollup (sale_date, customer_id, visits, amount)
+        SELECT DATE(p.payment_timestamp), o.customer_id, COUNT(DISTINCT o.order_id), SUM(p.amount)
+        FROM payments p JOIN orders o ON p.order_id = o.order_id
+        WHERE o.status = 'Pagada' AND o.customer_id IS NOT NULL
+          AND p.payment_timestamp >= %s AND p.payment_timestamp < %s + INTERVAL 1 DAY
+        GROUP BY DATE(p.payment_timestamp), o.customer_id
+    """),
+]
+
+
+def month_ranges(start, end):
+    """ Parte [start, end] en meses para no bloquear las tablas en una sola transacción larga. """
+    current = start
+    while current <= end:
+        next_month = (current.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+        yield current, min(end, next_month - datetime.timedelta(days=1))
+        current = next_month
+
+
+def rebuild_range(cursor, start, end):
+    """ Recalcula los resúmenes de [start, end] sin hacer COMMIT. """
+    for delete, insert in REBUILD_STATEMENTS:
+        cursor.execute(delete, (start, end))
+        cursor.execute(insert, (start, end))
+
+
+def rebuild(conn, start, end):
+    """ Recalcula los resúmenes de [start, end] desde las tablas crudas, un mes por transacción. """
+    cursor = conn.cursor()
+    for table in CREATE_TABLES:
+        cursor.execute(table)
+    for chunk_start, chunk_end in month_ranges(start, end):
+        rebuild_range(cursor, chunk_start, chunk_end)
+        report_cache.note_write(cursor, "sales", chunk_start)
+        report_cache.note_write(cursor, "customers", chunk_start)
+        conn.commit()
+        print(f"Resumen de ventas reconstruido: {chunk_start} a {chunk_end}")
+    # La reconstrucción suele seguir a correcciones hechas a mano: el cubo se recarga
+    analytics_cube.note_reload(cursor)
+    conn.commit()
+
+
+def history_start(cursor):
+    """ Día del primer pago registrado (hoy si aún no hay pagos). """
+    cursor.execute("SELECT DATE(MIN(payment_timestamp)) FROM payments")
+    first = cursor.fetchone()[0]
+    return first or datetime.date.today()
+
+
+if __name__ == "__main__":
+    import argparse
+    from database import db_connection
+
+    parser = argparse.ArgumentParser(description="Resúmenes de ventas para los reportes.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild_cmd = sub.add_parser("rebuild", help="Recalcula los resúmenes desde payments y order_details.")
+    rebuild_cmd.add_argument("--desde", type=datetime.date.fromisoformat)
+    rebuild_cmd.add_argument("--hasta", type=datetime.date.fromisoformat, default=datetime.date.today())
+    args = parser.parse_args()
+
+    with db_connection() as conn:
+        rebuild(conn, args.desde or history_start(conn.cursor()), args.hasta)
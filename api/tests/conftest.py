@@ -0,0 +1,6 @@
+# api/tests/conftest.py
+# Las pruebas importan los módulos de api/ igual que main.py (p. ej. `import dashboard_widgets`)
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
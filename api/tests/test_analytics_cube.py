@@ -0,0 +1,98 @@
+# api/tests/test_analytics_cube.py
+import datetime
+
+import analytics_cube
+from analytics_cube import AnalyticsCube
+
+CLOSED = datetime.datetime(2026, 1, 5, 13, 30)
+
+
+class _Db:
+    """ BBDD falsa: líneas pagadas, correcciones y versión de recarga. """
+
+    def __init__(self):
+        # (order_id, detail_id, closed_at, product_id, user_id, table_id, customer_id, método, cantidad, ingreso)
+        self.lines = [
+            (1, 10, CLOSED, 1, 5, 1, None, "Efectivo", 2, 60.0),
+            (1, 11, CLOSED, 2, 5, 1, None, "Efectivo", 1, 40.0),
+            (2, 12, CLOSED, 1, 5, 2, None, "Tarjeta", 1, 30.0),
+        ]
+        self.corrections = []
+        self.version = 0
+        self.line_loads = 0
+
+    def cancel(self, detail_id):
+        self.lines = [line for line in self.lines if line[1] != detail_id]
+        self.corrections.append((len(self.corrections) + 1, detail_id))
+
+    def cursor(self):
+        return _Cursor(self)
+
+
+class _Cursor:
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+
+    def execute(self, query, params=()):
+        db = self.db
+        if query == analytics_cube.LINES_QUERY:
+            db.line_loads += 1
+            self.rows = [line for line in db.lines if line[2] >= params[0]]
+        elif query == analytics_cube.CORRECTIONS_QUERY:
+            self.rows = [c for c in db.corrections if c[0] > params[0]]
+        elif "MAX(correction_id)" in query:
+            self.rows = [(max((c[0] for c in db.corrections), default=0),)]
+        elif "cache_versions" in query:
+            self.rows = [(db.version,)]
+        else:
+            self.rows = []
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+def _totals(cube):
+    rows = cube.query(measures=("units", "revenue", "lines", "orders"))["rows"]
+    return rows[0] if rows else None
+
+
+def test_cancelled_paid_line_is_removed_without_a_full_reload():
+    db = _Db()
+    cube = AnalyticsCube(refresh_seconds=0)
+    cube.refresh(db.cursor())
+    assert _totals(cube) == {"units": 4.0, "revenue": 130.0, "lines": 3, "orders": 2}
+
+    db.cancel(12)
+    cube.refresh(db.cursor())
+
+    assert cube.full_loads == 1
+    assert _totals(cube) == {"units": 3.0, "revenue": 100.0, "lines": 2, "orders": 1}
+
+
+def test_correction_for_a_line_never_loaded_is_ignored():
+    db = _Db()
+    db.cancel(11)
+    cube = AnalyticsCube(refresh_seconds=0)
+    cube.refresh(db.cursor())
+    cube.refresh(db.cursor())
+
+    assert _totals(cube) == {"units": 3.0, "revenue": 90.0, "lines": 2, "orders": 2}
+
+
+def test_reload_version_forces_a_full_load():
+    db = _Db()
+    cube = AnalyticsCube(refresh_seconds=0)
+    cube.refresh(db.cursor())
+    db.version += 1
+    cube.refresh(db.cursor())
+
+    assert cube.full_loads == 2
@@ -0,0 +1,44 @@
+# api/tests/test_dashboard_widgets.py
+import asyncio
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import dashboard_widgets
+from dashboard_widgets import Dashboard
+
+
+class _InlineExecutor:
+    """ Corre el cálculo al enviarlo, así el Future ya está terminado al registrar el callback. """
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+@contextmanager
+def _no_connection():
+    raise ConnectionError("No se pudo obtener una conexión a la BBDD.")
+    yield
+
+
+def test_widget_that_fails_immediately_does_not_hang(monkeypatch):
+    monkeypatch.setattr(dashboard_widgets, "_widgets", {})
+    monkeypatch.setattr(dashboard_widgets, "db_connection", _no_connection)
+    dashboard_widgets.register("roto", lambda cursor: {}, ttl=10)
+    board = Dashboard()
+    board._executor = _InlineExecutor()
+
+    result = {}
+    worker = threading.Thread(target=lambda: result.update(asyncio.run(board.bundle())), daemon=True)
+    worker.start()
+    worker.join(5)
+
+    assert not worker.is_alive(), "bundle() se bloqueó con un widget que falla al instante"
+    assert result["widgets"] == {"roto": None}
+    assert "roto" in result["errors"]
+    assert board._inflight == {}
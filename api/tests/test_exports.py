@@ -0,0 +1,53 @@
+# api/tests/test_exports.py
+import gc
+
+import exports
+
+
+class _Cursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, query, params):
+        pass
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+class _Conn:
+    def __init__(self, rows):
+        self.rows = rows
+        self.closed = False
+
+    def cursor(self, **kwargs):
+        return _Cursor(self.rows)
+
+    def close(self):
+        self.closed = True
+
+
+def test_connection_returns_to_the_pool_when_the_body_never_starts(monkeypatch):
+    conn = _Conn([{"n": i} for i in range(5)])
+    monkeypatch.setattr(exports, "get_db_connection", lambda: conn)
+
+    response = exports.export_response("SELECT", (), [("N", "n")], "csv", "prueba")
+    assert not conn.closed
+
+    # El cliente se desconectó antes de que empezara el cuerpo
+    del response
+    gc.collect()
+    assert conn.closed
+
+
+def test_background_task_closes_the_connection(monkeypatch):
+    conn = _Conn([{"n": 1}])
+    monkeypatch.setattr(exports, "get_db_connection", lambda: conn)
+
+    response = exports.export_response("SELECT", (), [("N", "n")], "ndjson", "prueba")
+    response.background.func()
+    assert conn.closed
@@ -0,0 +1,27 @@
+# api/tests/test_kds_events.py
+import datetime
+
+import kds_events
+from kds_events import KdsEventBus, publish_items_added
+
+
+def _row(detail_id, station):
+    return {
+        "order_id": 7, "order_folio": "A-7", "table_name": "M1", "is_priority": 0,
+        "created_at": datetime.datetime(2026, 1, 1, 12, 0), "status": "Abierta",
+        "detail_id": detail_id, "name": f"Producto {detail_id}", "quantity": 1, "notes": None,
+        "item_status": "Pendiente", "station": station,
+    }
+
+
+def test_items_added_with_mixed_null_and_named_stations(monkeypatch):
+    bus = KdsEventBus()
+    received = []
+    bus.add_listener(received.append)
+    monkeypatch.setattr(kds_events, "kds_bus", bus)
+
+    publish_items_added([_row(1, "Cocina"), _row(2, None), _row(3, "Barra")])
+
+    assert bus.seq == 1
+    assert received[0]["stations"] == ["Barra", "Cocina", None]
+    assert [i["detail_id"] for i in received[0]["items"]] == [1, 2, 3]
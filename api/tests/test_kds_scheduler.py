@@ -0,0 +1,36 @@
+# api/tests/test_kds_scheduler.py
+import datetime
+
+from kds_scheduler import KdsScheduler
+
+ITEMS = {
+    None: [{"detail_id": 1, "name": "Papas", "status": "Pendiente", "station": None}],
+    "Cocina": [{"detail_id": 2, "name": "Hamburguesa", "status": "Pendiente", "station": "Cocina"}],
+}
+
+
+class _Board:
+    def get_orders(self, station=None):
+        items = [dict(i) for s, group in ITEMS.items() for i in group if station is None or s == station]
+        return [{"order_id": 1, "created_at": datetime.datetime.now(), "is_priority": 0, "items": items}]
+
+    def items_by_station(self, order_id):
+        return ITEMS
+
+
+class _Estimator:
+    def refresh(self):
+        return False
+
+    def estimate(self, product, station=None):
+        return {"Papas": 100, "Hamburguesa": 300}[product]
+
+
+def test_whole_order_plan_does_not_reuse_the_null_station_plan():
+    scheduler = KdsScheduler(board=_Board(), estimator=_Estimator())
+    scheduler.get_orders("Cocina")  # planea también la comanda de productos sin estación
+
+    order = scheduler.get_orders()[0]
+
+    assert {i["detail_id"]: i["fire_in_seconds"] for i in order["items"]} == {2: 0, 1: 200}
+    assert order["schedule"]["service_seconds"] == 300
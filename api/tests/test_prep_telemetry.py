@@ -0,0 +1,17 @@
+# api/tests/test_prep_telemetry.py
+import datetime
+
+from prep_telemetry import PrepTelemetry
+
+
+def test_late_records_evict_the_oldest_slot():
+    telemetry = PrepTelemetry(slot_minutes=15, retention_hours=1)
+    base = datetime.datetime(2026, 1, 1, 12, 0)
+    for minutes in (60, 0, 15, 30, 45):
+        telemetry.record("item_total", 30, base + datetime.timedelta(minutes=minutes))
+
+    slots = list(telemetry._slots)
+    assert slots == sorted(slots)
+    assert len(slots) == 4
+    assert telemetry._slot_for(base) not in telemetry._slots
+    assert telemetry._slot_for(base + datetime.timedelta(minutes=60)) in telemetry._slots
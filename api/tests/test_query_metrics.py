@@ -0,0 +1,24 @@
+# api/tests/test_query_metrics.py
+import query_metrics
+
+
+def test_slow_request_logs_its_slowest_statements(capsys, monkeypatch):
+    monkeypatch.setattr(query_metrics, "SLOW_REQUEST_DB_SECONDS", 0.5)
+    stats = query_metrics.RequestQueryStats()
+    for i in range(query_metrics.SLOWEST_PER_REQUEST + 2):
+        stats.record(f"SELECT {i}", 0.1 * (i + 1))
+
+    query_metrics.finish_request("GET", "/api/prueba", stats)
+
+    out = capsys.readouterr().out
+    assert "GET /api/prueba" in out
+    assert "SELECT 6" in out and "SELECT 0" not in out
+
+
+def test_fast_request_is_not_logged(capsys):
+    stats = query_metrics.RequestQueryStats()
+    stats.record("SELECT 1", 0.001)
+
+    query_metrics.finish_request("GET", "/api/prueba", stats)
+
+    assert capsys.readouterr().out == ""
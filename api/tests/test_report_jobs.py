@@ -0,0 +1,41 @@
+# api/tests/test_report_jobs.py
+import gzip
+import json
+
+import report_jobs
+
+
+class _Cursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.fetched = 0
+
+    def execute(self, query, params):
+        pass
+
+    def fetchmany(self, size):
+        batch = self.rows[self.fetched:self.fetched + size]
+        self.fetched += len(batch)
+        return batch
+
+
+def test_collect_reads_batches_as_it_is_consumed():
+    cursor = _Cursor([{"n": i} for i in range(10)])
+    seen = []
+    rows = report_jobs.collect(cursor, "SELECT", (), seen.append, total=10, batch_rows=4)
+
+    assert cursor.fetched == 0
+    assert next(rows) == {"n": 0}
+    assert cursor.fetched == 4
+    assert [r["n"] for r in rows] == list(range(1, 10))
+    assert seen == [0.4, 0.8, 0.99]
+
+
+def test_rows_are_written_as_a_json_array(tmp_path):
+    path = tmp_path / "result.json.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        count = report_jobs._write_rows(f, ({"n": i} for i in range(3)))
+
+    assert count == 3
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        assert json.load(f) == [{"n": 0}, {"n": 1}, {"n": 2}]
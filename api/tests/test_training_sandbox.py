@@ -0,0 +1,72 @@
+# api/tests/test_training_sandbox.py
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from training_sandbox import TrainingEngine, TrainingSessionExpired
+
+SNAPSHOT = {
+    "products": [{"product_id": 1, "name": "Taco", "price": 30, "station": "Cocina"}],
+    "recipes": [],
+    "supplies": [],
+    "restaurant_tables": [{"table_id": 1, "table_name": "M1", "status": "Libre"}],
+}
+
+
+def _engine(sessions_dir, **kwargs):
+    engine = TrainingEngine(sessions_dir=str(sessions_dir), **kwargs)
+    engine.load_template(SNAPSHOT)
+    return engine
+
+
+def _item():
+    return SimpleNamespace(product_id=1, quantity=1, price_at_time_of_order=30, notes=None)
+
+
+def test_training_lines_get_negative_ids_routed_to_their_session(tmp_path):
+    engine = _engine(tmp_path)
+    first = engine.session_for_user(1)
+    second = engine.session_for_user(2)
+    order_a = first.create_order(1, 1, [_item(), _item()])
+    order_b = second.create_order(None, 2, [_item()])
+
+    ids = order_a["detail_ids"] + order_b["detail_ids"]
+    assert all(detail_id < 0 for detail_id in ids)
+    assert len(set(ids)) == len(ids)
+    assert engine.session_for_detail(order_a["detail_ids"][0]).user_id == 1
+    assert engine.session_for_detail(order_b["detail_ids"][0]).user_id == 2
+
+    first.cancel_item(order_a["detail_ids"][0])
+    assert [i["detail_id"] for i in first.get_order_items(order_a["order_id"])] == [order_a["detail_ids"][1]]
+
+
+def test_another_worker_finds_the_session(tmp_path):
+    # Dos motores sobre el mismo directorio hacen de dos workers de uvicorn
+    worker_a = _engine(tmp_path)
+    worker_b = TrainingEngine(sessions_dir=str(tmp_path))
+    order = worker_a.session_for_user(7).create_order(None, 7, [_item()])
+
+    session = worker_b.session_for_order(order["order_id"])
+    assert session is not None
+    session.add_items(order["order_id"], [_item()])
+    assert len(worker_a.session_for_user(7).get_order_items(order["order_id"])) == 2
+    assert worker_b.session_for_detail(order["detail_ids"][0]).user_id == 7
+
+
+def test_idle_eviction_skips_a_session_in_use(tmp_path):
+    engine = _engine(tmp_path, session_ttl=60)
+    session = engine.session_for_user(3)
+    os.utime(session.path, (0, 0))
+
+    with session._transaction():
+        engine._evict_idle()
+        assert os.path.exists(session.path)
+
+    # Terminar la operación cuenta como uso; se vuelve a dejar inactiva
+    os.utime(session.path, (0, 0))
+    engine._evict_idle()
+    assert not os.path.exists(session.path)
+    with pytest.raises(TrainingSessionExpired):
+        session.get_open_orders()
+    assert engine.session_for_order(-(3 * 10 ** 9 + 1)) is None
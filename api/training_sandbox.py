@@ -0,0 +1,384 @@
+# api/training_sandbox.py
+"""
+Motor del modo entrenamiento del POS.
+
+Antes, las operaciones con is_training_mode se ejecutaban contra MySQL de
+producción (tomando candados en supplies y restaurant_tables) y al final se
+hacía rollback. Ahora cada persona en entrenamiento trabaja sobre su propia
+copia (SQLite) del menú, recetas, stock y mesas, así que su tráfico nunca toca
+la BBDD de producción ni sus candados.
+
+La copia maestra (plantilla) se carga de MySQL con lecturas simples cada
+TRAINING_SNAPSHOT_TTL segundos; crear una sesión es copiar esa plantilla con
+la API de respaldo de SQLite, que para el tamaño de un menú toma milisegundos.
+
+Cada sesión es un archivo en TRAINING_SESSIONS_DIR (local al servidor), así
+que todos los workers de uvicorn la ven: cada operación abre el archivo, toma
+el candado de escritura de SQLite (BEGIN IMMEDIATE, que serializa entre hilos
+y procesos) y lo cierra al terminar. Las órdenes y líneas de entrenamiento
+usan ids negativos que llevan dentro el user_id (-(user_id * TRAINING_ID_SPAN
++ n)), de modo que cualquier worker sabe a qué sesión enrutar una orden o una
+cancelación sin un mapa en memoria, y nunca se confunden con las reales.
+
+Las sesiones sin uso por TRAINING_SESSION_TTL segundos se borran, pero solo
+si se obtiene su candado exclusivo: una sesión con una operación en curso no
+se toca.
+"""
+import os
+import time
+import sqlite3
+import datetime
+import tempfile
+import threading
+from contextlib import contextmanager
+
+TRAINING_SNAPSHOT_TTL = float(os.getenv("TRAINING_SNAPSHOT_TTL", "600"))
+TRAINING_SESSION_TTL = float(os.getenv("TRAINING_SESSION_TTL", "3600"))
+TRAINING_SESSIONS_DIR = os.getenv("TRAINING_SESSIONS_DIR", os.path.join(tempfile.gettempdir(), "doppler_training"))
+TRAINING_BUSY_TIMEOUT = float(os.getenv("TRAINING_BUSY_TIMEOUT", "5"))
+# Ids por persona; con user_id < 9e6 los ids siguen siendo exactos en JavaScript
+TRAINING_ID_SPAN = 10 ** 9
+
+SCHEMA = """
+    CREATE TABLE products (product_id INTEGER PRIMARY KEY, name TEXT, price REAL, station TEXT);
+    CREATE TABLE recipes (product_id INTEGER, supply_id INTEGER, quantity_used REAL);
+    CREATE INDEX idx_recipes_product ON recipes (product_id);
+    CREATE TABLE supplies (supply_id INTEGER PRIMARY KEY, name TEXT, current_stock REAL, stock_threshold REAL);
+    CREATE TABLE restaurant_tables (table_id INTEGER PRIMARY KEY, table_name TEXT, status TEXT);
+    CREATE TABLE orders (
+        order_id INTEGER PRIMARY KEY, order_folio TEXT, table_id INTEGER, user_id INTEGER,
+        status TEXT, created_at TEXT, closed_at TEXT, is_training_mode INTEGER DEFAULT 1
+    );
+    CREATE TABLE order_details (
+        detail_id INTEGER PRIMARY KEY, order_id INTEGER, product_id INTEGER,
+        quantity INTEGER, price_at_time_of_order REAL, notes TEXT, status TEXT DEFAULT 'Pendiente'
+    );
+    CREATE TABLE payments (payment_id INTEGER PRIMARY KEY AUTOINCREMENT, order_id INTEGER, payment_method TEXT, amount REAL);
+    CREATE TABLE stock_movements (supply_id INTEGER, order_id INTEGER, movement_type TEXT, quantity_change REAL);
+    CREATE TABLE alerts (alert_id INTEGER PRIMARY KEY AUTOINCREMENT, alert_type TEXT, message TEXT);
+    CREATE TABLE id_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+    INSERT INTO id_counters (name, value) VALUES ('order', 0), ('detail', 0);
+"""
+
+SNAPSHOT_QUERIES = {
+    "products": "SELECT product_id, name, price, station FROM products",
+    "recipes": "SELECT product_id, supply_id, quantity_used FROM recipes",
+    "supplies": "SELECT supply_id, name, current_stock, stock_threshold FROM supplies",
+    "restaurant_tables": "SELECT table_id, table_name, status FROM restaurant_tables",
+}
+
+
+class TrainingStockError(Exception):
+    """ Stock insuficiente dentro de la sesión de entrenamiento. """
+
+    def __init__(self, shortfalls):
+        super().__init__("Stock insuficiente")
+        self.shortfalls = shortfalls
+
+
+class TrainingSessionExpired(KeyError):
+    """ La sesión se borró (reinicio o inactividad) antes o durante la operación. """
+
+
+def _to_sqlite(value):
+    # sqlite3 no acepta Decimal; el resto de tipos de MySQL pasan tal cual
+    if value is not None and type(value).__name__ == "Decimal":
+        return float(value)
+    return value
+
+
+def _dict_factory(cursor, row):
+    return {col[0]: row[i] for i, col in enumerate(cursor.description)}
+
+
+def training_user_for_id(training_id):
+    """ user_id dueño de un order_id o detail_id de entrenamiento (negativo). """
+    return -training_id // TRAINING_ID_SPAN
+
+
+class TrainingSession:
+    """ Copia privada de la operación del POS para una persona en entrenamiento. """
+
+    def __init__(self, user_id, path):
+        self.user_id = user_id
+        self.path = path
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Abre el archivo de la sesión con el candado de escritura tomado y hace
+        COMMIT al salir sin error. Lanza TrainingSessionExpired si el archivo
+        ya no existe o se borró mientras se esperaba el candado.
+        """
+        try:
+            inode = os.stat(self.path).st_ino
+            conn = sqlite3.connect(f"file:{self.path}?mode=rw", uri=True,
+                                   timeout=TRAINING_BUSY_TIMEOUT, isolation_level=None)
+        except (OSError, sqlite3.OperationalError):
+            raise TrainingSessionExpired(self.user_id)
+        conn.row_factory = _dict_factory
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if os.stat(self.path).st_ino != inode:
+                    raise TrainingSessionExpired(self.user_id)
+            except FileNotFoundError:
+                raise TrainingSessionExpired(self.user_id)
+            yield conn
+            conn.execute("COMMIT")
+        finally:
+            # Sin COMMIT, cerrar la conexión descarta la transacción
+            conn.close()
+        _touch(self.path)
+
+    def _next_id(self, conn, name):
+        conn.execute("UPDATE id_counters SET value = value + 1 WHERE name = ?", (name,))
+        n = conn.execute("SELECT value FROM id_counters WHERE name = ?", (name,)).fetchone()['value']
+        return -(self.user_id * TRAINING_ID_SPAN + n)
+
+    def create_order(self, table_id, user_id, items=()):
+        with self._transaction() as conn:
+            if table_id:
+                conn.execute("UPDATE restaurant_tables SET status = 'Ocupada' WHERE table_id = ?", (table_id,))
+            order_id = self._next_id(conn, "order")
+            now = datetime.datetime.now().isoformat(sep=" ", timespec="seconds")
+            conn.execute(
+                "INSERT INTO orders (order_id, order_folio, table_id, user_id, status, created_at) VALUES (?, ?, ?, ?, 'Abierta', ?)",
+                (order_id, f"TRN{order_id}", table_id, user_id, now)
+            )
+            detail_ids = self._insert_items(conn, order_id, items) if items else []
+            order = conn.execute("SELECT * FROM orders WHERE order_id = ?", (order_id,)).fetchone()
+        order["detail_ids"] = detail_ids
+        return order
+
+    def add_items(self, order_id, items):
+        with self._transaction() as conn:
+            return self._insert_items(conn, order_id, items)
+
+    def _insert_items(self, conn, order_id, items):
+        """ Mismo flujo que el POS real: stock de la lista de materiales combinada y luego las líneas. """
+        bom = {}
+        for item in items:
+            rows = conn.execute("SELECT supply_id, quantity_used FROM recipes WHERE product_id = ?", (item.product_id,))
+            for row in rows:
+                bom[row['supply_id']] = bom.get(row['supply_id'], 0) + row['quantity_used'] * item.quantity
+        shortfalls = []
+        for supply_id in sorted(bom):
+            supply = conn.execute("SELECT name, current_stock FROM supplies WHERE supply_id = ?", (supply_id,)).fetchone()
+            if not supply or supply['current_stock'] < bom[supply_id]:
+                shortfalls.append({
+                    "supply_id": supply_id,
+                    "name": supply['name'] if supply else "Ingrediente desconocido",
+                    "available": supply['current_stock'] if supply else 0,
+                    "required": bom[supply_id],
+                })
+        if shortfalls:
+            raise TrainingStockError(shortfalls)
+
+        detail_ids = []
+        for item in items:
+            detail_id = self._next_id(conn, "detail")
+            conn.execute(
+                "INSERT INTO order_details (detail_id, order_id, product_id, quantity, price_at_time_of_order, notes) VALUES (?, ?, ?, ?, ?, ?)",
+                (detail_id, order_id, item.product_id, item.quantity, item.price_at_time_of_order, item.notes)
+            )
+            detail_ids.append(detail_id)
+        return detail_ids
+
+    def cancel_item(self, detail_id):
+        """ Quita una línea de la sesión. Lanza KeyError si no existe. """
+        with self._transaction() as conn:
+            cur = conn.execute("DELETE FROM order_details WHERE detail_id = ?", (detail_id,))
+            if cur.rowcount == 0:
+                raise KeyError(detail_id)
+
+    def close_order(self, order_id, payment_method, amount):
+        with self._transaction() as conn:
+            order = conn.execute("SELECT table_id, user_id FROM orders WHERE order_id = ?", (order_id,)).fetchone()
+            if not order:
+                raise KeyError(order_id)
+            bom = conn.execute("""
+                SELECT r.supply_id, SUM(r.quantity_used * od.quantity) AS quantity
+                FROM order_details od JOIN recipes r ON r.product_id = od.product_id
+                WHERE od.order_id = ? GROUP BY r.supply_id
+            """, (order_id,)).fetchall()
+            for row in bom:
+                conn.execute("UPDATE supplies SET current_stock = current_stock - ? WHERE supply_id = ?",
+                             (row['quantity'], row['supply_id']))
+                conn.execute("INSERT INTO stock_movements (supply_id, order_id, movement_type, quantity_change) VALUES (?, ?, 'Venta', ?)",
+                             (row['supply_id'], order_id, -row['quantity']))
+            low = conn.execute(
+                f"SELECT name, current_stock FROM supplies WHERE current_stock <= stock_threshold AND supply_id IN ({','.join('?' * len(bom))})",
+                [row['supply_id'] for row in bom]
+            ).fetchall() if bom else []
+            for supply in low:
+                conn.execute("INSERT INTO alerts (alert_type, message) VALUES ('stock', ?)",
+                             (f"Stock bajo para {supply['name']}: {supply['current_stock']} restantes.",))
+            conn.execute("INSERT INTO payments (order_id, payment_method, amount) VALUES (?, ?, ?)",
+                         (order_id, payment_method, amount))
+            now = datetime.datetime.now().isoformat(sep=" ", timespec="seconds")
+            conn.execute("UPDATE orders SET status = 'Pagada', closed_at = ? WHERE order_id = ?", (now, order_id))
+            if order['table_id']:
+                conn.execute("UPDATE restaurant_tables SET status = 'Libre' WHERE table_id = ?", (order['table_id'],))
+
+    def get_order_items(self, order_id):
+        with self._transaction() as conn:
+            return conn.execute("""
+                SELECT od.*, p.name, p.price FROM order_details od
+                JOIN products p ON od.product_id = p.product_id WHERE od.order_id = ?
+            """, (order_id,)).fetchall()
+
+    def get_open_orders(self):
+        with self._transaction() as conn:
+            return conn.execute("""
+                SELECT o.order_id, o.order_folio, o.created_at, o.status,
+                       IFNULL(t.table_name, 'Para Llevar') as table_name
+                FROM orders o LEFT JOIN restaurant_tables t ON o.table_id = t.table_id
+                WHERE o.status IN ('Abierta', 'Lista') ORDER BY o.created_at ASC
+            """).fetchall()
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+class TrainingEngine:
+
+    def __init__(self, snapshot_ttl=TRAINING_SNAPSHOT_TTL, session_ttl=TRAINING_SESSION_TTL,
+                 sessions_dir=TRAINING_SESSIONS_DIR):
+        self.snapshot_ttl = snapshot_ttl
+        self.session_ttl = session_ttl
+        self.sessions_dir = sessions_dir
+        self._template = None
+        self._template_loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    # --- Plantilla ---
+    def template_is_stale(self):
+        return self._template is None or time.monotonic() - self._template_loaded_at > self.snapshot_ttl
+
+    def load_template(self, snapshot):
+        """ Construye la plantilla SQLite a partir de {tabla: filas} leídas de MySQL. """
+        template = sqlite3.connect(":memory:", check_same_thread=False)
+        template.executescript(SCHEMA)
+        for table, rows in snapshot.items():
+            if not rows:
+                continue
+            columns = list(rows[0].keys())
+            template.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [tuple(_to_sqlite(row[c]) for c in columns) for row in rows]
+            )
+        template.commit()
+        with self._lock:
+            old, self._template = self._template, template
+            self._template_loaded_at = time.monotonic()
+        if old is not None:
+            old.close()
+
+    async def ensure_template_async(self, cursor):
+        """ Recarga la plantilla con el cursor asíncrono (diccionario) si venció. """
+        if not self.template_is_stale():
+            return
+        snapshot = {}
+        for table, query in SNAPSHOT_QUERIES.items():
+            await cursor.execute(query)
+            snapshot[table] = await cursor.fetchall()
+        self.load_template(snapshot)
+
+    # --- Sesiones ---
+    def _path(self, user_id):
+        return os.path.join(self.sessions_dir, f"session_{user_id}.sqlite3")
+
+    def session_for_user(self, user_id):
+        """ Sesión de la persona; se crea copiando la plantilla si no existe. """
+        self._evict_idle()
+        path = self._path(user_id)
+        if not os.path.exists(path):
+            os.makedirs(self.sessions_dir, exist_ok=True)
+            # Se copia a un archivo temporal y se enlaza: si otro worker la creó
+            # al mismo tiempo, gana el primero y nadie pisa una sesión con datos.
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            conn = sqlite3.connect(tmp)
+            try:
+                with self._lock:
+                    self._template.backup(conn)
+            finally:
+                conn.close()
+            try:
+                os.link(tmp, path)
+            except FileExistsError:
+                pass
+            finally:
+                os.unlink(tmp)
+        _touch(path)
+        return TrainingSession(user_id, path)
+
+    def _session_for_id(self, training_id):
+        user_id = training_user_for_id(training_id)
+        path = self._path(user_id)
+        if training_id >= 0 or not os.path.exists(path):
+            return None
+        _touch(path)
+        return TrainingSession(user_id, path)
+
+    def session_for_order(self, order_id):
+        return self._session_for_id(order_id)
+
+    def session_for_detail(self, detail_id):
+        return self._session_for_id(detail_id)
+
+    def reset_session(self, user_id):
+        """ Borra la sesión, esperando a que termine la operación en curso. """
+        return self._remove(self._path(user_id), TRAINING_BUSY_TIMEOUT)
+
+    def _remove(self, path, timeout, idle_for=None):
+        """
+        Borra el archivo de la sesión con su candado exclusivo tomado, así no
+        desaparece a media operación. Con `idle_for`, solo si sigue sin uso.
+        """
+        try:
+            conn = sqlite3.connect(f"file:{path}?mode=rw", uri=True, timeout=timeout, isolation_level=None)
+        except sqlite3.OperationalError:
+            return False
+        try:
+            conn.execute("BEGIN EXCLUSIVE")
+            if idle_for is not None and time.time() - os.stat(path).st_mtime <= idle_for:
+                return False
+            os.unlink(path)
+            return True
+        except (sqlite3.OperationalError, FileNotFoundError):
+            # Ocupada por otra operación, o ya la borró otro worker
+            return False
+        finally:
+            conn.close()
+
+    def _session_files(self):
+        try:
+            names = os.listdir(self.sessions_dir)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.sessions_dir, n) for n in names if n.startswith("session_") and n.endswith(".sqlite3")]
+
+    def _evict_idle(self):
+        now = time.time()
+        for path in self._session_files():
+            try:
+                idle = now - os.stat(path).st_mtime > self.session_ttl
+            except FileNotFoundError:
+                continue
+            if idle:
+                self._remove(path, timeout=0, idle_for=self.session_ttl)
+
+    def stats(self):
+        return {
+            "sessions": len(self._session_files()),
+            "sessions_dir": self.sessions_dir,
+            "template_age_seconds": round(time.monotonic() - self._template_loaded_at, 1) if self._template else None,
+        }
+
+
+training_engine = TrainingEngine()
@@ -1,10 +1,49 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import './App.css';
 import KdsLogin from './KdsLogin';
 import ChatBarra from './ChatBarra';
 
 // --- CONFIGURACIÓN DE LA ESTACIÓN ---
 const KDS_STATION = 'Barra'; // Cambia a 'Cocina' para otra estación
+const API_URL = 'http://127.0.0.1:8000';
+
+// --- Aplicación de eventos del stream sobre la lista de órdenes ---
+const sortOrders = (orders) =>
+  [...orders].sort((a, b) => (b.is_priority || 0) - (a.is_priority || 0));
+
+const applyEvent = (orders, event) => {
+  switch (event.type) {
+    case 'items_added': {
+      const items = event.items.filter(item => item.station === KDS_STATION);
+      if (items.length === 0) return orders;
+      const existing = orders.find(o => o.order_id === event.order_id);
+      if (!existing) {
+        const { order_folio, table_name, is_priority, created_at } = event;
+        return sortOrders([...orders, { order_id: event.order_id, order_folio, table_name, is_priority, created_at, items }]);
+      }
+      const known = new Set(existing.items.map(i => i.detail_id));
+      return orders.map(o => o.order_id === event.order_id
+        ? { ...o, items: [...o.items, ...items.filter(i => !known.has(i.detail_id))] }
+        : o);
+    }
+    case 'item_status':
+      return orders.map(o => o.order_id === event.order_id
+        ? { ...o, items: o.items.map(i => i.detail_id === event.detail_id ? { ...i, status: event.status } : i) }
+        : o);
+    case 'item_removed':
+      return orders
+        .map(o => o.order_id === event.order_id ? { ...o, items: o.items.filter(i => i.detail_id !== event.detail_id) } : o)
+        .filter(o => o.items.length > 0);
+    case 'order_removed':
+      return orders.filter(o => o.order_id !== event.order_id);
+    case 'order_priority':
+      return sortOrders(orders.map(o => o.order_id === event.order_id ? { ...o, is_priority: event.is_priority } : o));
+    default:
+      return orders;
+  }
+};
+
+const EVENT_TYPES = ['items_added', 'item_status', 'item_removed', 'order_removed', 'order_priority'];
 
 function App() {
   const [user, setUser] = useState(null);
@@ -31,18 +70,24 @@ function App() {
   // --- Función para cargar órdenes según estación ---
   const fetchOrders = () => {
     const token = localStorage.getItem('token');
-    fetch(`http://127.0.0.1:8000/api/kds/orders?station=${KDS_STATION}`, {
+    return fetch(`${API_URL}/api/kds/orders?station=${KDS_STATION}`, {
       headers: { Authorization: `Bearer ${token}` },
     })
       .then(res => res.json())
-      .then(data => setOrders(Array.isArray(data) ? data : []))
-      .catch(err => console.error("Error al cargar las órdenes:", err));
+      .then(data => (Array.isArray(data) ? data : []).map(order => ({
+        ...order,
+        items: typeof order.items === 'string' ? JSON.parse(order.items) : (order.items || []),
+      })))
+      .catch(err => {
+        console.error("Error al cargar las órdenes:", err);
+        return null;
+      });
   };
 
   // --- Función para cargar resumen según estación ---
   const fetchSummary = () => {
     const token = localStorage.getItem('token');
-    fetch(`http://127.0.0.1:8000/api/kds/summary?station=${KDS_STATION}`, {
+    fetch(`${API_URL}/api/kds/summary?station=${KDS_STATION}`, {
       headers: { Authorization: `Bearer ${token}` },
     })
       .then(res => res.json())
@@ -50,27 +95,62 @@ function App() {
       .catch(err => console.error("Error al cargar el resumen:", err));
   };
 
-  // --- Cargar datos ---
-  const fetchData = () => {
-    if (user) {
-      fetchOrders();
+  // El resumen se recarga como mucho una vez por segundo aunque lleguen muchos eventos
+  const summaryTimer = useRef(null);
+  const scheduleSummary = () => {
+    if (summaryTimer.current) return;
+    summaryTimer.current = setTimeout(() => {
+      summaryTimer.current = null;
       fetchSummary();
-    }
+    }, 1000);
   };
 
+  // --- Stream de cambios (Server-Sent Events) ---
+  // Reemplaza el sondeo cada 5 s: la API envía solo los cambios y el navegador
+  // se reconecta solo, mandando Last-Event-ID para recibir lo que se perdió.
+  // Ante un "resync" se recarga la lista completa; los eventos que llegan
+  // mientras tanto se guardan y se aplican encima.
   useEffect(() => {
-    if (user) {
-      fetchData();
-      const interval = setInterval(fetchData, 5000);
-      return () => clearInterval(interval);
-    }
+    if (!user) return;
+    let pending = null;
+    const source = new EventSource(`${API_URL}/api/kds/stream?station=${KDS_STATION}`);
+
+    const handleEvent = (message) => {
+      const event = JSON.parse(message.data);
+      if (pending) {
+        pending.push(event);
+      } else {
+        setOrders(current => applyEvent(current, event));
+      }
+      scheduleSummary();
+    };
+
+    const handleResync = () => {
+      pending = [];
+      fetchOrders().then(data => {
+        const buffered = pending || [];
+        pending = null;
+        setOrders(current => buffered.reduce(applyEvent, data ?? current));
+      });
+      fetchSummary();
+    };
+
+    EVENT_TYPES.forEach(type => source.addEventListener(type, handleEvent));
+    source.addEventListener('resync', handleResync);
+    source.onerror = () => console.warn("Stream del KDS desconectado, reintentando...");
+
+    return () => {
+      source.close();
+      clearTimeout(summaryTimer.current);
+      summaryTimer.current = null;
+    };
   }, [user]);
 
   // --- Marcar orden como lista ---
   const handleOrderReady = async (orderId) => {
     const token = localStorage.getItem('token');
     try {
-      const response = await fetch(`http://127.0.0.1:8000/api/kds/orders/${orderId}/ready`, {
+      const response = await fetch(`${API_URL}/api/kds/orders/${orderId}/ready`, {
         method: 'POST',
         headers: { Authorization: `Bearer ${token}` },
       });
@@ -79,7 +159,6 @@ function App() {
         throw new Error(errorData.detail || 'Respuesta no exitosa del servidor.');
       }
       console.log(`Orden ${orderId} marcada como lista.`);
-      fetchData();
     } catch (error) {
       console.error("Error al marcar la orden como lista:", error);
       alert(`No se pudo marcar la orden como lista: ${error.message}`);
@@ -90,12 +169,11 @@ function App() {
   const handleItemClick = async (item) => {
     const token = localStorage.getItem('token');
     try {
-      const response = await fetch(`http://127.0.0.1:8000/api/kds/items/${item.id}/toggle`, {
+      const response = await fetch(`${API_URL}/api/kds/items/${item.id}/toggle`, {
         method: 'POST',
         headers: { Authorization: `Bearer ${token}` },
       });
       if (!response.ok) throw new Error('Error al actualizar item.');
-      fetchData();
     } catch (error) {
       console.error("Error al actualizar el item:", error);
       alert(`No se pudo actualizar el item: ${error.message}`);
@@ -132,7 +210,7 @@ function App() {
               <h3>{order.table_name}</h3>
               <h4>{order.order_folio}</h4>
               <ul>
-                {JSON.parse(order.items || '[]').map((item, index) => (
+                {order.items.map((item, index) => (
                   <li
                     key={index}
                     className={`item-status-${item.status.toLowerCase().replace(' ', '-')}`}